@@ -0,0 +1,355 @@
+# =======================================================================
+# ARQUIVO: agregacao.py (PROCESSAMENTO EM BLOCOS PARA PERÍODOS LONGOS)
+# =======================================================================
+# Para períodos de vários anos, a avaliação não monta a tabela de posições
+# inteira: o histórico é percorrido mês a mês (geradores) e cada bloco
+# avaliado alimenta agregados parciais (contagens, somas e somas dos
+# quadrados). Só o bloco corrente fica em memória. Os agregados se combinam
+# entre si, então blocos podem ser processados em qualquer ordem.
+
+import numpy as np
+import pandas as pd
+
+from avaliacao import (
+    grade_posicoes, valores_longos, contar_auditoria, _por_valores_distintos,
+    textos, classes_rtm, linhas_a_incorporar, PONTOS, STATUS_VAZIO
+)
+
+# --- GERADORES ---
+
+def blocos_por_periodo(df_completo, inicio=None, fim=None, bancada=None, unidade="M"):
+    """Gera as linhas de ensaio do período em blocos de datas (unidade numpy: 'M' mês, 'W' semana, 'D' dia).
+
+    Só os números das linhas de cada bloco são calculados de antemão; cada bloco é recortado de
+    df_completo na hora em que é consumido, na ordem original das linhas.
+    """
+    if df_completo.empty:
+        return
+    datas = df_completo["Data_dt"]
+    mascara = datas.notna()
+    if inicio is not None:
+        mascara &= datas >= pd.Timestamp(inicio)
+    if fim is not None:
+        mascara &= datas < pd.Timestamp(fim) + pd.Timedelta(days=1)
+    if bancada is not None:
+        mascara &= df_completo["Bancada_Nome"] == bancada
+    linhas = np.flatnonzero(mascara.to_numpy())
+    if len(linhas) == 0:
+        return
+    periodos = datas.to_numpy()[linhas].astype(f"datetime64[{unidade}]")
+    ordem = np.argsort(periodos, kind="stable")
+    linhas, periodos = linhas[ordem], periodos[ordem]
+    cortes = np.flatnonzero(periodos[1:] != periodos[:-1]) + 1
+    for grupo in np.split(linhas, cortes):
+        yield df_completo.iloc[grupo]
+
+def blocos_de_posicoes(tabela, blocos_posicoes):
+    """(bloco, posições) a partir de recortes da tabela de posições já avaliada: as linhas de ensaio de cada
+    recorte saem da coluna 'linha' de 'tabela', sem reavaliar nada."""
+    for posicoes in blocos_posicoes:
+        yield tabela.loc[pd.unique(posicoes["linha"])], posicoes
+
+def consumir(blocos_avaliados, *agregadores):
+    """Alimenta todos os agregadores numa única passada pelos blocos e devolve os resultados."""
+    for bloco, posicoes in blocos_avaliados:
+        for agregador in agregadores:
+            agregador.adicionar(bloco, posicoes)
+    return [agregador.resultado() for agregador in agregadores]
+
+# --- LEITURAS COM A CONVERSÃO DA METROLOGIA ---
+
+def _valor_metrologia_distintos(s):
+    txt = s.astype(str).str.replace("%", "", regex=False).str.replace(" ", "", regex=False)
+    txt = txt.str.replace(",", ".", regex=False).str.strip()
+    val = pd.to_numeric(txt.mask(txt.isin(["", "-", "None"])), errors="coerce").astype(float)
+    return val.where(val.abs() <= 100, val / 1000)
+
+def valores_metrologia(col):
+    """Versão vetorizada de valor_num_metrologia (remove %, espaços e vírgula; |v| > 100 é dividido por 1000)."""
+    return _por_valores_distintos(col, _valor_metrologia_distintos, np.nan).astype(float)
+
+def leituras_metrologia(bloco):
+    """Leituras CN/CP/CI do bloco em formato longo (linha, Data_dt, Bancada, pos, ponto, valor), só as preenchidas."""
+    linhas, pos = grade_posicoes(bloco)
+    bancadas = bloco["Bancada_Nome"].to_numpy()[linhas]
+    indice, datas = bloco.index.to_numpy()[linhas], bloco["Data_dt"].to_numpy()[linhas]
+    partes = []
+    for ponto in PONTOS:
+        valores = valores_metrologia(pd.Series(valores_longos(bloco, ponto, linhas, pos))).to_numpy()
+        ok = ~np.isnan(valores)
+        partes.append(pd.DataFrame({
+            "linha": indice[ok], "Data_dt": datas[ok], "Bancada": bancadas[ok], "pos": pos[ok],
+            "ponto": ponto, "valor": valores[ok]
+        }))
+    return pd.concat(partes, ignore_index=True)
+
+def posicoes_metrologia(bloco, limites_classe, com_linha=False):
+    """Tabela da metrologia (uma linha por posição, como processar_metrologia_isolada) montada por colunas.
+
+    limite_rtm vem de limites_classe pela classe RTM (1/2/A-D). Status, correção e incerteza ficam para
+    avaliar_conformidade. com_linha=True acrescenta a coluna 'linha' (índice da linha de origem no bloco).
+    """
+    ordem = np.argsort(bloco["Data_dt"].to_numpy(), kind="stable")
+    bloco = bloco.iloc[ordem]
+    linhas, pos = grade_posicoes(bloco)
+    classes = bloco["Classe"] if "Classe" in bloco.columns else pd.Series("", index=bloco.index)
+    tabela = pd.DataFrame({
+        "n_ensaio": bloco["N_ENSAIO"].to_numpy()[linhas] if "N_ENSAIO" in bloco.columns else "N/A",
+        "pos": pos,
+        "serie": textos(pd.Series(valores_longos(bloco, "Série", linhas, pos))).to_numpy(),
+        "classe": classes.astype(str).str.upper().to_numpy()[linhas],
+    })
+    for ponto in PONTOS:
+        tabela[ponto.lower()] = valores_metrologia(pd.Series(valores_longos(bloco, ponto, linhas, pos))).to_numpy()
+    tabela["limite_rtm"] = classes_rtm(classes).map(limites_classe).to_numpy(dtype=float)[linhas]
+    tabela["Data"] = bloco["Data_dt"].to_numpy()[linhas]
+    tabela["Bancada"] = bloco["Bancada_Nome"].to_numpy()[linhas]
+    if com_linha:
+        tabela["linha"] = bloco.index.to_numpy()[linhas]
+    return tabela
+
+# --- AGREGADOS PARCIAIS ---
+
+class ContagemAuditoria:
+    """Contagens de calcular_auditoria_real acumuladas bloco a bloco."""
+
+    CAMPOS = ["total_posicoes", "total_ensaiadas", "total_aprovadas", "total_reprovadas",
+              "reprov_exatidao", "reprov_registrador", "reprov_mv", "reprov_consumidor"]
+
+    def __init__(self):
+        self.contagens = dict.fromkeys(self.CAMPOS, 0)
+
+    def adicionar(self, bloco, posicoes):
+        parcial = contar_auditoria(posicoes)
+        for campo in self.CAMPOS:
+            self.contagens[campo] += parcial[campo]
+
+    def combinar(self, outro):
+        for campo in self.CAMPOS:
+            self.contagens[campo] += outro.contagens[campo]
+        return self
+
+    def resultado(self):
+        c = dict(self.contagens)
+        c["taxa_aprovacao"] = (c["total_aprovadas"] / c["total_ensaiadas"] * 100) if c["total_ensaiadas"] > 0 else 0
+        return c
+
+class MapaCalorExatidao:
+    """Reprovações por exatidão por (posição, ponto) e a lista detalhada, como em pagina_analise_posicoes."""
+
+    def __init__(self):
+        self.matriz = np.zeros((20, len(PONTOS)), dtype=np.int64)
+        self.detalhes = []
+
+    def adicionar(self, bloco, posicoes):
+        reprov = posicoes[(posicoes["status"] == "REPROVADO") & posicoes["erro_exatidao"]]
+        if reprov.empty:
+            return
+        partes = []
+        for ordem, ponto in enumerate(PONTOS):
+            com_erro = reprov[reprov[f"erro_{ponto.lower()}"]]
+            np.add.at(self.matriz[:, ordem], com_erro["pos"].to_numpy() - 1, 1)
+            partes.append(pd.DataFrame({
+                "linha": com_erro["linha"].to_numpy(), "ordem": ordem,
+                "Data": com_erro["Data"].to_numpy(), "Ensaio #": com_erro["N_ENSAIO"].to_numpy(),
+                "Posição": com_erro["pos"].to_numpy(), "Série": com_erro["serie"].to_numpy(),
+                "Ponto do Erro": ponto, "Valor CN": com_erro["cn"].to_numpy(),
+                "Valor CP": com_erro["cp"].to_numpy(), "Valor CI": com_erro["ci"].to_numpy(),
+            }))
+        lista = pd.concat(partes, ignore_index=True).sort_values(["linha", "Posição", "ordem"], kind="stable")
+        self.detalhes.append(lista.drop(columns=["linha", "ordem"]))
+
+    def combinar(self, outro):
+        self.matriz += outro.matriz
+        self.detalhes.extend(outro.detalhes)
+        return self
+
+    def resultado(self):
+        """Matriz só com as posições que tiveram reprovação (mesmo formato do pivot_table original)."""
+        com_falha = self.matriz.sum(axis=1) > 0
+        matriz = pd.DataFrame(self.matriz[com_falha], columns=PONTOS,
+                              index=pd.Index(np.flatnonzero(com_falha) + 1, name="Posição"))
+        detalhes = pd.concat(self.detalhes, ignore_index=True) if self.detalhes else pd.DataFrame()
+        return matriz, detalhes
+
+class MomentosDispersao:
+    """Média e desvio padrão por (Bancada, ponto) a partir de n, soma e soma dos quadrados."""
+
+    def __init__(self):
+        self.momentos = pd.DataFrame(columns=["n", "soma", "soma_q"], dtype=float)
+
+    def adicionar(self, bloco, posicoes):
+        leituras = leituras_metrologia(bloco)
+        if leituras.empty:
+            return
+        parcial = leituras.assign(soma_q=leituras["valor"] ** 2).groupby(["Bancada", "ponto"]).agg(
+            n=("valor", "size"), soma=("valor", "sum"), soma_q=("soma_q", "sum"))
+        self.momentos = parcial if self.momentos.empty else self.momentos.add(parcial, fill_value=0)
+
+    def combinar(self, outro):
+        if not outro.momentos.empty:
+            self.momentos = outro.momentos if self.momentos.empty else self.momentos.add(outro.momentos, fill_value=0)
+        return self
+
+    def resultado(self):
+        m = self.momentos
+        if m.empty:
+            return pd.DataFrame(columns=["n", "media", "desvio"])
+        media = m["soma"] / m["n"]
+        variancia = (m["soma_q"] - m["n"] * media ** 2) / (m["n"] - 1)
+        return pd.DataFrame({
+            "n": m["n"].astype(int), "media": media, "desvio": np.sqrt(variancia.clip(lower=0))
+        })
+
+class MatrizBancadas:
+    """Somas por (Bancada, pos, ponto, mês, classe): leituras, soma, soma dos quadrados e reprovações do ponto.
+
+    As leituras usam a conversão da metrologia (valores_metrologia); as reprovações, a avaliação do ensaio.
+    Qualquer recorte de meses e classes sai somando linhas desta matriz, sem reavaliar ensaios.
+    """
+
+    CHAVE = ["Bancada", "pos", "ponto", "mes", "classe"]
+
+    def __init__(self):
+        self.matriz = None
+
+    def adicionar(self, bloco, posicoes):
+        ensaiadas = posicoes[posicoes["status"] != STATUS_VAZIO]
+        if ensaiadas.empty:
+            return
+        base = {
+            "Bancada": ensaiadas["Bancada_Nome"].to_numpy(), "pos": ensaiadas["pos"].to_numpy(),
+            "mes": ensaiadas["Data_dt"].to_numpy().astype("datetime64[M]"), "classe": ensaiadas["classe_rtm"].to_numpy(),
+        }
+        partes = []
+        for ponto in PONTOS:
+            valores = valores_metrologia(ensaiadas[ponto.lower()]).to_numpy()
+            medido = ~np.isnan(valores)
+            zerados = np.where(medido, valores, 0.0)
+            partes.append(pd.DataFrame({**base, "ponto": ponto, "n": medido.astype(np.int64), "soma": zerados,
+                                        "soma_q": zerados ** 2,
+                                        "reprovacoes": ensaiadas[f"erro_{ponto.lower()}"].to_numpy().astype(np.int64)}))
+        parcial = pd.concat(partes, ignore_index=True).groupby(self.CHAVE).sum()
+        self.matriz = parcial if self.matriz is None else self.matriz.add(parcial, fill_value=0)
+
+    def combinar(self, outro):
+        if outro.matriz is not None:
+            self.matriz = outro.matriz if self.matriz is None else self.matriz.add(outro.matriz, fill_value=0)
+        return self
+
+    def resultado(self):
+        if self.matriz is None:
+            vazio = pd.MultiIndex.from_tuples([], names=self.CHAVE)
+            return pd.DataFrame(columns=["n", "soma", "soma_q", "reprovacoes"], index=vazio)
+        m = self.matriz.copy()
+        m[["n", "reprovacoes"]] = m[["n", "reprovacoes"]].astype(np.int64)
+        return m
+
+# --- ERRO x TEMPERATURA ---
+
+# Bordas das faixas de temperatura (°C); a faixa de 21 a 25 °C contém a referência de 23 °C
+BORDAS_TEMPERATURA = [18.0, 21.0, 25.0, 28.0, 31.0]
+FAIXAS_TEMPERATURA = ["< 18 °C", "18–21 °C", "21–25 °C", "25–28 °C", "28–31 °C", "≥ 31 °C"]
+
+def faixas_temperatura(temperaturas):
+    """Código da faixa (índice em FAIXAS_TEMPERATURA) de cada temperatura; -1 quando não há temperatura."""
+    valores = np.asarray(temperaturas, dtype=float)
+    codigos = np.searchsorted(BORDAS_TEMPERATURA, valores, side="right")
+    return np.where(np.isnan(valores), -1, codigos)
+
+class ErroPorTemperatura:
+    """Somas por (Bancada, pos, ponto, faixa de temperatura): leituras, soma, soma dos quadrados e reprovações.
+
+    Mesma conversão e mesmas reprovações de MatrizBancadas; ensaios sem temperatura ficam de fora. Cada bloco
+    entra com um único groupby sobre as leituras dos três pontos.
+    """
+
+    CHAVE = ["Bancada", "pos", "ponto", "faixa"]
+
+    def __init__(self):
+        self.matriz = None
+
+    def adicionar(self, bloco, posicoes):
+        faixas = faixas_temperatura(posicoes["temperatura_c"])
+        ensaiadas = (posicoes["status"] != STATUS_VAZIO).to_numpy() & (faixas >= 0)
+        if not ensaiadas.any():
+            return
+        tab, faixas = posicoes[ensaiadas], faixas[ensaiadas]
+        valores = np.stack([valores_metrologia(tab[ponto.lower()]).to_numpy() for ponto in PONTOS])
+        medido = ~np.isnan(valores)
+        zerados = np.where(medido, valores, 0.0)
+        n_linhas = len(tab)
+        parcial = pd.DataFrame({
+            "Bancada": np.tile(tab["Bancada_Nome"].to_numpy(), len(PONTOS)),
+            "pos": np.tile(tab["pos"].to_numpy(), len(PONTOS)),
+            "ponto": np.repeat(PONTOS, n_linhas),
+            "faixa": np.tile(faixas, len(PONTOS)),
+            "n": medido.ravel().astype(np.int64), "soma": zerados.ravel(), "soma_q": zerados.ravel() ** 2,
+            "reprovacoes": np.concatenate([tab[f"erro_{p.lower()}"].to_numpy() for p in PONTOS]).astype(np.int64),
+        }).groupby(self.CHAVE).sum()
+        self.matriz = parcial if self.matriz is None else self.matriz.add(parcial, fill_value=0)
+
+    def combinar(self, outro):
+        if outro.matriz is not None:
+            self.matriz = outro.matriz if self.matriz is None else self.matriz.add(outro.matriz, fill_value=0)
+        return self
+
+    def resultado(self):
+        if self.matriz is None:
+            vazio = pd.MultiIndex.from_tuples([], names=self.CHAVE)
+            return pd.DataFrame(columns=["n", "soma", "soma_q", "reprovacoes"], index=vazio)
+        m = self.matriz.copy()
+        m[["n", "reprovacoes"]] = m[["n", "reprovacoes"]].astype(np.int64)
+        return m
+
+def atualizar_erro_temperatura(estado, posicoes, chaves):
+    """ErroPorTemperatura acumulado só com os ensaios ainda não vistos (linhas_a_incorporar).
+
+    estado: None ou {"chaves", "agregador"}.
+    """
+    atuais, linhas, refazer = linhas_a_incorporar(None if estado is None else estado["chaves"], chaves)
+    if not refazer and len(linhas) == 0:
+        return estado
+    parcial = ErroPorTemperatura()
+    parcial.adicionar(None, posicoes[posicoes["linha"].isin(linhas)])
+    if refazer:
+        return {"chaves": atuais, "agregador": parcial}
+    return {"chaves": atuais, "agregador": ErroPorTemperatura().combinar(estado["agregador"]).combinar(parcial)}
+
+def resumir_erro_temperatura(matriz, bancada=None, por=("pos", "ponto", "faixa")):
+    """n, erro médio, desvio e taxa de reprovação por grupo ('faixa' sai com o rótulo da faixa)."""
+    m = matriz
+    if bancada is not None:
+        m = m[m.index.get_level_values("Bancada") == bancada]
+    somas = m.groupby(level=list(por)).sum()
+    n = somas["n"].where(somas["n"] > 0)
+    media = somas["soma"] / n
+    variancia = (somas["soma_q"] - n * media ** 2) / (n - 1).where(n > 1)
+    resumo = pd.DataFrame({
+        "n": somas["n"].astype(int), "media": media, "desvio": np.sqrt(variancia.clip(lower=0)),
+        "reprovacoes": somas["reprovacoes"].astype(int), "taxa_reprovacao": somas["reprovacoes"] / n * 100,
+    }).reset_index()
+    if "faixa" in resumo.columns:
+        resumo["faixa"] = pd.Categorical.from_codes(resumo["faixa"].astype(int), FAIXAS_TEMPERATURA)
+    return resumo
+
+def comparar_bancadas(matriz, inicio=None, fim=None, classes=None, por=("Bancada", "pos", "ponto")):
+    """Recorta a matriz por meses [inicio, fim] e classes e devolve n, média, desvio e reprovações por grupo."""
+    m = matriz
+    meses = m.index.get_level_values("mes")
+    mascara = np.ones(len(m), dtype=bool)
+    if inicio is not None:
+        mascara &= meses >= np.datetime64(pd.Timestamp(inicio), "M")
+    if fim is not None:
+        mascara &= meses <= np.datetime64(pd.Timestamp(fim), "M")
+    if classes is not None:
+        mascara &= m.index.get_level_values("classe").isin(list(classes))
+    somas = m[mascara].groupby(level=list(por)).sum()
+    n = somas["n"].where(somas["n"] > 0)
+    media = somas["soma"] / n
+    variancia = (somas["soma_q"] - n * media ** 2) / (n - 1).where(n > 1)
+    return pd.DataFrame({
+        "n": somas["n"].astype(int), "media": media, "desvio": np.sqrt(variancia.clip(lower=0)),
+        "reprovacoes": somas["reprovacoes"].astype(int),
+        "taxa_reprovacao": somas["reprovacoes"] / n * 100,
+    })
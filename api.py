@@ -0,0 +1,361 @@
+# =======================================================================
+# ARQUIVO: api.py (API HTTP/JSON SOMENTE LEITURA SOBRE O RETRATO DA CARGA)
+# =======================================================================
+# Processo leve para outras ferramentas do laboratório consumirem os mesmos
+# indicadores do painel sem passar pelo Streamlit nem pelo Google Sheets.
+# Os dados vêm do retrato em disco gravado pelo painel (snapshot.py: base e
+# tabela de posições já avaliadas); uma carga nova gravada pelo painel é
+# percebida em poucos segundos e trocada em segundo plano (recarga.py). Só
+# a tabela mestra da metrologia é lida da fonte, uma vez por validade.
+#
+# Rotas (GET):
+#   /api/saude                                  versão da carga e contagens
+#   /api/kpis/dia?data=AAAA-MM-DD[&bancada=]    calcular_auditoria_real do dia
+#   /api/kpis/mes?ano=&mes=[&bancada=]          idem, do mês
+#   /api/posicoes?inicio=&fim=[&bancada=&status=&serie=]   veredito por posição
+#   /api/series/<série>                         passagens da série pelas bancadas
+#   /api/mapa-calor?inicio=&fim=[&bancada=]     reprovações por exatidão (posição x ponto)
+#   /api/metrologia?ano=&mes=[&bancada=]        resumo da metrologia e posições avaliadas
+# Listas são paginadas (pagina=1.., por_pagina até 1000). Cada resposta tem
+# ETag (If-None-Match devolve 304) e sai comprimida em gzip quando o cliente
+# aceita. As respostas ficam em cache por versão da carga.
+#
+# Uso: python api.py [--host 127.0.0.1] [--porta 8502]
+# Este módulo não depende do Streamlit.
+
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from agregacao import MapaCalorExatidao
+from avaliacao import contar_auditoria, montar_tabela_posicoes, montar_historico_series, historico_da_serie
+from esquema import montar_base
+from fontes import fonte_producao, fonte_do_ambiente
+from incerteza import referencias_da_fonte, avaliar_metrologia, PONTOS as PONTOS_METROLOGIA, STATUS_VAZIO
+from periodo import IndicePeriodo
+from recarga import RecargaCoalescida
+from snapshot import (
+    versao_regras_da_fonte, ler_meta, ler_snapshot, gravar_snapshot, DIRETORIO_PADRAO as DIRETORIO_SNAPSHOT
+)
+
+POR_PAGINA_PADRAO = 100
+POR_PAGINA_MAXIMO = 1000
+MINIMO_GZIP = 1024             # respostas menores saem sem compressão
+RESPOSTAS_EM_CACHE = 256
+COLUNAS_OCULTAS = ["bits_classe", "bits_status", "bits_causa"]
+
+log = logging.getLogger("api")
+
+class ErroConsulta(ValueError):
+    """Parâmetro ausente ou inválido (resposta 400)."""
+
+class RotaInexistente(LookupError):
+    """Caminho que não é de nenhuma rota (resposta 404)."""
+
+# --- DADOS DE UMA CARGA ---
+
+class DadosCarga:
+    """Base e posições de uma carga, com os índices por data e o histórico por série (montado na 1ª consulta)."""
+
+    def __init__(self, versao, base, posicoes):
+        self.versao = versao
+        self.base = base
+        self.posicoes = posicoes
+        self.indice_base = IndicePeriodo(base)
+        self.indice_posicoes = IndicePeriodo(posicoes)
+        self._historico = None
+        self._trava = threading.Lock()
+
+    @property
+    def historico(self):
+        with self._trava:
+            if self._historico is None:
+                self._historico = montar_historico_series(self.posicoes)
+            return self._historico
+
+# --- CONVERSÃO PARA JSON ---
+
+def registros(df):
+    """DataFrame -> lista de dicionários JSON (datas em ISO, NaN como null)."""
+    return json.loads(df.to_json(orient="records", date_format="iso", force_ascii=False))
+
+def paginar(df, consulta):
+    pagina = _inteiro(consulta, "pagina", 1)
+    por_pagina = _inteiro(consulta, "por_pagina", POR_PAGINA_PADRAO)
+    if pagina < 1 or not 1 <= por_pagina <= POR_PAGINA_MAXIMO:
+        raise ErroConsulta(f"pagina >= 1 e por_pagina entre 1 e {POR_PAGINA_MAXIMO}.")
+    inicio = (pagina - 1) * por_pagina
+    return {
+        "pagina": pagina, "por_pagina": por_pagina, "total": len(df),
+        "paginas": -(-len(df) // por_pagina), "itens": registros(df.iloc[inicio:inicio + por_pagina]),
+    }
+
+def _parametro(consulta, nome, obrigatorio=False):
+    valor = consulta.get(nome, "").strip()
+    if obrigatorio and not valor:
+        raise ErroConsulta(f"Parâmetro '{nome}' obrigatório.")
+    return valor or None
+
+def _inteiro(consulta, nome, padrao=None):
+    valor = _parametro(consulta, nome, obrigatorio=padrao is None)
+    if valor is None:
+        return padrao
+    try:
+        return int(valor)
+    except ValueError:
+        raise ErroConsulta(f"Parâmetro '{nome}' deve ser inteiro.") from None
+
+def _data(consulta, nome, obrigatorio=False):
+    valor = _parametro(consulta, nome, obrigatorio)
+    if valor is None:
+        return None
+    try:
+        return pd.Timestamp(valor).normalize()
+    except ValueError:
+        raise ErroConsulta(f"Parâmetro '{nome}' deve ser uma data AAAA-MM-DD.") from None
+
+def _mes(consulta):
+    ano, mes = _inteiro(consulta, "ano"), _inteiro(consulta, "mes")
+    if not 1 <= mes <= 12:
+        raise ErroConsulta("Parâmetro 'mes' deve estar entre 1 e 12.")
+    return ano, mes
+
+# --- ROTAS ---
+
+def rota_saude(servico, dados, consulta):
+    return {
+        "versao_carga": dados.versao, "ensaios": len(dados.base), "posicoes": len(dados.posicoes),
+        "periodo": [str(dados.indice_base.datas.min().date()), str(dados.indice_base.datas.max().date())]
+        if len(dados.base) else None,
+        "recargas": [servico.dados.metricas(), servico.referencias.metricas()],
+    }
+
+def rota_kpis_dia(servico, dados, consulta):
+    data = _data(consulta, "data", obrigatorio=True)
+    bancada = _parametro(consulta, "bancada")
+    return {"data": str(data.date()), "bancada": bancada,
+            **contar_auditoria(dados.indice_posicoes.dia(data, bancada))}
+
+def rota_kpis_mes(servico, dados, consulta):
+    ano, mes = _mes(consulta)
+    bancada = _parametro(consulta, "bancada")
+    return {"ano": ano, "mes": mes, "bancada": bancada, **contar_auditoria(dados.indice_posicoes.mes(ano, mes, bancada))}
+
+def rota_posicoes(servico, dados, consulta):
+    posicoes = dados.indice_posicoes.periodo(_data(consulta, "inicio"), _data(consulta, "fim"), _parametro(consulta, "bancada"))
+    status, serie = _parametro(consulta, "status"), _parametro(consulta, "serie")
+    if status:
+        posicoes = posicoes[posicoes["status"].isin(status.split(","))]
+    if serie:
+        posicoes = posicoes[posicoes["serie"] == serie]
+    return paginar(posicoes.drop(columns=COLUNAS_OCULTAS), consulta)
+
+def rota_serie(servico, dados, consulta, serie):
+    historico = historico_da_serie(dados.historico, serie)
+    resumo = dados.historico["resumo"]
+    return {
+        "serie": serie,
+        "resumo": registros(resumo.loc[[serie]].reset_index())[0] if serie in resumo.index else None,
+        **paginar(historico.drop(columns=COLUNAS_OCULTAS), consulta),
+    }
+
+def rota_mapa_calor(servico, dados, consulta):
+    posicoes = dados.indice_posicoes.periodo(_data(consulta, "inicio"), _data(consulta, "fim"), _parametro(consulta, "bancada"))
+    mapa = MapaCalorExatidao()
+    mapa.adicionar(None, posicoes)
+    matriz, detalhes = mapa.resultado()
+    return {
+        "matriz": {"posicoes": [int(p) for p in matriz.index],
+                   **{ponto: [int(v) for v in matriz[ponto]] for ponto in matriz.columns}},
+        "detalhes": paginar(detalhes, consulta),
+    }
+
+def resumo_metrologia(df_met):
+    """Por bancada: posições ensaiadas, contagem por status e média/desvio de CN, CP e CI (como o resumo IPEM)."""
+    ensaiadas = df_met[df_met["status"] != STATUS_VAZIO]
+    status = ensaiadas["status"]
+    contagens = pd.DataFrame({
+        "posicoes": 1, "aprovadas": status == "APROVADO", "reprovadas": status == "REPROVADO",
+        "zona_critica": status == "ZONA CRÍTICA",
+    }).groupby(ensaiadas["Bancada"]).sum().astype(int)
+    estatisticas = ensaiadas.groupby("Bancada")[PONTOS_METROLOGIA].agg(["mean", "std"])
+    estatisticas.columns = [f"{ponto}_{'media' if estat == 'mean' else 'desvio'}" for ponto, estat in estatisticas.columns]
+    return registros(contagens.join(estatisticas).reset_index())
+
+def rota_metrologia(servico, dados, consulta):
+    ano, mes = _mes(consulta)
+    bloco = dados.indice_base.mes(ano, mes, _parametro(consulta, "bancada"))
+    df_met = avaliar_metrologia(bloco, servico.referencias.obter()) if not bloco.empty else pd.DataFrame()
+    if df_met.empty:
+        return {"ano": ano, "mes": mes, "resumo": [], **paginar(pd.DataFrame(), consulta)}
+    return {"ano": ano, "mes": mes, "resumo": resumo_metrologia(df_met),
+            **paginar(df_met.drop(columns="linha"), consulta)}
+
+ROTAS = {
+    "/api/kpis/dia": rota_kpis_dia,
+    "/api/kpis/mes": rota_kpis_mes,
+    "/api/posicoes": rota_posicoes,
+    "/api/mapa-calor": rota_mapa_calor,
+    "/api/metrologia": rota_metrologia,
+}
+
+# --- SERVIÇO ---
+
+class Resposta:
+    """Corpo JSON pronto, com ETag e a versão gzip (feita na primeira vez que alguém pede)."""
+
+    def __init__(self, corpo):
+        self.corpo = corpo
+        self.etag = '"' + hashlib.sha1(corpo).hexdigest()[:20] + '"'
+        self._gzip = None
+
+    @property
+    def gzip(self):
+        if self._gzip is None:
+            self._gzip = gzip.compress(self.corpo, compresslevel=5)
+        return self._gzip
+
+class ServicoApi:
+    """Carga atual (retrato do painel) e cache das respostas por (versão da carga, rota, parâmetros)."""
+
+    def __init__(self, fonte, diretorio=DIRETORIO_SNAPSHOT):
+        self.fonte = fonte
+        self.diretorio = diretorio
+        self.versao_regras = versao_regras_da_fonte(fonte.descricao)
+        self.dados = RecargaCoalescida("Retrato da carga", self._ler_retrato, ttl=5, jitter=0, intervalo_minimo=1)
+        self.referencias = RecargaCoalescida("Tabela mestra", lambda: referencias_da_fonte(fonte),
+                                             ttl=fonte.ttl, intervalo_minimo=fonte.intervalo_minimo)
+        self.respostas = OrderedDict()
+        self.trava = threading.Lock()
+
+    def _ler_retrato(self):
+        """Carga do retrato em disco; a mesma versão não é relida. Sem retrato (painel nunca rodou com estas
+        regras), monta a base a partir da fonte e grava o retrato."""
+        atual = self.dados.valor
+        meta = ler_meta(self.diretorio, self.versao_regras)
+        if meta is not None and atual is not None and meta["versao_carga"] == atual.versao:
+            return atual
+        retrato = ler_snapshot(self.diretorio, self.versao_regras)
+        if retrato is not None:
+            return DadosCarga(retrato["meta"]["versao_carga"], retrato["base"], retrato["posicoes"])
+        if atual is not None:
+            return atual
+        brutos = self.fonte.abas()
+        base = montar_base(brutos)
+        posicoes = montar_tabela_posicoes(base)
+        try:
+            gravar_snapshot(self.diretorio, self.versao_regras, brutos, base, posicoes)
+        except Exception:
+            log.exception("Retrato em disco não gravado; servindo a carga montada da fonte.")
+        return DadosCarga(base.attrs["versao"], base, posicoes)
+
+    def responder(self, caminho, consulta):
+        """Resposta (do cache, se já calculada para esta carga), ErroConsulta ou RotaInexistente."""
+        serie = caminho[len("/api/series/"):] if caminho.startswith("/api/series/") else ""
+        if caminho != "/api/saude" and caminho not in ROTAS and not serie:
+            raise RotaInexistente(caminho)
+        dados = self.dados.obter()
+        if caminho == "/api/saude":
+            return Resposta(json.dumps(rota_saude(self, dados, consulta), default=_json_numpy).encode("utf-8"))
+        chave = (dados.versao, caminho, tuple(sorted(consulta.items())))
+        if caminho == "/api/metrologia":
+            chave += (self.referencias.obter_com_geracao()[1],)
+        with self.trava:
+            resposta = self.respostas.get(chave)
+            if resposta is not None:
+                self.respostas.move_to_end(chave)
+                return resposta
+        if serie:
+            conteudo = rota_serie(self, dados, consulta, unquote(serie))
+        else:
+            conteudo = ROTAS[caminho](self, dados, consulta)
+        resposta = Resposta(json.dumps(conteudo, ensure_ascii=False, default=_json_numpy).encode("utf-8"))
+        with self.trava:
+            self.respostas[chave] = resposta
+            while len(self.respostas) > RESPOSTAS_EM_CACHE:
+                self.respostas.popitem(last=False)
+        return resposta
+
+def _json_numpy(valor):
+    if isinstance(valor, np.generic):
+        return valor.item()
+    raise TypeError(f"Tipo não serializável: {type(valor).__name__}")
+
+def criar_manipulador(servico):
+    class Manipulador(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            partes = urlsplit(self.path)
+            consulta = {k: v[0] for k, v in parse_qs(partes.query).items()}
+            caminho = partes.path.rstrip("/") or "/"
+            try:
+                resposta = servico.responder(caminho, consulta)
+            except RotaInexistente:
+                return self._erro(404, f"Rota inexistente: {caminho}")
+            except ErroConsulta as e:
+                return self._erro(400, str(e))
+            except Exception as e:
+                log.exception("Falha em %s", self.path)
+                return self._erro(500, str(e))
+            if resposta.etag in [t.strip() for t in self.headers.get("If-None-Match", "").split(",")]:
+                self.send_response(304)
+                self.send_header("ETag", resposta.etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            corpo, codificacao = resposta.corpo, None
+            if len(corpo) >= MINIMO_GZIP and "gzip" in self.headers.get("Accept-Encoding", ""):
+                corpo, codificacao = resposta.gzip, "gzip"
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("ETag", resposta.etag)
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Vary", "Accept-Encoding")
+            if codificacao:
+                self.send_header("Content-Encoding", codificacao)
+            self.send_header("Content-Length", str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def _erro(self, codigo, mensagem):
+            corpo = json.dumps({"erro": mensagem}, ensure_ascii=False).encode("utf-8")
+            self.send_response(codigo)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def log_message(self, formato, *args):
+            log.debug(formato, *args)
+
+    return Manipulador
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="API JSON somente leitura dos ensaios (retrato do painel).")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8502)
+    parser.add_argument("--diretorio", default=DIRETORIO_SNAPSHOT, help="pasta do retrato (SNAPSHOT_DIR)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    servico = ServicoApi(fonte_do_ambiente(fonte_producao()), args.diretorio)
+    servidor = ThreadingHTTPServer((args.host, args.porta), criar_manipulador(servico))
+    log.info("API em http://%s:%d/api/saude", args.host, args.porta)
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+if __name__ == "__main__":
+    main()
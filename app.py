@@ -6,13 +6,17 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-from datetime import datetime, date, timezone, timedelta
+from datetime import datetime, timedelta
 import plotly.express as px
 import plotly.graph_objects as go
+from plotly.subplots import make_subplots
 import traceback
-import re
+import logging
 import os
-from io import BytesIO
+import threading
+from collections import OrderedDict
+
+log = logging.getLogger("painel")
 
 # Tenta importar o gerador de PDF original
 try:
@@ -21,34 +25,63 @@ except ImportError:
     def gerar_pdf_relatorio(*args, **kwargs):
         return None
 
+from avaliacao import (
+    montar_tabela_posicoes, montar_historico_series, buscar_historico, para_medidores,
+    series_reprovadas_depois_aprovadas, series_reincidentes, primeira_aprovacao,
+    chaves_ensaios, atualizar_resumo_series, indicadores_primeira_passagem, distribuicao_retestes,
+    contar_auditoria, contar_registradores, REG_INCONSISTENCIAS, estatisticas_diarias, auditoria_por_dia,
+    bits_classe, filtro_bits, CLASSES_FILTRO, STATUS_FILTRO, CAUSAS_FILTRO
+)
+from agregacao import (
+    blocos_de_posicoes, consumir, ContagemAuditoria, MapaCalorExatidao, MomentosDispersao,
+    MatrizBancadas, comparar_bancadas, posicoes_metrologia,
+    atualizar_erro_temperatura, resumir_erro_temperatura, FAIXAS_TEMPERATURA
+)
+from periodo import IndicePeriodo
+from recarga import RecargaCoalescida
+from paralelo import (
+    avaliador_do_ambiente, particoes_mes_bancada, particoes_bancada,
+    metrologia_particao, juntar_por_linha
+)
+from fontes import fonte_producao, fonte_do_ambiente
+from esquema import montar_base
+from snapshot import versao_regras_da_fonte, assinatura_brutos, gravar_snapshot, ler_snapshot, DIRETORIO_PADRAO as DIRETORIO_SNAPSHOT
+from exportacao import FilaExportacao, id_tarefa, excel_em_abas, assinatura_df, NA_FILA, EXECUTANDO, PRONTO, ERRO
+from qualidade import atualizar_qualidade, MOTIVOS as MOTIVOS_QUALIDADE
+from incerteza import referencias_por_posicao, avaliar_conformidade, PROB_CONFORMIDADE_MIN, U_PADRAO
+from consulta import (
+    preparar_banco, executar_consulta, esquema_banco, consultas_salvas, salvar_consulta, excluir_consulta,
+    CONSULTAS_PRONTAS, LIMITE_LINHAS, DIRETORIO_PADRAO as DIRETORIO_CONSULTA
+)
+from cep import leituras_cep, calcular_limites, carta_individuais, carta_xbarra_r, MonitorCEP, CHAVE, REGRAS
+
 st.set_page_config(page_title="Dashboard de Ensaios", page_icon="📊", layout="wide")
 
-# --- CONFIGURAÇÕES E CONSTANTES ORIGINAIS ---
-LIMITES_CLASSE = {"A": 1.0, "B": 1.3, "C": 2.0, "D": 0.3}
+# A base carregada é um objeto único do processo, compartilhado por todas as sessões (st.cache_resource).
+# Com Copy-on-Write, filtros e seleções das páginas são visões que copiam só se alguém escrever nelas,
+# então nenhuma sessão altera a base das outras. (No pandas 3 o CoW já é o padrão.)
+try:
+    pd.set_option("mode.copy_on_write", True)
+except Exception:
+    pass
+
+# Seções com widgets locais rodam como fragmento: mexer no widget reexecuta só a seção, não a página.
+# (st.fragment existe a partir do Streamlit 1.37; em versões antigas a seção roda junto com a página)
+fragmento = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or (lambda f: f)
+
+def fragmento_periodico(segundos):
+    """Fragmento que se reexecuta sozinho a cada 'segundos' (sem suporte, vira função comum)."""
+    fragment = getattr(st, "fragment", None)
+    return fragment(run_every=segundos) if fragment else (lambda f: f)
 
 # =======================================================================
 # [BLOCO INTEGRAL] - METROLOGIA AVANÇADA + DISPERSÃO + LAUDO TÉCNICO
 # =======================================================================
 
-import plotly.graph_objects as go
-import plotly.express as px
-import pandas as pd
-import numpy as np
-import re
-from datetime import datetime
 from fpdf import FPDF
-import streamlit as st
 
-# --- DEFINIÇÃO DE LIMITES RTM IPEM ---
-LIMITES_CLASSE = {"A": 1.0, "B": 1.3, "C": 2.0, "D": 0.3, "1": 2.0, "2": 4.0}
-
-# --- CONSTANTES EXCLUSIVAS DO BLOCO DE METROLOGIA ---
-MAPA_BANCADA_SERIE = {
-   'BANC_10_POS_MQN-1': 'B1172110310148',
-   'BANC_20_POS_MQN-2': '85159',
-   'BANC_20_POS_MQN-3': '93959',
-   'BANC_3_MQN-4': '96850'
-}
+# --- LIMITES RTM IPEM E BANCADAS DE REFERÊNCIA (em incerteza.py, usados também pelo vigia) ---
+from incerteza import LIMITES_CLASSE, MAPA_BANCADA_SERIE, serie_referencia_bancada
 
 def valor_num_metrologia(v):
    """Converte valores tratando vírgulas e escala decimal de forma robusta."""
@@ -63,77 +96,41 @@ def valor_num_metrologia(v):
    except:
        return None
 
-@st.cache_data(ttl=600)
+def _buscar_tabela_mestra():
+   df = fonte_dados().tabela_mestra()
+   if df is None:
+       return None
+   df = df.copy()
+   df['Erro_Sistematico_Pct'] = df['Erro_Sistematico_Pct'].apply(valor_num_metrologia)
+   if 'Incerteza_U_Pct' in df.columns:
+       df['Incerteza_U_Pct'] = df['Incerteza_U_Pct'].apply(valor_num_metrologia)
+   
+   return df.groupby(['Serie_Bancada', 'Posicao']).agg({
+       'Erro_Sistematico_Pct': 'mean',
+       'Incerteza_U_Pct': 'mean' if 'Incerteza_U_Pct' in df.columns else 'first'
+   }).reset_index()
+
+@st.cache_resource
+def recarga_tabela_mestra():
+   """Recarga única da tabela mestra (mesma política da planilha das bancadas)."""
+   fonte = fonte_dados()
+   return RecargaCoalescida("Tabela mestra", _buscar_tabela_mestra, ttl=fonte.ttl, intervalo_minimo=fonte.intervalo_minimo)
+
 def carregar_tabela_mestra_sheets():
-   sheet_id = "1kcN5lUZ14hwFyQMdrsFbMxjpALI4x6yd2AMCMq_who8"
-   url = f"https://docs.google.com/spreadsheets/d/{sheet_id}/gviz/tq?tqx=out:csv"
+   """(tabela mestra, geração da recarga); (None, None) se a fonte falhou."""
    try:
-       df = pd.read_csv(url)
-       df['Erro_Sistematico_Pct'] = df['Erro_Sistematico_Pct'].apply(valor_num_metrologia)
-       if 'Incerteza_U_Pct' in df.columns:
-           df['Incerteza_U_Pct'] = df['Incerteza_U_Pct'].apply(valor_num_metrologia)
-       
-       return df.groupby(['Serie_Bancada', 'Posicao']).agg({
-           'Erro_Sistematico_Pct': 'mean',
-           'Incerteza_U_Pct': 'mean' if 'Incerteza_U_Pct' in df.columns else 'first'
-       }).reset_index()
+       return recarga_tabela_mestra().obter_com_geracao()
    except:
-       return None
+       return None, None
 
-def processar_metrologia_isolada(row, df_mestra=None):
-   medidores = []
-   bancada_row = str(row.get('Bancada_Nome', ''))
-   n_ensaio = row.get('N_ENSAIO', 'N/A')
-   serie_bancada = next((v for k, v in MAPA_BANCADA_SERIE.items() if k in bancada_row), None)
-   tamanho_bancada = 20 if '20_POS' in bancada_row else 10
-   
-   classe = str(row.get("Classe", "")).upper()
-   if "ELETROMEC" in classe or any(c in classe for c in ["1", "2"]):
-       limite = 4.0 if "2" in classe else 2.0
-   else:
-       classe_limpa = re.search(r'[A-D]', classe)
-       classe_letra = classe_limpa.group(0) if classe_limpa else 'B'
-       limite = LIMITES_CLASSE.get(classe_letra, 1.3)
-   
-   def texto(val): return str(val) if val is not None else ""
+def carregar_referencias_incerteza():
+   """Erro sistemático e incerteza por (série da bancada, posição), prontos para o join vetorizado."""
+   mestra, geracao = carregar_tabela_mestra_sheets()
+   return _referencias_incerteza(mestra, geracao)
 
-   for pos in range(1, tamanho_bancada + 1):
-       serie = texto(row.get(f"P{pos}_Série"))
-       v_cn = valor_num_metrologia(row.get(f"P{pos}_CN"))
-       v_cp = valor_num_metrologia(row.get(f"P{pos}_CP"))
-       v_ci = valor_num_metrologia(row.get(f"P{pos}_CI"))
-       
-       erro_ref, inc_banc = 0.0, 0.05
-       if df_mestra is not None and serie_bancada:
-           ref_row = df_mestra[(df_mestra['Serie_Bancada'].astype(str) == str(serie_bancada)) & (df_mestra['Posicao'] == pos)]
-           if not ref_row.empty:
-               erro_ref = ref_row['Erro_Sistematico_Pct'].values[0] or 0.0
-               inc_banc = ref_row['Incerteza_U_Pct'].values[0] if 'Incerteza_U_Pct' in ref_row.columns else 0.05
-       
-       if v_cn is None and v_cp is None and v_ci is None:
-           status, detalhe = "Não Ligou / Não Ensaido", ""
-       else:
-           status, detalhe = "APROVADO", ""
-           erros_p, alertas_gb = [], []
-           for n, v in [('CN', v_cn), ('CP', v_cp), ('CI', v_ci)]:
-               if v is not None:
-                   if abs(v) > limite:
-                       erros_p.append(n)
-                   elif (abs(v) + inc_banc) > limite:
-                       alertas_gb.append(n)
-           
-           if erros_p:
-               status, detalhe = "REPROVADO", f"⚠️ Excedeu {limite}% em: {', '.join(erros_p)}"
-           elif alertas_gb:
-               status, detalhe = "ZONA CRÍTICA", f"⚠️ Guardband: {', '.join(alertas_gb)}"
-       
-       medidores.append({
-           "n_ensaio": n_ensaio, "pos": pos, "serie": serie, "classe": classe,
-           "cn": v_cn, "cp": v_cp, "ci": v_ci,
-           "status": status, "detalhe": detalhe, 
-           "erro_ref": erro_ref, "inc_banc": inc_banc, "limite_rtm": limite
-       })
-   return medidores
+@st.cache_resource(show_spinner=False, max_entries=2)
+def _referencias_incerteza(_mestra, geracao):
+   return referencias_por_posicao(_mestra)
 
 class PDF_LAUDO(FPDF):
    def header(self):
@@ -192,98 +189,240 @@ def gerar_pdf_profissional(df_resumo, mes_txt):
    pdf_bytes = pdf.output(dest='S')
    return bytes(pdf_bytes) if not isinstance(pdf_bytes, str) else pdf_bytes.encode('latin-1')
 
+@st.cache_data(show_spinner=False)
+def processar_metrologia_mes(df_p, referencias):
+   """Avalia uma vez os ensaios do mês filtrado. Depende só do mês/ano, das classes e da tabela mestra.
+
+   A correção pelo erro sistemático, a incerteza combinada e o status (inclusive ZONA CRÍTICA) saem de
+   avaliar_conformidade, numa operação sobre todas as posições do mês.
+   """
+   if df_p.empty:
+       return pd.DataFrame()
+   executor = avaliador()
+   if executor.modo == "serial":
+       df_met = posicoes_metrologia(df_p, LIMITES_CLASSE)
+   else:
+       partes = executor.mapear(df_p, metrologia_particao, particoes_bancada(df_p), LIMITES_CLASSE)
+       df_met = juntar_por_linha(partes, df_p).drop(columns="linha")
+   if df_met.empty:
+       return df_met
+   series = df_met['Bancada'].map({b: serie_referencia_bancada(b) for b in df_met['Bancada'].unique()})
+   return avaliar_conformidade(df_met, referencias, series)
+
+@st.cache_data(show_spinner=False)
+def resumo_precisao(df_disp):
+   df_resumo = df_disp.groupby('Bancada').agg({'cn': ['mean', 'std'], 'cp': ['mean', 'std'], 'ci': ['mean', 'std']})
+   df_resumo.columns = ['cn', 'cn_std', 'cp', 'cp_std', 'ci', 'ci_std']
+   return df_resumo
+
+@fragmento
+def secao_estabilidade_bancada(df_met):
+   """Bancada/posição são widgets locais: trocar só refaz este gráfico, sem reavaliar o mês."""
+   c1, c2 = st.columns(2)
+   b_sel = c1.selectbox("Selecione a Bancada", sorted(df_met['Bancada'].unique()), key="b_sel")
+   p_sel = c2.slider("Posição", 1, 20, 1, key="p_sel")
+   df_chart = df_met[(df_met['Bancada'] == b_sel) & (df_met['pos'] == p_sel)].copy()
+   if not df_chart.empty:
+       df_chart['Erro_Medio'] = df_chart[['cn', 'cp', 'ci']].astype(float).mean(axis=1)
+       fig = go.Figure()
+       fig.add_trace(go.Scatter(x=df_chart['Data'], y=df_chart['Erro_Medio'], mode='lines+markers', name='Erro Medidor', line=dict(color='#2ecc71')))
+       fig.add_trace(go.Scatter(x=df_chart['Data'], y=df_chart['erro_ref'], mode='lines', name='Referência', line=dict(dash='dash', color='#e74c3c')))
+       st.plotly_chart(fig, use_container_width=True)
+
+@fragmento
+def secao_dispersao(df_met, mes_txt, mes_sel):
+   """Cruzamento CN x CP/CI, resumo estatístico e laudo. Depende de df_met e do cruzamento escolhido."""
+   st.markdown("#### ⚖️ Cruzamento Dinâmico de Erros (CN, CP, CI)")
+   tipo_grafico = st.radio("Selecione o Cruzamento:", ["CN vs CP (Comportamento Linear)", "CN vs CI (Comportamento Indutivo)"], horizontal=True)
+   eixo_y = 'cp' if "CP" in tipo_grafico else 'ci'
+   df_disp = df_met.dropna(subset=['cn', eixo_y]).copy()
+
+   if not df_disp.empty:
+       # RETORNO DA LÓGICA ORIGINAL DE JITTER E PLOTAGEM
+       df_disp['cn_j'] = df_disp['cn'] + np.random.uniform(-0.02, 0.02, len(df_disp))
+       df_disp[f'{eixo_y}_j'] = df_disp[eixo_y] + np.random.uniform(-0.02, 0.02, len(df_disp))
+       fig_scat = px.scatter(
+           df_disp, x='cn_j', y=f'{eixo_y}_j', color='status',
+           hover_name='serie',
+           hover_data={'cn': ':.3f', eixo_y: ':.3f', 'pos': True, 'Bancada': True, 'n_ensaio': True},
+           color_discrete_map={'APROVADO': '#16a34a', 'REPROVADO': '#dc2626', 'ZONA CRÍTICA': '#f1c40f'},
+           labels={'cn_j': 'Erro Carga Nominal (%)', f'{eixo_y}_j': f'Erro Carga {eixo_y.upper()} (%)'}
+       )
+       fig_scat.add_shape(type="rect", x0=-2, y0=-2, x1=2, y1=2, line=dict(color="Red", dash="dash", width=2))
+       fig_scat.update_xaxes(range=[-4.5, 4.5], zeroline=True, zerolinecolor='black', gridcolor='lightgray')
+       fig_scat.update_yaxes(range=[-4.5, 4.5], zeroline=True, zerolinecolor='black', gridcolor='lightgray')
+       fig_scat.update_layout(height=550, template="plotly_white", margin=dict(l=0, r=0, t=20, b=40), autosize=True)
+       st.plotly_chart(fig_scat, use_container_width=True)
+       
+       # --- TABELA DE DISPERSÃO REINSERIDA AQUI ---
+       st.markdown("##### 📝 Resumo Estatístico de Precisão (IPEM)")
+       df_resumo = resumo_precisao(df_disp[['Bancada', 'cn', 'cp', 'ci']])
+       st.dataframe(df_resumo.round(4), use_container_width=True)
+       
+       # --- SEÇÃO DO PDF NO FINAL ---
+       st.markdown("---")
+       c_pdf1, c_pdf2 = st.columns([3, 1])
+       with c_pdf1:
+           st.write("### 📜 Exportação de Relatório Técnico")
+       with c_pdf2:
+           botao_exportacao(
+               "📄 Gerar Laudo PDF", ("laudo", mes_txt, assinatura_df(df_resumo.reset_index())),
+               lambda progresso, df, mes: gerar_pdf_profissional(df, mes), df_resumo, mes_txt,
+               nome_arquivo=f"Laudo_IPEM_{mes_sel}.pdf", mime="application/pdf", descricao=f"Laudo {mes_txt}"
+           )
+
+def secao_zona_critica(df_met):
+   """Posições dentro do limite cuja probabilidade de conformidade (leitura corrigida e incerteza) fica abaixo do mínimo."""
+   df_zona = df_met[df_met['status'] == 'ZONA CRÍTICA'].sort_values('p_conformidade')
+   st.caption(f"Leituras corrigidas pelo erro sistemático da posição quando ela está na tabela mestra (coluna sem_referencia); "
+              f"ZONA CRÍTICA quando P(conforme) < {PROB_CONFORMIDADE_MIN:.0%}.")
+   if df_zona.empty:
+       st.success("Nenhuma posição na zona crítica.")
+       return
+   colunas = ['Data', 'Bancada', 'n_ensaio', 'pos', 'serie', 'classe', 'limite_rtm', 'cn_corr', 'cp_corr', 'ci_corr',
+              'erro_ref', 'sem_referencia', 'inc_banc', 'u_c', 'p_cn', 'p_cp', 'p_ci', 'p_conformidade', 'detalhe']
+   df_exib = df_zona[colunas].copy()
+   df_exib[['p_cn', 'p_cp', 'p_ci', 'p_conformidade']] = (df_exib[['p_cn', 'p_cp', 'p_ci', 'p_conformidade']] * 100).round(2)
+   st.dataframe(df_exib.round(4), use_container_width=True, hide_index=True)
+
+def grafico_cep(carta_i, carta_xr):
+   """Carta de individuais e carta X̄/R de uma posição, com os pontos que violaram alguma regra em vermelho."""
+   fig = make_subplots(rows=3, cols=1, shared_xaxes=True, vertical_spacing=0.06,
+                       subplot_titles=("Individuais (I)", "Média diária (X̄)", "Amplitude diária (R)"))
+   for linha, carta, y, lic, lsc in ((1, carta_i, 'valor', 'lic_i', 'lsc_i'), (2, carta_xr, 'media', 'lic_x', 'lsc_x')):
+       fig.add_trace(go.Scatter(x=carta['Data_dt'], y=carta[y], mode='lines+markers', line=dict(color='#1e3a8a'), showlegend=False), row=linha, col=1)
+       fig.add_trace(go.Scatter(x=carta['Data_dt'], y=carta['centro'], mode='lines', line=dict(color='#16a34a', dash='dot'), showlegend=False), row=linha, col=1)
+       for limite in (lic, lsc):
+           fig.add_trace(go.Scatter(x=carta['Data_dt'], y=carta[limite], mode='lines', line=dict(color='#dc2626', dash='dash', shape='hv'), showlegend=False), row=linha, col=1)
+       fora = carta[carta['violacao']]
+       fig.add_trace(go.Scatter(x=fora['Data_dt'], y=fora[y], mode='markers', marker=dict(color='#dc2626', size=10, symbol='x'), showlegend=False), row=linha, col=1)
+   amp = carta_xr[carta_xr['n'] >= 2]
+   fig.add_trace(go.Scatter(x=amp['Data_dt'], y=amp['amplitude'], mode='lines+markers', line=dict(color='#7c3aed'), showlegend=False), row=3, col=1)
+   fig.add_trace(go.Scatter(x=amp['Data_dt'], y=amp['lsc_r'], mode='lines', line=dict(color='#dc2626', dash='dash', shape='hv'), showlegend=False), row=3, col=1)
+   fig.update_layout(height=650, template="plotly_white", margin=dict(l=0, r=0, t=30, b=0))
+   return fig
+
+@fragmento
+def secao_cep(df_completo, ano_sel, mes_sel):
+   """Cartas de controle por posição. Os limites vêm da janela de referência escolhida; o mês só filtra a exibição."""
+   primeira = df_completo['Data_dt'].min().date()
+   c1, c2 = st.columns(2)
+   inicio_base = c1.date_input("Início da referência", primeira, key="cep_ini")
+   fim_base = c2.date_input("Fim da referência", primeira + timedelta(days=90), key="cep_fim")
+   monitor = monitor_cep(df_completo, inicio_base, fim_base)
+
+   violacoes = monitor.violacoes
+   if not violacoes.empty:
+       violacoes = violacoes[(violacoes['Data_dt'].dt.year == ano_sel) & (violacoes['Data_dt'].dt.month == mes_sel)]
+   k1, k2, k3 = st.columns(3)
+   k1.metric("Pontos conferidos", monitor.pontos)
+   k2.metric("Violações no mês", len(violacoes))
+   k3.metric("Cartas fora de controle no mês", violacoes[CHAVE].drop_duplicates().shape[0] if not violacoes.empty else 0)
+   if not violacoes.empty:
+       df_regras = violacoes.groupby(CHAVE)[list(REGRAS)].sum().astype(int)
+       df_regras['Total'] = df_regras.sum(axis=1)
+       st.dataframe(df_regras.sort_values('Total', ascending=False).rename(columns=REGRAS).reset_index(),
+                    use_container_width=True, hide_index=True)
+
+   leituras = carregar_leituras_cep(df_completo, versao_dados(df_completo))
+   c3, c4, c5 = st.columns(3)
+   b_sel = c3.selectbox("Bancada", sorted(leituras['Bancada'].unique()), key="cep_banc")
+   p_sel = c4.slider("Posição", 1, 20, 1, key="cep_pos")
+   ponto_sel = c5.radio("Ponto", ["CN", "CP", "CI"], horizontal=True, key="cep_ponto")
+   serie = leituras[(leituras['Bancada'] == b_sel) & (leituras['pos'] == p_sel) & (leituras['ponto'] == ponto_sel)]
+   carta_i = carta_individuais(serie, monitor.limites)
+   carta_xr = carta_xbarra_r(serie, monitor.limites)
+   no_mes_i = (carta_i['Data_dt'].dt.year == ano_sel) & (carta_i['Data_dt'].dt.month == mes_sel)
+   no_mes_xr = (carta_xr['Data_dt'].dt.year == ano_sel) & (carta_xr['Data_dt'].dt.month == mes_sel)
+   if not no_mes_i.any():
+       st.info("Sem leituras desta posição no mês.")
+       return
+   if carta_i['centro'].isna().all():
+       st.warning("Poucas leituras na janela de referência para calcular os limites desta posição.")
+   st.plotly_chart(grafico_cep(carta_i[no_mes_i], carta_xr[no_mes_xr]), use_container_width=True)
+
+@fragmento
+def secao_temperatura():
+   """Erro médio e taxa de reprovação por posição, ponto e faixa de temperatura, sobre todo o histórico."""
+   matriz = carregar_erro_temperatura()
+   st.caption("Todo o histórico (o mês e as classes da barra lateral não se aplicam). Ensaios sem temperatura ficam de fora.")
+   if matriz.empty:
+       st.info("Nenhum ensaio com temperatura registrada.")
+       return
+   c1, c2 = st.columns(2)
+   b_sel = c1.selectbox("Bancada", sorted(matriz.index.get_level_values('Bancada').unique()), key="temp_banc")
+   indicador = c2.radio("Indicador", ["Erro médio (%)", "Taxa de reprovação (%)"], horizontal=True, key="temp_ind")
+   resumo = resumir_erro_temperatura(matriz, bancada=b_sel)
+   coluna = 'media' if indicador.startswith("Erro") else 'taxa_reprovacao'
+
+   por_faixa = resumir_erro_temperatura(matriz, bancada=b_sel, por=("ponto", "faixa"))
+   fig = px.bar(por_faixa, x='faixa', y=coluna, color='ponto', barmode='group',
+                category_orders={'faixa': FAIXAS_TEMPERATURA}, hover_data={'n': True, 'reprovacoes': True},
+                labels={'faixa': 'Faixa de temperatura', coluna: indicador, 'ponto': 'Ponto'})
+   fig.update_layout(height=320, template="plotly_white", margin=dict(l=0, r=0, t=10, b=0))
+   st.plotly_chart(fig, use_container_width=True)
+
+   ponto_sel = st.radio("Ponto", ["CN", "CP", "CI"], horizontal=True, key="temp_ponto")
+   df_ponto = resumo[resumo['ponto'] == ponto_sel]
+   mapa = df_ponto.pivot_table(index='pos', columns='faixa', values=coluna, observed=True)
+   fig_mapa = px.imshow(mapa, text_auto='.2f', aspect='auto',
+                        color_continuous_scale='RdBu_r' if coluna == 'media' else 'Reds',
+                        color_continuous_midpoint=0 if coluna == 'media' else None,
+                        labels=dict(x="Faixa de temperatura", y="Posição", color=indicador))
+   fig_mapa.update_layout(height=550, margin=dict(l=0, r=0, t=10, b=0))
+   st.plotly_chart(fig_mapa, use_container_width=True)
+   st.dataframe(df_ponto.drop(columns='ponto').round(4), use_container_width=True, hide_index=True)
+
 def pagina_metrologia_avancada(df_completo):
    st.markdown("<style>.main > div { max-width: 100% !important; }</style>", unsafe_allow_html=True)
    st.markdown("## 🔬 Metrologia Avançada e Estabilidade")
-   df_mestra = carregar_tabela_mestra_sheets()
    meses_n = ["Janeiro","Fevereiro","Março","Abril","Maio","Junho","Julho","Agosto","Setembro","Outubro","Novembro","Dezembro"]
    
    # BARRA LATERAL - FILTROS
    st.sidebar.markdown("### 🛠️ Parâmetros Técnicos")
    col_filt1, col_filt2 = st.sidebar.columns(2)
    mes_sel = col_filt1.selectbox("Mês", range(1, 13), index=datetime.now().month-1, format_func=lambda x: meses_n[x-1])
-   ano_sel = col_filt2.selectbox("Ano", sorted(df_completo['Data_dt'].dt.year.unique(), reverse=True))
+   indice = indice_base(df_completo, versao_dados(df_completo))
+   ano_sel = col_filt2.selectbox("Ano", indice.anos()[::-1])
    
    # FILTRO DE CLASSES CONFORME SOLICITADO (1, 2, A, B, C, D)
-   opcoes_classes = ["1", "2", "A", "B", "C", "D"]
-   classes_sel = st.sidebar.multiselect("Selecionar Classes:", opcoes_classes, default=opcoes_classes)
+   classes_sel = st.sidebar.multiselect("Selecionar Classes:", CLASSES_FILTRO, default=CLASSES_FILTRO)
    
-   todos_meds = []
-   df_p = df_completo[(df_completo['Data_dt'].dt.month == mes_sel) & 
-                      (df_completo['Data_dt'].dt.year == ano_sel)]
+   df_p = indice.mes(ano_sel, mes_sel)
    
-   # Filtragem por Classe
+   # Filtragem por Classe (bits calculados na carga: a seleção vira uma máscara)
    if not df_p.empty:
-       df_p = df_p[df_p['Classe'].astype(str).str.upper().apply(lambda x: any(c in x for c in classes_sel))]
-
-   for _, r in df_p.sort_values('Data_dt').iterrows():
-       for m in processar_metrologia_isolada(r, df_mestra):
-           m['Data'] = r['Data_dt']
-           m['Bancada'] = r['Bancada_Nome']
-           todos_meds.append(m)
-           
-   if not todos_meds:
+       bits = bits_classe_base(df_completo, versao_dados(df_completo)).to_numpy()
+       df_p = df_p[filtro_bits(bits[df_p.index], CLASSES_FILTRO, classes_sel)]
+
+   df_met = processar_metrologia_mes(df_p, carregar_referencias_incerteza())
+   if df_met.empty:
        st.info(f"Nenhum dado encontrado.")
        return
 
-   df_met = pd.DataFrame(todos_meds)
-   tabs = st.tabs(["📈 Estabilidade da Bancada", "⚠️ Alertas Guardband", "📊 Dispersão Total (CN, CP, CI)"])
+   sem_ref = df_met[df_met['sem_referencia']]
+   if not sem_ref.empty:
+       st.warning(f"{len(sem_ref)} posições sem referência na tabela mestra ({', '.join(sorted(sem_ref['Bancada'].unique()))}): "
+                  "leituras não corrigidas e incerteza padrão de "
+                  f"{U_PADRAO}%. Padrão de cada planilha em SERIES_REFERENCIA.")
+
+   tabs = st.tabs(["📈 Estabilidade da Bancada", "⚠️ Alertas Guardband", "📊 Dispersão Total (CN, CP, CI)", "🎯 Controle Estatístico (CEP)",
+                   "🌡️ Erro x Temperatura"])
 
    with tabs[0]:
-       c1, c2 = st.columns(2)
-       b_sel = c1.selectbox("Selecione a Bancada", sorted(df_met['Bancada'].unique()), key="b_sel")
-       p_sel = c2.slider("Posição", 1, 20, 1, key="p_sel")
-       df_chart = df_met[(df_met['Bancada'] == b_sel) & (df_met['pos'] == p_sel)].copy()
-       if not df_chart.empty:
-           df_chart['Erro_Medio'] = df_chart.apply(lambda r: np.mean([x for x in [r['cn'], r['cp'], r['ci']] if x is not None]), axis=1)
-           fig = go.Figure()
-           fig.add_trace(go.Scatter(x=df_chart['Data'], y=df_chart['Erro_Medio'], mode='lines+markers', name='Erro Medidor', line=dict(color='#2ecc71')))
-           fig.add_trace(go.Scatter(x=df_chart['Data'], y=df_chart['erro_ref'], mode='lines', name='Referência', line=dict(dash='dash', color='#e74c3c')))
-           st.plotly_chart(fig, use_container_width=True)
+       secao_estabilidade_bancada(df_met)
 
    with tabs[1]:
-       st.dataframe(df_met[df_met['status'] == 'ZONA CRÍTICA'], use_container_width=True)
+       secao_zona_critica(df_met)
 
    with tabs[2]:
-       st.markdown("#### ⚖️ Cruzamento Dinâmico de Erros (CN, CP, CI)")
-       tipo_grafico = st.radio("Selecione o Cruzamento:", ["CN vs CP (Comportamento Linear)", "CN vs CI (Comportamento Indutivo)"], horizontal=True)
-       eixo_y = 'cp' if "CP" in tipo_grafico else 'ci'
-       df_disp = df_met.dropna(subset=['cn', eixo_y]).copy()
-
-       if not df_disp.empty:
-           # RETORNO DA LÓGICA ORIGINAL DE JITTER E PLOTAGEM
-           df_disp['cn_j'] = df_disp['cn'] + np.random.uniform(-0.02, 0.02, len(df_disp))
-           df_disp[f'{eixo_y}_j'] = df_disp[eixo_y] + np.random.uniform(-0.02, 0.02, len(df_disp))
-           fig_scat = px.scatter(
-               df_disp, x='cn_j', y=f'{eixo_y}_j', color='status',
-               hover_name='serie',
-               hover_data={'cn': ':.3f', eixo_y: ':.3f', 'pos': True, 'Bancada': True, 'n_ensaio': True},
-               color_discrete_map={'APROVADO': '#16a34a', 'REPROVADO': '#dc2626', 'ZONA CRÍTICA': '#f1c40f'},
-               labels={'cn_j': 'Erro Carga Nominal (%)', f'{eixo_y}_j': f'Erro Carga {eixo_y.upper()} (%)'}
-           )
-           fig_scat.add_shape(type="rect", x0=-2, y0=-2, x1=2, y1=2, line=dict(color="Red", dash="dash", width=2))
-           fig_scat.update_xaxes(range=[-4.5, 4.5], zeroline=True, zerolinecolor='black', gridcolor='lightgray')
-           fig_scat.update_yaxes(range=[-4.5, 4.5], zeroline=True, zerolinecolor='black', gridcolor='lightgray')
-           fig_scat.update_layout(height=550, template="plotly_white", margin=dict(l=0, r=0, t=20, b=40), autosize=True)
-           st.plotly_chart(fig_scat, use_container_width=True)
-           
-           # --- TABELA DE DISPERSÃO REINSERIDA AQUI ---
-           st.markdown("##### 📝 Resumo Estatístico de Precisão (IPEM)")
-           df_resumo = df_disp.groupby('Bancada').agg({'cn': ['mean', 'std'], 'cp': ['mean', 'std'], 'ci': ['mean', 'std']})
-           df_resumo.columns = ['cn', 'cn_std', 'cp', 'cp_std', 'ci', 'ci_std']
-           st.dataframe(df_resumo.round(4), use_container_width=True)
-           
-           # --- SEÇÃO DO PDF NO FINAL ---
-           st.markdown("---")
-           c_pdf1, c_pdf2 = st.columns([3, 1])
-           with c_pdf1:
-               st.write("### 📜 Exportação de Relatório Técnico")
-           with c_pdf2:
-               try:
-                   pdf_final = gerar_pdf_profissional(df_resumo, f"{meses_n[mes_sel-1]} / {ano_sel}")
-                   st.download_button(label="📄 Gerar Laudo PDF", data=pdf_final, file_name=f"Laudo_IPEM_{mes_sel}.pdf", mime="application/pdf")
-               except Exception as e:
-                   st.error(f"Erro: {e}")
+       secao_dispersao(df_met, f"{meses_n[mes_sel-1]} / {ano_sel}", mes_sel)
+
+   with tabs[3]:
+       secao_cep(df_completo, ano_sel, mes_sel)
+
+   with tabs[4]:
+       secao_temperatura()
 # =======================================================================
 # [FIM DO BLOCO ISOLADO]
 
@@ -291,208 +430,314 @@ def pagina_metrologia_avancada(df_completo):
 # [BLOCO 02] - CARREGAMENTO DE DADOS (ORIGINAL)
 # =======================================================================
 
-@st.cache_data(ttl=600)
+@st.cache_resource
+def fonte_dados():
+    """Fonte das planilhas escolhida por FONTE_DADOS (padrão: Google Sheets de produção); ver fontes.py."""
+    return fonte_do_ambiente(fonte_producao())
+
+@st.cache_resource
+def _estado_snapshot():
+    """Retrato em disco da última carga (ver snapshot.py) e a carga em uso no processo.
+
+    'assinatura'/'base': conteúdo das abas e df_completo atuais; uma recarga com a mesma assinatura reaproveita
+    a base (e a versão, mantendo os caches por versão). 'posicoes': tabela de posições por versão da carga (a
+    em uso e, durante uma recarga, a que está chegando); 'avaliando': versões sendo avaliadas agora.
+    'erro': falha da última gravação do retrato (None quando gravou), exibida na barra lateral.
+    """
+    return {
+        "trava": threading.Lock(), "versao_regras": versao_regras_da_fonte(fonte_dados().descricao),
+        "assinatura": None, "base": None, "posicoes": {}, "avaliando": {}, "erro": None,
+    }
+
+def posicoes_da_carga(df_completo):
+    """Tabela de posições da carga, montada uma única vez por versão (o retrato já a traz pronta).
+
+    A avaliação roda fora da trava: quem pede outra versão (ex.: a carga anterior, servida durante a
+    recarga) não espera; quem pede a mesma aguarda a avaliação em andamento em vez de repeti-la.
+    """
+    estado = _estado_snapshot()
+    versao = versao_dados(df_completo)
+    with estado["trava"]:
+        posicoes = estado["posicoes"].get(versao)
+        if posicoes is not None:
+            return posicoes
+        pronta = estado["avaliando"].get(versao)
+        avaliar = pronta is None
+        if avaliar:
+            pronta = estado["avaliando"][versao] = threading.Event()
+    if not avaliar:
+        pronta.wait()
+        # Se a avaliação de quem chegou primeiro falhou, esta sessão tenta de novo
+        return posicoes_da_carga(df_completo)
+    try:
+        posicoes = _avaliar_base(df_completo, versao)
+        with estado["trava"]:
+            estado["posicoes"][versao] = posicoes
+        return posicoes
+    finally:
+        with estado["trava"]:
+            del estado["avaliando"][versao]
+        pronta.set()
+
+def _avaliar_base(df_completo, versao):
+    """montar_tabela_posicoes da base inteira; no modo 'processos', por mês x bancada no pool."""
+    executor = avaliador()
+    if executor.modo == "serial" or df_completo.empty:
+        return montar_tabela_posicoes(df_completo)
+    partes = executor.mapear(df_completo, montar_tabela_posicoes, particoes_mes_bancada(IndicePeriodo(df_completo)),
+                             chave=versao)
+    return juntar_por_linha(partes, df_completo)
+
+def _retrato_inicial():
+    """Base do retrato em disco para o esquema e as regras atuais (None se não há)."""
+    estado = _estado_snapshot()
+    retrato = ler_snapshot(DIRETORIO_SNAPSHOT, estado["versao_regras"])
+    if retrato is None:
+        return None
+    base = retrato["base"]
+    with estado["trava"]:
+        estado["assinatura"], estado["base"] = retrato["meta"]["assinatura"], base
+        estado["posicoes"] = {versao_dados(base): retrato["posicoes"]}
+    return base
+
+def _buscar_base():
+    """Lê as abas da fonte; se o conteúdo mudou, monta a base nova, avalia as posições e regrava o retrato.
+    Com o mesmo conteúdo devolve a base em uso (mesma versão)."""
+    estado = _estado_snapshot()
+    brutos = fonte_dados().abas()
+    assinatura = assinatura_brutos(brutos)
+    if assinatura == estado["assinatura"] and estado["base"] is not None:
+        return estado["base"]
+    base = montar_base(brutos)
+    posicoes = posicoes_da_carga(base)
+    try:
+        gravar_snapshot(DIRETORIO_SNAPSHOT, estado["versao_regras"], brutos, base, posicoes)
+        estado["erro"] = None
+    except Exception as e:
+        log.exception("Retrato em disco não gravado")
+        estado["erro"] = f"{type(e).__name__}: {e}"
+    # Publicada a base nova, a tabela da anterior sai do cache
+    with estado["trava"]:
+        estado["assinatura"], estado["base"] = assinatura, base
+        estado["posicoes"] = {versao_dados(base): posicoes}
+    return base
+
+@st.cache_resource
+def recarga_dados():
+    """Recarga única da planilha das bancadas. Google Sheets: validade de ~10 min com sorteio e no máximo uma
+    busca por minuto; pastas locais: recarga assim que um arquivo muda. Na partida do processo o retrato em
+    disco é servido enquanto a primeira busca roda em segundo plano."""
+    fonte = fonte_dados()
+    return RecargaCoalescida("Planilha das bancadas", _buscar_base, ttl=fonte.ttl,
+                             intervalo_minimo=fonte.intervalo_minimo, inicial=_retrato_inicial)
+
+def descricao_fonte():
+    """Descrição da fonte em uso (FONTE_DADOS) para mensagens; a variável crua se a fonte nem foi criada."""
+    try:
+        return fonte_dados().descricao
+    except Exception:
+        return os.environ.get("FONTE_DADOS") or "sheets"
+
 def carregar_dados():
+    """Base única do processo (compartilhada entre sessões, somente leitura).
+    As linhas vêm ordenadas por data; os filtros de período usam indice_base (busca binária).
+
+    Uma só busca por vez: as sessões recebem a carga anterior enquanto a nova é baixada (ver recarga.py).
+    """
     try:
-        sheet_id = "1QxZ7bCSBClsmXLG1JOrFKNkMWZMK3P5Sp4LP81HV3Rs"
-        url_banc10 = f"https://docs.google.com/spreadsheets/d/{sheet_id}/gviz/tq?tqx=out:csv&sheet=BANC_10_POS"
-        url_banc20 = f"https://docs.google.com/spreadsheets/d/{sheet_id}/gviz/tq?tqx=out:csv&sheet=BANC_20_POS"
-        
-        df_banc10 = pd.read_csv(url_banc10)
-        df_banc10['Bancada_Nome'] = 'BANC_10_POS'
-        
-        df_banc20 = pd.read_csv(url_banc20)
-        df_banc20['Bancada_Nome'] = 'BANC_20_POS'
-        
-        df_completo = pd.concat([df_banc10, df_banc20], ignore_index=True)
-        
-        # Conversão e limpeza de datas
-        df_completo['Data_dt'] = pd.to_datetime(df_completo['Data'], errors='coerce', dayfirst=True)
-        df_completo = df_completo.dropna(subset=['Data_dt'])
-        df_completo['Data'] = df_completo['Data_dt'].dt.strftime('%d/%m/%y')
-        
-        return df_completo
+        if fonte_dados().mudou():
+            recarga_dados().expirar()
+            recarga_tabela_mestra().expirar()
+        return recarga_dados().obter()
     except Exception as e:
-        st.error(f"ERRO AO ACESSAR GOOGLE SHEETS: {e}")
+        st.error(f"ERRO AO ACESSAR A FONTE DE DADOS ({descricao_fonte()}): {e}")
         return pd.DataFrame()
 
+@st.cache_resource
+def _estado_resumo_series():
+    """Resumo por série acumulado entre cargas; cada recarga só incorpora os ensaios novos."""
+    return {"trava": threading.Lock(), "estado": None}
+
+def carregar_historico_series():
+    """Histórico por número de série (ordenado por série e data), montado junto com a carga dos dados."""
+    df_completo = carregar_dados()
+    return _historico_series(df_completo, versao_dados(df_completo))
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def _historico_series(_df_completo, versao):
+    df_completo = _df_completo
+    posicoes = posicoes_da_carga(df_completo)
+    acumulado = _estado_resumo_series()
+    with acumulado["trava"]:
+        acumulado["estado"] = atualizar_resumo_series(acumulado["estado"], posicoes, chaves_ensaios(df_completo))
+        resumo = acumulado["estado"]["resumo"]
+    return montar_historico_series(posicoes, resumo)
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def carregar_leituras_cep(_df_completo, versao):
+    """Leituras CN/CP/CI em formato longo para as cartas de controle ('versao' identifica a carga)."""
+    return leituras_cep(_df_completo)
+
+@st.cache_resource
+def _estado_monitores_cep():
+    """Monitores CEP por janela de referência, mantidos entre cargas; cada recarga só confere as linhas novas."""
+    return {"trava": threading.Lock(), "monitores": {}}
+
+def monitor_cep(df_completo, inicio_base, fim_base):
+    """Monitor com limites da janela [inicio_base, fim_base], já atualizado com a carga df_completo."""
+    versao = versao_dados(df_completo)
+    leituras = carregar_leituras_cep(df_completo, versao)
+    acumulado = _estado_monitores_cep()
+    with acumulado["trava"]:
+        entrada = acumulado["monitores"].get((inicio_base, fim_base))
+        if entrada is None:
+            if len(acumulado["monitores"]) >= 8:
+                acumulado["monitores"].pop(next(iter(acumulado["monitores"])))
+            entrada = {"monitor": MonitorCEP(calcular_limites(leituras, inicio_base, fim_base)), "versao": None}
+            acumulado["monitores"][(inicio_base, fim_base)] = entrada
+        if entrada["versao"] != versao:
+            entrada["monitor"].atualizar(leituras, chaves_ensaios(df_completo))
+            entrada["versao"] = versao
+        return entrada["monitor"]
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def carregar_matriz_bancadas(_df_completo, versao):
+    """Matriz bancada x posição x ponto x mês x classe montada da tabela de posições já avaliada."""
+    matriz = MatrizBancadas()
+    matriz.adicionar(None, posicoes_da_carga(_df_completo))
+    return matriz.resultado()
+
+@st.cache_resource
+def _estado_erro_temperatura():
+    """Erro e reprovações por faixa de temperatura acumulados entre cargas; cada recarga só soma os ensaios novos."""
+    return {"trava": threading.Lock(), "estado": None}
+
+def carregar_erro_temperatura():
+    """Somas por (Bancada, pos, ponto, faixa de temperatura) de todo o histórico (ver ErroPorTemperatura)."""
+    df_completo = carregar_dados()
+    return _erro_temperatura(df_completo, versao_dados(df_completo))
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def _erro_temperatura(_df_completo, versao):
+    df_completo = _df_completo
+    posicoes = posicoes_da_carga(df_completo)
+    acumulado = _estado_erro_temperatura()
+    with acumulado["trava"]:
+        acumulado["estado"] = atualizar_erro_temperatura(acumulado["estado"], posicoes, chaves_ensaios(df_completo))
+        return acumulado["estado"]["agregador"].resultado()
+
+@st.cache_resource
+def _estado_qualidade():
+    """Quarentena e métricas de qualidade acumuladas entre cargas; cada recarga só confere as linhas novas."""
+    return {"trava": threading.Lock(), "estado": None}
+
+def carregar_qualidade():
+    """Etapa de qualidade da carga: células suspeitas (quarentena) e contagens por bancada e coluna."""
+    df_completo = carregar_dados()
+    return _qualidade(df_completo, versao_dados(df_completo))
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def _qualidade(_df_completo, versao):
+    df_completo = _df_completo
+    acumulado = _estado_qualidade()
+    with acumulado["trava"]:
+        acumulado["estado"] = atualizar_qualidade(acumulado["estado"], df_completo, chaves_ensaios(df_completo))
+        return acumulado["estado"]
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def indice_base(_df_completo, versao):
+    """Índice por data e bancada da base da carga ('versao' identifica a carga)."""
+    return IndicePeriodo(_df_completo)
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def bits_classe_base(_df_completo, versao):
+    """Bits de classe (1, 2, A-D) de cada linha da base, lidos uma vez por carga."""
+    return bits_classe(_df_completo['Classe'])
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def indice_posicoes(_df_completo, versao):
+    """Índice por data e bancada da tabela de posições (mesma ordem de linhas da base)."""
+    return IndicePeriodo(posicoes_da_carga(_df_completo))
+
+def versao_dados(df_completo):
+    """Versão da carga atual (muda a cada recarga da planilha)."""
+    return df_completo.attrs.get('versao', '')
+
 # =======================================================================
 # [BLOCO 03] - FUNÇÕES AUXILIARES (ORIGINAL)
 # =======================================================================
 
-def valor_num(v):
-    """Converte strings de erro em números flutuantes tratáveis."""
-    try:
-        if pd.isna(v):
-            return None
-        return float(str(v).replace("%", "").replace(",", "."))
-    except (ValueError, TypeError):
-        return None
+@st.cache_resource
+def avaliador():
+    """Executor das avaliações pesadas (MODO_AVALIACAO: 'serial' ou 'processos', ver paralelo.py)."""
+    return avaliador_do_ambiente()
 
-def texto(v):
-    """Trata valores nulos para exibição em tabelas."""
-    if pd.isna(v) or v is None:
-        return "-"
-    return str(v)
-
-def calcular_estatisticas(todos_medidores):
-    """Calcula o resumo estatístico para os cards do dashboard."""
-    total = len(todos_medidores)
-    aprovados = sum(1 for m in todos_medidores if m['status'] == 'APROVADO')
-    reprovados = sum(1 for m in todos_medidores if m['status'] == 'REPROVADO')
-    consumidor = sum(1 for m in todos_medidores if m['status'] == 'CONTRA O CONSUMIDOR')
-    
-    return {
-        "total": total, 
-        "aprovados": aprovados, 
-        "reprovados": reprovados, 
-        "consumidor": consumidor
-    }
+@st.cache_resource
+def fila_exportacao():
+    """Fila de exportações do processo (compartilhada entre sessões)."""
+    return FilaExportacao()
 
-def to_excel(df):
-    """Gera o binário do arquivo Excel para download."""
-    from io import BytesIO
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Relatorio')
-    processed_data = output.getvalue()
-    return processed_data
+def botao_exportacao(rotulo, chave, funcao, *args, nome_arquivo, mime=None, descricao=None):
+    """Botão de exportação em segundo plano: prepara o arquivo na fila e, quando pronto, vira download.
 
-# =======================================================================
-# [BLOCO 04A] - VERSÃO ULTRA SIMPLIFICADA
-# =======================================================================
-
-def valor_num(valor):
-    """Converte valor para float, retorna None se inválido"""
-    if pd.isna(valor) or valor == "" or str(valor).strip() in ["-", "None", "SEM LEITURA", "ERRO"]:
-        return None
-    try:
-        if isinstance(valor, str):
-            valor = valor.strip().replace(',', '.')
-        return float(valor)
-    except:
-        return None
+    'chave' identifica o conteúdo (tipo + versão + parâmetros): a mesma chave em outra sessão reaproveita a tarefa.
+    As tarefas da sessão também aparecem no painel 'Exportações' da barra lateral.
+    """
+    fila = fila_exportacao()
+    tid = id_tarefa(chave)
+    tarefa = fila.tarefa(tid)
+    if tarefa is None or tarefa.status == ERRO:
+        if tarefa is not None:
+            st.caption(f"⚠️ A última tentativa falhou: {tarefa.erro.strip().splitlines()[-1]}")
+        if st.button(f"{rotulo} (preparar)", key=f"exp_{tid}", use_container_width=True):
+            fila.submeter(chave, descricao or rotulo, funcao, *args, nome_arquivo=nome_arquivo, mime=mime)
+            st.session_state.setdefault("exportacoes", [])
+            if tid not in st.session_state["exportacoes"]:
+                st.session_state["exportacoes"].append(tid)
+            # Página inteira de novo: o painel da barra lateral passa a acompanhar a tarefa
+            st.rerun()
+    if tarefa is not None and tarefa.status in (NA_FILA, EXECUTANDO):
+        st.progress(tarefa.progresso, text=f"{rotulo}: {tarefa.status}… pode continuar navegando")
+    elif tarefa is not None and tarefa.status == PRONTO:
+        st.download_button(rotulo, tarefa.resultado, file_name=tarefa.nome_arquivo, mime=tarefa.mime,
+                           key=f"dl_{tid}", use_container_width=True)
+
+def _tarefas_sessao():
+    fila = fila_exportacao()
+    return [t for t in map(fila.tarefa, st.session_state.get("exportacoes", [])) if t is not None]
+
+def _pendentes(tarefas):
+    return any(t.status in (NA_FILA, EXECUTANDO) for t in tarefas)
+
+@fragmento_periodico(2)
+def _exportacoes_em_andamento():
+    """Redesenha a lista a cada 2 s; quando a última tarefa termina, refaz a página uma vez e o painel
+    volta a ser estático (os botões de download das seções aparecem nessa mesma passada)."""
+    tarefas = _tarefas_sessao()
+    if not _pendentes(tarefas):
+        st.rerun()
+    listar_exportacoes(tarefas)
+
+def painel_exportacoes():
+    """Exportações desta sessão, com progresso; só se atualiza sozinho enquanto houver tarefa pendente."""
+    tarefas = _tarefas_sessao()
+    if _pendentes(tarefas):
+        _exportacoes_em_andamento()
+    else:
+        listar_exportacoes(tarefas)
 
-def texto(valor):
-    """Formata valor como texto, remove '.0' desnecessários"""
-    if pd.isna(valor) or str(valor).strip() in ["-", "None"]:
-        return "-"
-    val_str = str(valor).strip()
-    if val_str.endswith('.0'):
-        return val_str[:-2]
-    return val_str
-
-def processar_ensaio(row, classe_banc20=None):
-    """VERSÃO SIMPLIFICADA - SÓ LÊ DA PLANILHA, NÃO CALCULA NADA"""
-    medidores = []
-    bancada = row.get('Bancada_Nome')
-    tamanho_bancada = 20 if bancada == 'BANC_20_POS' else 10
-    
-    classe = str(row.get("Classe", "")).upper()
-    if not classe: 
-        classe = 'B'
-    limite_exat = 4.0 if "ELETROMEC" in classe else 1.3
-
-    for pos in range(1, tamanho_bancada + 1):
-        serie = texto(row.get(f"P{pos}_Série"))
-        cn = row.get(f"P{pos}_CN")
-        cp = row.get(f"P{pos}_CP")
-        ci = row.get(f"P{pos}_CI")
-        mv = row.get(f"P{pos}_MV")
-        r_ini = row.get(f"P{pos}_REG_Inicio")
-        r_fim = row.get(f"P{pos}_REG_Fim")
-        
-        # *** LÊ O ERRO DA PLANILHA - NÃO CALCULA ***
-        reg_erro = row.get(f"P{pos}_REG_Erro")
-        
-        v_cn = valor_num(cn)
-        v_cp = valor_num(cp)
-        v_ci = valor_num(ci)
-        v_reg_erro = valor_num(reg_erro)
-        mv_str = str(texto(mv)).strip().upper()
-
-        # --- POSIÇÃO VAZIA ---
-        if v_cn is None and v_cp is None and v_ci is None:
-            medidores.append({
-                "pos": pos, "serie": serie, "cn": "-", "cp": "-", "ci": "-", "mv": "-",
-                "reg_inicio": "-", "reg_fim": "-", "reg_erro": "-",
-                "status": "Não Ligou / Não Ensaido", "detalhe": "", "motivo": "N/A", 
-                "limite": limite_exat, "erros_pontuais": []
-            })
-            continue
-
-        erros_list = []
-        erros_pontuais = []
-        
-        # --- 1. EXATIDÃO ---
-        if v_cn is not None and abs(v_cn) > limite_exat: 
-            erros_pontuais.append('CN')
-            erros_list.append("Exatidão")
-        if v_cp is not None and abs(v_cp) > limite_exat: 
-            erros_pontuais.append('CP')
-            erros_list.append("Exatidão")
-        if v_ci is not None and abs(v_ci) > limite_exat: 
-            erros_pontuais.append('CI')
-            erros_list.append("Exatidão")
-
-        # --- 2. MOSTRADOR ---
-        if (bancada == 'BANC_10_POS' and mv_str != "+") or \
-           (bancada != 'BANC_10_POS' and mv_str != "OK"):
-            erros_list.append("Mostrador/MV")
-
-        # --- 3. REGISTRADOR - LÓGICA ULTRA SIMPLES ---
-        reg_display = "-"
-        
-        if v_reg_erro is not None:
-            # SE FOR 0, 0.01 ou 1.0 = APROVADO
-            if v_reg_erro <= 1.5:
-                if v_reg_erro == 0 or v_reg_erro < 0.05:
-                    reg_display = "0.01"
-                elif v_reg_erro <= 1.05:
-                    reg_display = "1.0"
-                else:
-                    reg_display = f"{v_reg_erro:.2f}"
-                # *** NÃO ADICIONA ERRO ***
-            
-            # SE FOR > 1.5 = REPROVADO
-            else:
-                reg_display = "ERRO" if v_reg_erro > 100 else f"{v_reg_erro:.2f}"
-                erros_list.append("Registrador")  # ← SÓ ADICIONA AQUI!
-
-        # --- 4. STATUS FINAL ---
-        erro_exat = len([e for e in erros_list if e == "Exatidão"]) > 0
-        erro_reg = "Registrador" in erros_list
-        erro_mv = "Mostrador/MV" in erros_list
-        
-        if (erro_exat and erro_reg) or (erro_exat and erro_mv):
-            status = "CONTRA O CONSUMIDOR"
-            motivo = "Contra Consumidor"
-        elif len(erros_list) > 0:
-            status = "REPROVADO"
-            motivo = " / ".join(sorted(list(set(erros_list))))
+def listar_exportacoes(tarefas):
+    if not tarefas:
+        return
+    st.markdown("#### 📦 Exportações")
+    for t in reversed(tarefas):
+        if t.status == PRONTO:
+            st.download_button(f"📥 {t.descricao}", t.resultado, file_name=t.nome_arquivo, mime=t.mime,
+                               key=f"painel_{t.id}", use_container_width=True)
+        elif t.status == ERRO:
+            st.caption(f"⚠️ {t.descricao}: erro")
         else:
-            status = "APROVADO"
-            motivo = "Nenhum"
-
-        medidores.append({
-            "pos": pos, 
-            "serie": serie, 
-            "cn": texto(cn), 
-            "cp": texto(cp), 
-            "ci": texto(ci), 
-            "mv": mv_str,
-            "reg_inicio": texto(r_ini), 
-            "reg_fim": texto(r_fim), 
-            "reg_erro": reg_display,
-            "status": status, 
-            "detalhe": "", 
-            "motivo": motivo, 
-            "limite": limite_exat,
-            "erros_pontuais": erros_pontuais
-        })
-    
-    return medidores
-
+            st.progress(t.progresso, text=f"{t.descricao}: {t.status}")
 
 # =======================================================================
 # [BLOCO 04B] - ESTATÍSTICAS (SEM ALTERAÇÕES)
@@ -505,79 +750,78 @@ def calcular_estatisticas(medidores):
     con = sum(1 for m in medidores if m['status'] == 'CONTRA O CONSUMIDOR')
     return {"total": total, "aprovados": apr, "reprovados": rep, "consumidor": con}
 
-def calcular_auditoria_real(df):
-    t_pos, t_ens, t_apr, t_rep = 0, 0, 0, 0
-    r_exat, r_reg, r_mv, r_cons = 0, 0, 0, 0
-    
-    for _, row in df.iterrows():
-        medidores = processar_ensaio(row)
-        for m in medidores:
-            t_pos += 1
-            if m['status'] != "Não Ligou / Não Ensaido":
-                t_ens += 1
-                if m['status'] == "APROVADO": 
-                    t_apr += 1
-                else:
-                    t_rep += 1
-                    if "Exatidão" in m['motivo']: r_exat += 1
-                    if "Registrador" in m['motivo']: r_reg += 1
-                    if "Mostrador/MV" in m['motivo']: r_mv += 1
-                    if m['status'] == "CONTRA O CONSUMIDOR": r_cons += 1
-    
-    taxa = (t_apr / t_ens * 100) if t_ens > 0 else 0
-    
-    return {
-        "total_posicoes": t_pos, "total_ensaiadas": t_ens, "total_aprovadas": t_apr, 
-        "total_reprovadas": t_rep, "taxa_aprovacao": taxa, "reprov_exatidao": r_exat, 
-        "reprov_registrador": r_reg, "reprov_mv": r_mv, "reprov_consumidor": r_cons
-    }
-    
 # =======================================================================
 # [BLOCO 05] - COMPONENTES VISUAIS (VERSÃO COM ESPAÇAMENTO NOS CARDS)
 # =======================================================================
 
+# Estilos dos cards e cabeçalhos de ensaio: definidos uma vez e referenciados por classe,
+# em vez de repetidos inline em cada card.
+CSS_CARDS = """
+<style>
+.grade-cards{display:grid;grid-template-columns:repeat(5,minmax(0,1fr));gap:1rem;margin-bottom:1.5rem}
+.cm{border-radius:12px;padding:16px;font-size:14px;box-shadow:0 2px 8px rgba(0,0,0,.1);border-left:6px solid rgba(0,0,0,.1);display:flex;flex-direction:column;justify-content:space-between;min-height:380px;background:#f3f4f6}
+.cm.apr{background:#dcfce7}.cm.rep{background:#fee2e2}.cm.cc{background:#ede9fe}.cm.nl{background:#e5e7eb}
+.cm h5{font-size:18px;font-weight:700;border-bottom:2px solid rgba(0,0,0,.15);margin:0 0 12px;padding:0 0 8px}
+.cm p{margin:0 0 12px}
+.cm .bx{background:rgba(0,0,0,.05);padding:10px;border-radius:8px;margin-bottom:12px}
+.cm .bx.rg{background:rgba(0,0,0,.03);border:1px dashed rgba(0,0,0,.1)}
+.cm .bx>b{display:block;margin-bottom:8px}.cm .rg>b{font-size:12px}
+.cm .g2{display:grid;grid-template-columns:1fr 1fr;gap:4px 12px}
+.cm .er{grid-column:span 2;font-weight:bold;border-top:1px solid rgba(0,0,0,.05);padding-top:4px}
+.cm .st{padding:10px;margin-top:16px;border-radius:8px;font-weight:800;font-size:15px;text-align:center;background:rgba(0,0,0,.08)}
+.cm .dt{margin-top:8px;font-size:12px;text-align:center}
+.cab-ensaio{background:#f8fafc;border:1px solid #e2e8f0;padding:10px 15px;border-radius:10px;margin-bottom:15px;display:flex;justify-content:space-between;align-items:center}
+.cab-ensaio b{font-size:1.1em}.cab-ensaio span{color:#475569}
+</style>
+"""
+CLASSE_STATUS_CARD = {
+    "APROVADO": "apr", "REPROVADO": "rep", "CONTRA O CONSUMIDOR": "cc", "Não Ligou / Não Ensaido": "nl"
+}
+MAX_CARDS_HTML = 5000
+
+def html_card(medidor):
+    """HTML do card de um medidor (classes de CSS_CARDS, sem estilos inline)."""
+    m = medidor
+    return (
+        f'<div class="cm {CLASSE_STATUS_CARD.get(m["status"], "")}"><div>'
+        f'<h5>🔢 Posição {m["pos"]}</h5><p><b>Série:</b> {m["serie"]}</p>'
+        f'<div class="bx"><b>Exatidão (±{m["limite"]}%)</b><div class="g2">'
+        f'<span><b>CN:</b> {m["cn"]}%</span><span><b>CP:</b> {m["cp"]}%</span>'
+        f'<span><b>CI:</b> {m["ci"]}%</span><span><b>MV:</b> {m["mv"]}</span></div></div>'
+        f'<div class="bx rg"><b>📑 Registrador (kWh)</b><div class="g2">'
+        f'<span><b>Início:</b> {m["reg_inicio"]}</span><span><b>Fim:</b> {m["reg_fim"]}</span>'
+        f'<span class="er">Erro: {m["reg_erro"]}</span></div></div>'
+        f'</div><div><div class="st">{m["status"]}</div><div class="dt">{m["detalhe"]}</div></div></div>'
+    )
+
+def html_cabecalho_ensaio(n_ensaio, bancada, temperatura):
+    return (f'<div class="cab-ensaio"><b>📋 Ensaio #{n_ensaio}</b>'
+            f'<span><strong>Bancada:</strong> {bancada.replace("_", " ")}</span><span>🌡️ {temperatura}</span></div>')
+
+@st.cache_resource
+def _cache_html_cards():
+    """HTML pronto por (versão dos dados, linha do ensaio, posição), compartilhado entre sessões."""
+    return {"trava": threading.Lock(), "html": OrderedDict()}
+
+def html_card_em_cache(versao, linha, medidor):
+    """Card já formatado quando a mesma posição do mesmo ensaio foi desenhada nesta versão dos dados."""
+    cache = _cache_html_cards()
+    chave = (versao, linha, medidor["pos"])
+    with cache["trava"]:
+        html = cache["html"].get(chave)
+        if html is not None:
+            cache["html"].move_to_end(chave)
+            return html
+    html = html_card(medidor)
+    with cache["trava"]:
+        cache["html"][chave] = html
+        while len(cache["html"]) > MAX_CARDS_HTML:
+            cache["html"].popitem(last=False)
+    return html
+
 def renderizar_card(medidor):
-    """Renderiza o card individual de cada medidor com cores dinâmicas por status."""
-    status_cor = {
-        "APROVADO": "#dcfce7", 
-        "REPROVADO": "#fee2e2", 
-        "CONTRA O CONSUMIDOR": "#ede9fe", 
-        "Não Ligou / Não Ensaido": "#e5e7eb"
-    }
-    cor = status_cor.get(medidor['status'], "#f3f4f6")
-    
-    conteudo_html = f"""
-<div style="background:{cor}; border-radius:12px; padding:16px; font-size:14px; box-shadow:0 2px 8px rgba(0,0,0,0.1); border-left: 6px solid rgba(0,0,0,0.1); display: flex; flex-direction: column; justify-content: space-between; min-height: 380px;">
-<div>
-<div style="font-size:18px; font-weight:700; border-bottom:2px solid rgba(0,0,0,0.15); margin-bottom:12px; padding-bottom: 8px;">🔢 Posição {medidor['pos']}</div>
-<p style="margin:0 0 12px 0;"><b>Série:</b> {medidor['serie']}</p>
-
-<div style="background: rgba(0,0,0,0.05); padding: 10px; border-radius: 8px; margin-bottom:12px;">
-<b style="display: block; margin-bottom: 8px;">Exatidão (±{medidor['limite']}%)</b>
-<div style="display: grid; grid-template-columns: 1fr 1fr; gap: 4px 12px;">
-<span><b>CN:</b> {medidor['cn']}%</span><span><b>CP:</b> {medidor['cp']}%</span>
-<span><b>CI:</b> {medidor['ci']}%</span><span><b>MV:</b> {medidor['mv']}</span>
-</div>
-</div>
-
-<div style="background: rgba(0,0,0,0.03); padding: 10px; border-radius: 8px; border: 1px dashed rgba(0,0,0,0.1); margin-bottom:12px;">
-<b style="display: block; margin-bottom: 8px; font-size: 12px;">📑 Registrador (kWh)</b>
-<div style="display: grid; grid-template-columns: 1fr 1fr; gap: 4px 12px; font-size: 14px;">
-<span><b>Início:</b> {medidor['reg_inicio']}</span>
-<span><b>Fim:</b> {medidor['reg_fim']}</span>
-<span style="grid-column: span 2; font-weight: bold; border-top: 1px solid rgba(0,0,0,0.05); padding-top: 4px;">Erro: {medidor['reg_erro']}</span>
-</div>
-</div>
-
-</div>
-<div>
-<div style="padding:10px; margin-top: 16px; border-radius:8px; font-weight:800; font-size: 15px; text-align:center; background: rgba(0,0,0,0.08);">{medidor['status']}</div>
-<div style="margin-top:8px; font-size:12px; text-align:center;">{medidor['detalhe']}</div>
-</div>
-</div>
-""".strip()
-    
-    st.markdown(conteudo_html, unsafe_allow_html=True)
+    """Renderiza o card individual de cada medidor (CSS_CARDS é emitido uma vez antes dos cards)."""
+    st.markdown(html_card(medidor), unsafe_allow_html=True)
 
 def renderizar_resumo(stats):
     """Renderiza as métricas de resumo com espaçamento entre o primeiro e os demais cards."""
@@ -607,21 +851,8 @@ def renderizar_resumo(stats):
     with c4:
         st.markdown(f'<div class="metric-card"><div class="metric-value" style="color:#7c3aed;">{stats["consumidor"]}</div><div class="metric-label">Contra Consumidor</div></div>', unsafe_allow_html=True)
 
-def renderizar_cabecalho_ensaio(n_ensaio, bancada, temperatura):
-    """Cria uma barra de informações compacta para identificar o ensaio atual."""
-    st.markdown(f"""
-        <div style="background-color: #f8fafc; border: 1px solid #e2e8f0; padding: 10px 15px; 
-                    border-radius: 10px; margin-bottom: 15px; display: flex; justify-content: space-between; align-items: center;">
-            <span style="font-weight: bold; font-size: 1.1em;">📋 Ensaio #{n_ensaio}</span>
-            <span style="color: #475569;"><strong>Bancada:</strong> {bancada.replace('_', ' ')}</span>
-            <span style="color: #475569;">🌡️ {temperatura}</span>
-        </div>
-    """, unsafe_allow_html=True)
-
 def renderizar_grafico_reprovacoes(medidores):
     """Gera um gráfico horizontal com os motivos das reprovações."""
-    import pandas as pd
-    import plotly.express as px
     motivos = [m['motivo'] for m in medidores if m['status'] in ['REPROVADO', 'CONTRA O CONSUMIDOR']]
     if not motivos:
         return
@@ -682,6 +913,99 @@ def renderizar_botao_scroll_topo():
 # [BLOCO 06] - PÁGINA: VISÃO DIÁRIA (EVOLUÍDA E PRESERVADA)
 # =========================================================
 
+@st.cache_data(show_spinner=False)
+def avaliar_ensaios_dia(df_filtrado):
+    """Avalia uma vez os ensaios do dia/bancada. Os filtros de status e irregularidade são aplicados depois,
+    sobre o resultado em cache, então mexer neles não reprocessa nenhuma linha.
+
+    Os medidores ficam numa lista única, na ordem dos ensaios, alinhada com os bits de status e de causa
+    e com o número do ensaio de cada um ('ensaio_do_medidor')."""
+    posicoes = montar_tabela_posicoes(df_filtrado)
+    ensaio_do_medidor = pd.Index(df_filtrado.index).get_indexer(posicoes['linha'])
+    ordem = np.argsort(ensaio_do_medidor, kind='stable')
+    posicoes, ensaio_do_medidor = posicoes.iloc[ordem], ensaio_do_medidor[ordem]
+    medidores = para_medidores(posicoes)
+    inicios = np.searchsorted(ensaio_do_medidor, np.arange(len(df_filtrado) + 1))
+    ensaios = []
+    for i, (linha, row) in enumerate(zip(df_filtrado.index, df_filtrado.itertuples(index=False))):
+        ensaios.append({
+            "linha": linha,
+            "n_ensaio": getattr(row, "N_ENSAIO", "N/A"),
+            "bancada": row.Bancada_Nome,
+            "temperatura": getattr(row, "Temperatura", "--"),
+            "medidores": medidores[inicios[i]:inicios[i + 1]]
+        })
+    return {
+        "ensaios": ensaios,
+        "medidores": medidores,
+        "ensaio_do_medidor": ensaio_do_medidor,
+        "bits_status": posicoes['bits_status'].to_numpy(),
+        "bits_causa": posicoes['bits_causa'].to_numpy(),
+        "auditoria": contar_auditoria(posicoes),
+        # Contagem global para o card "Não Ligou" (independente de filtro de status)
+        "total_nao_ligou": int((posicoes['status'] == 'Não Ligou / Não Ensaido').sum()),
+        "total_consumidor": int((posicoes['status'] == 'CONTRA O CONSUMIDOR').sum())
+    }
+
+def filtrar_ensaios_dia(dados_dia, filtro_status, filtro_irregularidade):
+    """Aplica os filtros de interface sobre os ensaios já avaliados: uma máscara sobre os bits de todos os medidores."""
+    selecionados = np.ones(len(dados_dia["medidores"]), dtype=bool)
+    if filtro_status:
+        selecionados &= filtro_bits(dados_dia["bits_status"], STATUS_FILTRO, filtro_status)
+    if filtro_irregularidade:
+        selecionados &= filtro_bits(dados_dia["bits_causa"], CAUSAS_FILTRO, filtro_irregularidade)
+    indices = np.flatnonzero(selecionados)
+    ensaio_de = dados_dia["ensaio_do_medidor"][indices]
+    ensaios_processados = []
+    for grupo in np.split(indices, np.flatnonzero(np.diff(ensaio_de)) + 1) if len(indices) else []:
+        ensaio = dados_dia["ensaios"][dados_dia["ensaio_do_medidor"][grupo[0]]]
+        ensaios_processados.append({**ensaio, "medidores": [dados_dia["medidores"][k] for k in grupo]})
+    return ensaios_processados
+
+def gerar_pdf_dia(progresso, ensaios, data, stats):
+    return gerar_pdf_relatorio(ensaios=ensaios, data=data, stats=stats)
+
+def secao_kpis_dia(dados_dia, data_sel):
+    """Cards de performance. Depende só da avaliação do dia (não dos filtros de status)."""
+    dados_auditoria = dados_dia["auditoria"]
+    st.markdown(f"### 📅 Performance do Dia - {data_sel.strftime('%d/%m/%Y')}")
+    a1, a2, a3, a4, a5, a6 = st.columns(6)
+    with a1: st.markdown(f'<div class="metric-card-diaria" style="border-top-color:#1e293b"><span class="val-diaria">{dados_auditoria["total_ensaiadas"]}</span><span class="lab-diaria">Ensaios Reais</span></div>', unsafe_allow_html=True)
+    with a2: st.markdown(f'<div class="metric-card-diaria" style="border-top-color:#16a34a"><span class="val-diaria">{dados_auditoria["total_aprovadas"]}</span><span class="lab-diaria">Aprovados</span></div>', unsafe_allow_html=True)
+    with a3: st.markdown(f'<div class="metric-card-diaria" style="border-top-color:#dc2626"><span class="val-diaria">{dados_auditoria["total_reprovadas"]}</span><span class="lab-diaria">Reprovados</span></div>', unsafe_allow_html=True)
+    with a4: st.markdown(f'<div class="metric-card-diaria" style="border-top-color:#7c3aed"><span class="val-diaria">{dados_dia["total_consumidor"]}</span><span class="lab-diaria">C. Consumidor</span></div>', unsafe_allow_html=True)
+    with a5: st.markdown(f'<div class="metric-card-diaria" style="border-top-color:#64748b"><span class="val-diaria">{dados_dia["total_nao_ligou"]}</span><span class="lab-diaria">Não Ligou</span></div>', unsafe_allow_html=True)
+    with a6: st.markdown(f'<div class="metric-card-diaria" style="border-top-color:#16a34a"><span class="val-diaria">{dados_auditoria["taxa_aprovacao"]:.2f}%</span><span class="lab-diaria">Eficiência</span></div>', unsafe_allow_html=True)
+
+def secao_graficos_exportacao_dia(ensaios_processados, data_sel, chave_filtros):
+    """Gráfico de motivos + exportações. PDF e Excel são gerados na fila, identificados pelos filtros do dia."""
+    todos_os_medidores = [m for e in ensaios_processados for m in e["medidores"]]
+    stats = calcular_estatisticas(todos_os_medidores)
+    st.markdown("---")
+    col_g1, col_g2 = st.columns([3, 1])
+    with col_g1:
+        renderizar_grafico_reprovacoes(todos_os_medidores)
+    with col_g2:
+        botao_exportacao("📥 Baixar PDF", ("pdf_dia",) + chave_filtros, gerar_pdf_dia, ensaios_processados,
+                         data_sel.strftime('%d/%m/%Y'), stats, nome_arquivo=f"relatorio_{data_sel}.pdf",
+                         mime="application/pdf", descricao=f"PDF {data_sel.strftime('%d/%m/%Y')}")
+        botao_exportacao("📥 Baixar Excel", ("excel_dia",) + chave_filtros, excel_em_abas,
+                         {"Relatorio": pd.DataFrame(todos_os_medidores)}, nome_arquivo=f"dados_{data_sel}.xlsx",
+                         descricao=f"Excel {data_sel.strftime('%d/%m/%Y')}")
+
+def secao_cards_ensaios(ensaios_processados, versao):
+    """Cards originais, um único bloco de markdown por ensaio (cabeçalho + grade de 5 colunas).
+    O HTML de cada card vem do cache por (versão, ensaio, posição)."""
+    st.subheader("📋 Detalhes dos Ensaios")
+    st.markdown(CSS_CARDS, unsafe_allow_html=True)
+    for ensaio in ensaios_processados:
+        cards = "".join(html_card_em_cache(versao, ensaio["linha"], m) for m in ensaio["medidores"])
+        st.markdown(
+            html_cabecalho_ensaio(ensaio["n_ensaio"], ensaio["bancada"], ensaio["temperatura"])
+            + f'<div class="grade-cards">{cards}</div>',
+            unsafe_allow_html=True
+        )
+
 def pagina_visao_diaria(df_completo):
     # --- BOTÃO VOLTAR AO TOPO (CSS & HTML PRESERVADO) ---
     st.markdown('''
@@ -729,25 +1053,15 @@ def pagina_visao_diaria(df_completo):
             st.rerun()
             
         st.markdown(f"### 🔍 Histórico de Ensaios para a Série: **{serie_input}**")
-        resultados = []
-        
-        for _, ensaio_row in df_completo.iterrows():
-            colunas_serie = [c for c in ensaio_row.index if "_Série" in str(c)]
-            if any(termo_busca in str(ensaio_row[col]).lower() for col in colunas_serie if pd.notna(ensaio_row[col])):
-                medidores = processar_ensaio(ensaio_row)
-                for m in medidores:
-                    if termo_busca in m['serie'].lower():
-                        resultados.append({
-                            "data": ensaio_row['Data'],
-                            "bancada": ensaio_row['Bancada_Nome'],
-                            "dados": m
-                        })
+        resultados = buscar_historico(carregar_historico_series(), termo_busca)
         
-        if resultados:
+        if not resultados.empty:
             st.success(f"{len(resultados)} registro(s) encontrado(s).")
-            for res in sorted(resultados, key=lambda x: datetime.strptime(x['data'], '%d/%m/%y'), reverse=True):
-                with st.expander(f"{res['data']} | {res['bancada']} | {res['dados']['status']}"):
-                    renderizar_card(res['dados'])
+            st.markdown(CSS_CARDS, unsafe_allow_html=True)
+            for (_, res), medidor in zip(resultados.iterrows(), para_medidores(resultados)):
+                tentativa = f" | {res['tentativa']}ª passagem" if res['tentativa'] else ""
+                with st.expander(f"{res['Data']} | {res['Bancada_Nome']} | {res['status']}{tentativa}"):
+                    renderizar_card(medidor)
         else:
             st.warning("Nenhum registro encontrado.")
         return
@@ -770,23 +1084,22 @@ def pagina_visao_diaria(df_completo):
         format="DD/MM/YYYY"
     )
 
-    bancadas = df_completo['Bancada_Nome'].unique().tolist()
+    bancadas = list(indice_base(df_completo, versao_dados(df_completo)).particoes)
     st.session_state.filtro_bancada = st.sidebar.selectbox(
         "Bancada", 
         ['Todas'] + bancadas
     )
 
-    status_options = ["APROVADO", "REPROVADO", "CONTRA O CONSUMIDOR", "Não Ligou / Não Ensaido"]
     st.session_state.filtro_status = st.sidebar.multiselect(
         "Filtrar Status", 
-        status_options, 
+        STATUS_FILTRO, 
         default=st.session_state.filtro_status
     )
 
     if "REPROVADO" in st.session_state.filtro_status:
         st.session_state.filtro_irregularidade = st.sidebar.multiselect(
             "Filtrar Irregularidade",
-            ["Exatidão", "Registrador", "Mostrador/MV"],
+            CAUSAS_FILTRO,
             default=st.session_state.filtro_irregularidade
         )
     else:
@@ -795,139 +1108,144 @@ def pagina_visao_diaria(df_completo):
     # =====================================================
     # PROCESSAMENTO E CÁLCULO DE INDICADORES
     # =====================================================
-    df_filtrado = df_completo[df_completo['Data_dt'].dt.date == st.session_state.filtro_data]
-    if st.session_state.filtro_bancada != "Todas":
-        df_filtrado = df_filtrado[df_filtrado['Bancada_Nome'] == st.session_state.filtro_bancada]
+    bancada_sel = st.session_state.filtro_bancada if st.session_state.filtro_bancada != "Todas" else None
+    df_filtrado = indice_base(df_completo, versao_dados(df_completo)).dia(st.session_state.filtro_data, bancada_sel)
 
     if df_filtrado.empty:
         st.info("Nenhum ensaio encontrado para esta data/bancada.")
         return
 
-    ensaios_processados = []
-    total_nao_ligou_dia = 0
-    lista_consumidor_dia = []
-    
-    for _, row in df_filtrado.iterrows():
-        medidores = processar_ensaio(row)
-        meds_f = []
-        for m in medidores:
-            # Contagem global para o card "Não Ligou" (independente de filtro de status)
-            if m['status'] == 'Não Ligou / Não Ensaido':
-                total_nao_ligou_dia += 1
-            
-            # Filtro Contra Consumidor para estatística
-            if m['status'] == 'CONTRA O CONSUMIDOR':
-                lista_consumidor_dia.append(m)
-
-            # Aplicação dos filtros de interface
-            status_ok = not st.session_state.filtro_status or m['status'] in st.session_state.filtro_status
-            irr_ok = not st.session_state.filtro_irregularidade or any(i in m['motivo'] for i in st.session_state.filtro_irregularidade)
-            
-            if status_ok and irr_ok:
-                meds_f.append(m)
-        
-        if meds_f:
-            ensaios_processados.append({
-                "n_ensaio": row.get("N_ENSAIO", "N/A"),
-                "bancada": row["Bancada_Nome"],
-                "temperatura": row.get("Temperatura", "--"),
-                "medidores": meds_f
-            })
-
-    # Dados para os cards
-    todos_os_medidores = [m for e in ensaios_processados for m in e["medidores"]]
-    stats = calcular_estatisticas(todos_os_medidores)
-    dados_auditoria = calcular_auditoria_real(df_filtrado)
-    total_c_consumidor = len(lista_consumidor_dia)
+    dados_dia = avaliar_ensaios_dia(df_filtrado)
+    ensaios_processados = filtrar_ensaios_dia(
+        dados_dia, st.session_state.filtro_status, st.session_state.filtro_irregularidade
+    )
 
     # --- INDICADORES DE PERFORMANCE (6 COLUNAS) ---
-    st.markdown(f"### 📅 Performance do Dia - {st.session_state.filtro_data.strftime('%d/%m/%Y')}")
-    a1, a2, a3, a4, a5, a6 = st.columns(6)
-    with a1: st.markdown(f'<div class="metric-card-diaria" style="border-top-color:#1e293b"><span class="val-diaria">{dados_auditoria["total_ensaiadas"]}</span><span class="lab-diaria">Ensaios Reais</span></div>', unsafe_allow_html=True)
-    with a2: st.markdown(f'<div class="metric-card-diaria" style="border-top-color:#16a34a"><span class="val-diaria">{dados_auditoria["total_aprovadas"]}</span><span class="lab-diaria">Aprovados</span></div>', unsafe_allow_html=True)
-    with a3: st.markdown(f'<div class="metric-card-diaria" style="border-top-color:#dc2626"><span class="val-diaria">{dados_auditoria["total_reprovadas"]}</span><span class="lab-diaria">Reprovados</span></div>', unsafe_allow_html=True)
-    with a4: st.markdown(f'<div class="metric-card-diaria" style="border-top-color:#7c3aed"><span class="val-diaria">{total_c_consumidor}</span><span class="lab-diaria">C. Consumidor</span></div>', unsafe_allow_html=True)
-    with a5: st.markdown(f'<div class="metric-card-diaria" style="border-top-color:#64748b"><span class="val-diaria">{total_nao_ligou_dia}</span><span class="lab-diaria">Não Ligou</span></div>', unsafe_allow_html=True)
-    with a6: st.markdown(f'<div class="metric-card-diaria" style="border-top-color:#16a34a"><span class="val-diaria">{dados_auditoria["taxa_aprovacao"]:.2f}%</span><span class="lab-diaria">Eficiência</span></div>', unsafe_allow_html=True)
+    secao_kpis_dia(dados_dia, st.session_state.filtro_data)
 
     # --- GRÁFICOS E DOWNLOADS ---
-    st.markdown("---")
-    col_g1, col_g2 = st.columns([3, 1])
-    with col_g1:
-        renderizar_grafico_reprovacoes(todos_os_medidores)
-    with col_g2:
-        pdf_bytes = gerar_pdf_relatorio(ensaios=ensaios_processados, data=st.session_state.filtro_data.strftime('%d/%m/%Y'), stats=stats)
-        if pdf_bytes:
-            st.download_button("📥 Baixar PDF", pdf_bytes, file_name=f"relatorio_{st.session_state.filtro_data}.pdf", use_container_width=True)
-        excel_bytes = to_excel(pd.DataFrame(todos_os_medidores))
-        st.download_button("📥 Baixar Excel", excel_bytes, file_name=f"dados_{st.session_state.filtro_data}.xlsx", use_container_width=True)
+    chave_filtros = (versao_dados(df_completo), str(st.session_state.filtro_data), st.session_state.filtro_bancada,
+                     tuple(st.session_state.filtro_status), tuple(st.session_state.filtro_irregularidade))
+    secao_graficos_exportacao_dia(ensaios_processados, st.session_state.filtro_data, chave_filtros)
 
     # --- DETALHES DOS ENSAIOS (CARDS ORIGINAIS) ---
-    st.subheader("📋 Detalhes dos Ensaios")
-    for ensaio in ensaios_processados:
-        renderizar_cabecalho_ensaio(ensaio["n_ensaio"], ensaio["bancada"], ensaio["temperatura"])
-        cols_n = 5
-        for i in range(0, len(ensaio["medidores"]), cols_n):
-            cols = st.columns(cols_n)
-            for j, m in enumerate(ensaio["medidores"][i : i + cols_n]):
-                with cols[j]:
-                    renderizar_card(m)
+    secao_cards_ensaios(ensaios_processados, versao_dados(df_completo))
 
 # =========================================================
 # [BLOCO 07] - PÁGINA: VISÃO MENSAL (VERSÃO FINAL RESTAURADA)
 # =========================================================
 
-def get_stats_por_dia(df_mes):
-    """Gera o dataframe consolidado de estatísticas diárias para os gráficos."""
-    daily_stats = []
-    for data, group in df_mes.groupby('Data_dt'):
-        medidores = []
-        for _, row in group.iterrows():
-            medidores.extend(processar_ensaio(row))
-        
-        aprovados = sum(1 for m in medidores if m['status'] == 'APROVADO')
-        reprovados = sum(1 for m in medidores if m['status'] == 'REPROVADO')
-        
-        # REGRA DE OURO NA CONTAGEM DIÁRIA
-        consumidor = 0
-        for m in medidores:
-            if m['status'] == 'CONTRA O CONSUMIDOR':
-                try:
-                    v_cn = float(str(m['cn']).replace('+', '').replace(',', '.').strip() or 0)
-                    v_cp = float(str(m['cp']).replace('+', '').replace(',', '.').strip() or 0)
-                    v_ci = float(str(m['ci']).replace('+', '').replace(',', '.').strip() or 0)
-                    if v_cn > 0 or v_cp > 0 or v_ci > 0:
-                        consumidor += 1
-                except: continue
-        
-        nao_ensaiados = sum(1 for m in medidores if m['status'] == 'Não Ligou / Não Ensaido')
-        total_ensaiados = aprovados + reprovados + consumidor
-        
-        # Cálculo da taxa para o gráfico de tendência
-        taxa_dia = (aprovados / total_ensaiados * 100) if total_ensaiados > 0 else 0
+def posicoes_do_mes(df_completo, ano, mes):
+    """Recorte do mês na tabela de posições compartilhada (já avaliada na carga)."""
+    return indice_posicoes(df_completo, versao_dados(df_completo)).mes(ano, mes)
+
+@st.cache_data(show_spinner=False)
+def processar_mes(_df_completo, versao, ano, mes):
+    """KPIs, tabela técnica de Contra o Consumidor e séries diárias do mês, lidos da tabela de posições.
+
+    'versao' só entra na chave do cache: uma nova carga da planilha gera novas séries.
+    """
+    posicoes = posicoes_do_mes(_df_completo, ano, mes)
+    confirmados = posicoes[posicoes['contra_consumidor_confirmado']]
+    tabela_consumidor = pd.DataFrame({
+        "Data": confirmados['Data'], "Bancada": confirmados['Bancada_Nome'], "Pos": confirmados['pos'],
+        "Série": confirmados['serie'],
+        "Erro CN": confirmados['cn'], "Erro CP": confirmados['cp'], "Erro CI": confirmados['ci'],
+        "M.V": confirmados['mv'],
+        "Reg Inic": confirmados['reg_inicio'], "Reg Fim": confirmados['reg_fim'], "Reg %": confirmados['reg_erro'],
+        "Motivo": confirmados['motivo']
+    })
+    return {
+        "auditoria": contar_auditoria(posicoes),
+        "total_nao_ligou": int((posicoes['status'] == "Não Ligou / Não Ensaido").sum()),
+        "tabela_consumidor": tabela_consumidor,
+        "diario": estatisticas_diarias(posicoes),
+        "diario_bancada": estatisticas_diarias(posicoes, por_bancada=True)
+    }
+
+def destacar_sinal_positivo(df):
+    """Estilo da tabela técnica: textos com '+' em roxo (máscara da tabela inteira, sem applymap)."""
+    positivo = df.apply(lambda col: col.astype(str).str.contains('+', regex=False))
+    return pd.DataFrame(np.where(positivo, 'color: #7c3aed; font-weight: bold', ''), index=df.index, columns=df.columns)
+
+@st.cache_resource(show_spinner=False, max_entries=24)
+def indice_auditoria_mes(_df_completo, versao, ano, mes):
+    """Tabelas de auditoria do mês indexadas por data, montadas uma vez por carga e compartilhadas (somente leitura)."""
+    return auditoria_por_dia(posicoes_do_mes(_df_completo, ano, mes))
+
+CORES_STATUS = {'APROVADO': '#c6f6d5', 'REPROVADO': '#fed7d7', 'CONTRA O CONSUMIDOR': '#e9d8fd'}
+
+def colorir_status(coluna):
+    """Cor de fundo da coluna Status inteira de uma vez (Series.map no lugar de applymap célula a célula)."""
+    return 'background-color: ' + coluna.map(CORES_STATUS).fillna('#edf2f7')
+
+@fragmento
+def secao_auditoria_individual(df_completo, ano_sel, mes_sel, dias_disponiveis):
+    """Seletor de dia da auditoria: trocar o dia reexecuta só esta seção e só consulta o índice por data."""
+    st.write("**2. Auditoria Individual de Medidores:**")
+    dia_auditoria = st.selectbox("Selecione um dia para ver quem foi aprovado/reprovado:", dias_disponiveis)
+    
+    if dia_auditoria:
+        indice = indice_auditoria_mes(df_completo, versao_dados(df_completo), ano_sel, mes_sel)
+        df_auditoria = indice.get(pd.to_datetime(dia_auditoria, format='%d/%m/%Y'))
+        if df_auditoria is None:
+            st.info("Nenhum medidor neste dia.")
+            return
+
+        vazios = df_auditoria['Status'] == "Não Ligou / Não Ensaido"
+        nao_ligou = int(vazios.sum())
+        ensaiados = len(df_auditoria) - nao_ligou
         
-        daily_stats.append({
-            'Data': data, 'Aprovados': aprovados, 'Reprovados': reprovados,
-            'Contra Consumidor': consumidor, 'Não Ensaidos': nao_ensaiados,
-            'Total': total_ensaiados,
-            'Taxa de Aprovação (%)': round(taxa_dia, 1)
-        })
-    return pd.DataFrame(daily_stats)
-
-def extrair_valor_reg(dicionario_medidor, tipo):
-    """Varredura total para encontrar as chaves de Registrador."""
-    for k, v in dicionario_medidor.items():
-        key_upper = str(k).upper()
-        if tipo == 'inic':
-            if 'REG' in key_upper and ('INIC' in key_upper or 'INIÇ' in key_upper):
-                return v
-        elif tipo == 'fim':
-            if 'REG' in key_upper and 'FIM' in key_upper:
-                return v
-        elif tipo == 'erro':
-            if 'REG' in key_upper and ('ERRO' in key_upper or '%' in key_upper):
-                return v
-    return '-'
+        c_a1, c_a2 = st.columns(2)
+        c_a1.warning(f"🔌 Não Ligaram/Vazios: {nao_ligou}")
+        c_a2.success(f"✅ Considerados no Cálculo: {ensaiados}")
+
+        st.write(f"Lista de medidores do dia {dia_auditoria}:")
+
+        st.dataframe(
+            df_auditoria.style.apply(colorir_status, subset=['Status']),
+            use_container_width=True,
+            hide_index=True
+        )
+
+def secao_primeira_passagem_mes(ano_sel, mes_sel):
+    """Primeira passagem e retestes das séries cujo primeiro ensaio caiu no mês. Lê só o resumo por série."""
+    historico = carregar_historico_series()
+    resumo = historico["resumo"]
+    no_mes = (resumo["primeira_data"].dt.year == ano_sel) & (resumo["primeira_data"].dt.month == mes_sel)
+    historico_mes = {**historico, "resumo": resumo[no_mes]}
+    if historico_mes["resumo"].empty:
+        st.info("Nenhuma série com primeiro ensaio neste mês.")
+        return
+
+    recuperadas = series_reprovadas_depois_aprovadas(historico_mes)
+    reincidentes = series_reincidentes(historico_mes)
+    r1, r2, r3, r4 = st.columns(4)
+    r1.metric("Aprovação na 1ª passagem (FPY)", f"{primeira_aprovacao(historico_mes):.2f}%")
+    r2.metric("Reprovadas e aprovadas no reteste", len(recuperadas))
+    r3.metric("Reincidentes (2+ reprovações)", len(reincidentes))
+    dias = (recuperadas["data_aprovacao"] - recuperadas["primeira_data"]).dt.days
+    r4.metric("Dias até aprovar (mediana)", f"{dias.median():.0f}" if not dias.empty else "-")
+
+    c1, c2 = st.columns([1.5, 1])
+    with c1:
+        st.markdown("##### FPY por Bancada e Classe")
+        df_fpy = indicadores_primeira_passagem(historico_mes["resumo"], por=("bancada", "classe"))
+        st.dataframe(df_fpy.rename(columns={
+            "bancada": "Bancada", "classe": "Classe", "series": "Séries", "fpy": "FPY (%)",
+            "retestes_medios": "Retestes Médios", "dias_ate_aprovacao": "Dias até Aprovar (mediana)"
+        }).round(2), use_container_width=True, hide_index=True)
+    with c2:
+        st.markdown("##### Distribuição de Retestes")
+        df_dist = distribuicao_retestes(historico_mes["resumo"]).reset_index().melt(
+            id_vars="bancada", var_name="Retestes", value_name="Séries")
+        fig_dist = px.bar(df_dist, x="Retestes", y="Séries", color="bancada", barmode="group")
+        fig_dist.update_layout(height=280, margin=dict(t=10, b=0, l=0, r=0), legend_title=None)
+        st.plotly_chart(fig_dist, use_container_width=True)
+
+    if not reincidentes.empty:
+        st.markdown("##### Séries Reincidentes")
+        st.dataframe(reincidentes.reset_index().rename(columns={"serie": "Série"}), use_container_width=True, hide_index=True)
 
 def pagina_visao_mensal(df_completo):
     # --- BOTÃO VOLTAR AO TOPO (ESTILIZADO CONFORME A FOTO) ---
@@ -965,39 +1283,22 @@ def pagina_visao_mensal(df_completo):
     ''', unsafe_allow_html=True)
 
     # FILTROS LATERAIS
-    df_completo['Ano'] = df_completo['Data_dt'].dt.year
-    df_completo['Mes'] = df_completo['Data_dt'].dt.month
-    ano_sel = st.sidebar.selectbox("Ano", sorted(df_completo['Ano'].unique(), reverse=True))
-    meses_disp = sorted(df_completo[df_completo['Ano'] == ano_sel]['Mes'].unique())
+    indice = indice_base(df_completo, versao_dados(df_completo))
+    ano_sel = st.sidebar.selectbox("Ano", indice.anos()[::-1])
+    meses_disp = indice.meses(ano_sel)
     mes_sel = st.sidebar.selectbox("Mês", meses_disp, format_func=lambda x: ["Jan","Fev","Mar","Abr","Mai","Jun","Jul","Ago","Set","Out","Nov","Dez"][x-1])
 
-    df_mes = df_completo[(df_completo['Ano'] == ano_sel) & (df_completo['Mes'] == mes_sel)]
+    df_mes = indice.mes(ano_sel, mes_sel)
     if df_mes.empty: return
 
     # =====================================================
     # PROCESSAMENTO E ALINHAMENTO DE DADOS
     # =====================================================
-    lista_consumidor_fidedigna = []
-    total_nao_ligou = 0
-    for _, row in df_mes.iterrows():
-        medidores_da_linha = processar_ensaio(row)
-        for m in medidores_da_linha:
-            if m['status'] == 'Não Ligou / Não Ensaido':
-                total_nao_ligou += 1
-                
-            if m['status'] == 'CONTRA O CONSUMIDOR':
-                try:
-                    v_cn = float(str(m['cn']).replace('+', '').replace(',', '.').strip() or 0)
-                    v_cp = float(str(m['cp']).replace('+', '').replace(',', '.').strip() or 0)
-                    v_ci = float(str(m['ci']).replace('+', '').replace(',', '.').strip() or 0)
-                    if v_cn > 0 or v_cp > 0 or v_ci > 0:
-                        m['data_ensaio'] = row['Data']
-                        m['bancada_ensaio'] = row['Bancada_Nome']
-                        lista_consumidor_fidedigna.append(m)
-                except: continue
-
-    total_c_consumidor = len(lista_consumidor_fidedigna)
-    dados_auditoria = calcular_auditoria_real(df_mes)
+    dados_mes = processar_mes(df_completo, versao_dados(df_completo), ano_sel, mes_sel)
+    df_consumidor = dados_mes["tabela_consumidor"]
+    total_nao_ligou = dados_mes["total_nao_ligou"]
+    total_c_consumidor = len(df_consumidor)
+    dados_auditoria = dados_mes["auditoria"]
     
     # --- EXIBIÇÃO DOS CARDS (AGORA COM 6 COLUNAS) ---
     st.markdown("### 📊 Indicadores de Performance Mensal")
@@ -1014,21 +1315,14 @@ def pagina_visao_mensal(df_completo):
     # =====================================================
     if total_c_consumidor > 0:
         with st.expander(f"🚨 DETALHAMENTO TÉCNICO: {total_c_consumidor} ITENS CONFIRMADOS", expanded=False):
-            dados_tabela = []
-            for m in lista_consumidor_fidedigna:
-                dados_tabela.append({
-                    "Data": m.get('data_ensaio', 'N/A'), 
-                    "Bancada": m.get('bancada_ensaio', 'N/A'), 
-                    "Pos": m.get('pos', '-'),
-                    "Série": m.get('serie', 'N/A'),
-                    "Erro CN": m.get('cn', '-'), "Erro CP": m.get('cp', '-'), "Erro CI": m.get('ci', '-'),
-                    "M.V": m.get('mv', '-'), 
-                    "Reg Inic": extrair_valor_reg(m, 'inic'), 
-                    "Reg Fim": extrair_valor_reg(m, 'fim'),
-                    "Reg %": extrair_valor_reg(m, 'erro'), 
-                    "Motivo": m.get('motivo', 'N/A')
-                })
-            st.dataframe(pd.DataFrame(dados_tabela).style.applymap(lambda x: 'color: #7c3aed; font-weight: bold' if isinstance(x, str) and '+' in x else ''), use_container_width=True, hide_index=True)
+            st.dataframe(df_consumidor.style.apply(destacar_sinal_positivo, axis=None), use_container_width=True, hide_index=True)
+
+            df_cc_bancada = dados_mes["diario_bancada"]
+            df_cc_bancada = df_cc_bancada[df_cc_bancada['Contra Consumidor'] > 0]
+            fig_cc = px.bar(df_cc_bancada, x='Data', y='Contra Consumidor', color='Bancada',
+                            color_discrete_sequence=['#7c3aed', '#c4b5fd'])
+            fig_cc.update_layout(height=250, margin=dict(t=10, b=0, l=0, r=0), legend_title=None, xaxis_title=None)
+            st.plotly_chart(fig_cc, use_container_width=True)
 
     st.markdown("<br>", unsafe_allow_html=True)
     m1, m2, m3, m4 = st.columns(4)
@@ -1040,7 +1334,7 @@ def pagina_visao_mensal(df_completo):
     # =====================================================
     # GRÁFICOS RESTAURADOS COM TOTAL NO TOPO
     # =====================================================
-    df_daily = get_stats_por_dia(df_mes)
+    df_daily = dados_mes["diario"]
     st.markdown("---")
     col_g1, col_g2 = st.columns([1, 1.5])
     
@@ -1096,55 +1390,28 @@ def pagina_visao_mensal(df_completo):
 
         st.markdown("---")
         
-        st.write("**2. Auditoria Individual de Medidores:**")
-        dia_auditoria = st.selectbox("Selecione um dia para ver quem foi aprovado/reprovado:", df_daily['Data'].dt.strftime('%d/%m/%Y'))
-        
-        if dia_auditoria:
-            data_filtro = pd.to_datetime(dia_auditoria, format='%d/%m/%Y')
-            df_dia_f = df_mes[df_mes['Data_dt'] == data_filtro]
-            
-            medidores_auditoria = []
-            for _, r in df_dia_f.iterrows():
-                medidores_auditoria.extend(processar_ensaio(r))
-            
-            df_auditoria = pd.DataFrame([{
-                "Pos": m['pos'],
-                "Série": m['serie'],
-                "Status": m['status'],
-                "CN": m['cn'],
-                "CP": m['cp'],
-                "CI": m['ci'],
-                "MV": m['mv'],
-                "Reg": m.get('reg_erro', '-'),
-                "Motivo": m['motivo']
-            } for m in medidores_auditoria])
-
-            nao_ligou = len(df_auditoria[df_auditoria['Status'] == "Não Ligou / Não Ensaido"])
-            ensaiados = len(df_auditoria[df_auditoria['Status'] != "Não Ligou / Não Ensaido"])
-            
-            c_a1, c_a2 = st.columns(2)
-            c_a1.warning(f"🔌 Não Ligaram/Vazios: {nao_ligou}")
-            c_a2.success(f"✅ Considerados no Cálculo: {ensaiados}")
+        secao_auditoria_individual(df_completo, ano_sel, mes_sel, df_daily['Data'].dt.strftime('%d/%m/%Y'))
 
-            st.write(f"Lista de medidores do dia {dia_auditoria}:")
-            
-            def color_status(val):
-                if val == 'APROVADO': color = '#c6f6d5'
-                elif val == 'REPROVADO': color = '#fed7d7'
-                elif val == 'CONTRA O CONSUMIDOR': color = '#e9d8fd'
-                else: color = '#edf2f7'
-                return f'background-color: {color}'
-
-            st.dataframe(
-                df_auditoria.style.applymap(color_status, subset=['Status']),
-                use_container_width=True,
-                hide_index=True
-            )
+    # =====================================================
+    # RETESTES: SÉRIES QUE VOLTARAM PARA A BANCADA
+    # =====================================================
+    with st.expander("🔁 Primeira Passagem e Retestes (séries com primeiro ensaio no mês)"):
+        secao_primeira_passagem_mes(ano_sel, mes_sel)
                 
 # =======================================================================
 # [BLOCO 08] - PÁGINA: ANÁLISE DE POSIÇÕES (HEATMAP DE REPROVAÇÃO)
 # =======================================================================
 
+@st.cache_data(show_spinner=False, max_entries=32)
+def analisar_periodo_bancada(_df_completo, versao, bancada, data_inicio, data_fim):
+    """Uma passada mês a mês pelo período: KPIs, mapa de calor e dispersão sem montar o período inteiro.
+    Os meses são recortes da tabela de posições da carga (já avaliada); nada é reavaliado aqui.
+    A base não entra no hash do cache; a versão da carga (versao_dados) faz esse papel."""
+    meses = indice_posicoes(_df_completo, versao).blocos(data_inicio, data_fim, bancada=bancada)
+    kpis, (heatmap_data, df_reprov), dispersao = consumir(
+        blocos_de_posicoes(_df_completo, meses), ContagemAuditoria(), MapaCalorExatidao(), MomentosDispersao())
+    return kpis, heatmap_data, df_reprov, dispersao
+
 def pagina_analise_posicoes(df_completo):
     # --- BOTÃO VOLTAR AO TOPO ---
     st.markdown('''
@@ -1161,8 +1428,8 @@ def pagina_analise_posicoes(df_completo):
     st.sidebar.header("🔬 Filtros da Análise")
     bancadas_selecionadas = st.sidebar.multiselect(
         "Selecione a(s) Bancada(s)", 
-        options=['BANC_10_POS', 'BANC_20_POS'],
-        default=['BANC_10_POS', 'BANC_20_POS'], 
+        options=sorted(df_completo['Bancada_Nome'].dropna().unique()),
+        default=sorted(df_completo['Bancada_Nome'].dropna().unique()), 
         key='heatmap_bancadas'
     )
 
@@ -1193,48 +1460,29 @@ def pagina_analise_posicoes(df_completo):
         st.markdown(f"### Análise para: **{bancada.replace('_', ' ')}**")
         
         with st.spinner(f"Processando dados para a {bancada.replace('_', ' ')}..."):
-            df_filtrado = df_completo[
-                (df_completo['Bancada_Nome'] == bancada) & 
-                (df_completo['Data_dt'].dt.date >= data_inicio) & 
-                (df_completo['Data_dt'].dt.date <= data_fim)
-            ]
+            kpis, heatmap_data, df_reprov, dispersao = analisar_periodo_bancada(
+                df_completo, versao_dados(df_completo), bancada, data_inicio, data_fim
+            )
 
-            if df_filtrado.empty:
+            if kpis["total_posicoes"] == 0:
                 st.info(f"Nenhum dado encontrado para a {bancada.replace('_', ' ')} no período.")
                 continue
 
-            reprovacoes_detalhadas = []
-            for _, row in df_filtrado.iterrows():
-                medidores = processar_ensaio(row)
-                for medidor in medidores:
-                    if medidor['status'] == 'REPROVADO' and 'Exatidão' in medidor['motivo']:
-                        for erro_tipo in medidor['erros_pontuais']:
-                            reprovacoes_detalhadas.append({
-                                'Data': row['Data'],
-                                'Ensaio #': row.get('N_ENSAIO', 'N/A'),
-                                'Posição': medidor['pos'],
-                                'Série': medidor['serie'],
-                                'Ponto do Erro': erro_tipo,
-                                'Valor CN': medidor['cn'],
-                                'Valor CP': medidor['cp'],
-                                'Valor CI': medidor['ci']
-                            })
-
-            if not reprovacoes_detalhadas:
+            k1, k2, k3, k4 = st.columns(4)
+            k1.metric("Posições Ensaiadas", kpis["total_ensaiadas"])
+            k2.metric("Aprovação", f"{kpis['taxa_aprovacao']:.2f}%")
+            k3.metric("Reprov. Exatidão", kpis["reprov_exatidao"])
+            k4.metric("Contra o Consumidor", kpis["reprov_consumidor"])
+            if not dispersao.empty:
+                with st.expander("📐 Dispersão do Período (CN, CP, CI)"):
+                    st.dataframe(dispersao.reset_index().rename(columns={
+                        "ponto": "Ponto", "n": "Leituras", "media": "Erro Médio (%)", "desvio": "Desvio Padrão"
+                    }).drop(columns="Bancada").round(4), use_container_width=True, hide_index=True)
+
+            if df_reprov.empty:
                 st.success(f"🎉 Nenhuma reprovação por exatidão na {bancada.replace('_', ' ')} neste período!")
                 continue
 
-            # Construção do Mapa de Calor
-            df_reprov = pd.DataFrame(reprovacoes_detalhadas)
-            heatmap_data = df_reprov.pivot_table(index='Posição', columns='Ponto do Erro', aggfunc='size', fill_value=0)
-            
-            # Garante que as colunas CN, CP e CI existam para o gráfico
-            for ponto in ['CN', 'CP', 'CI']:
-                if ponto not in heatmap_data.columns:
-                    heatmap_data[ponto] = 0
-            
-            heatmap_data = heatmap_data[['CN', 'CP', 'CI']]
-
             fig = go.Figure(data=go.Heatmap(
                 z=heatmap_data.values,
                 x=heatmap_data.columns,
@@ -1256,13 +1504,248 @@ def pagina_analise_posicoes(df_completo):
 
             with st.expander(f"📄 Ver Lista de {len(df_reprov)} Medidores com Erro"):
                 st.dataframe(df_reprov, use_container_width=True, hide_index=True)
-                excel_bytes = to_excel(df_reprov)
-                st.download_button(
-                    label=f"📥 Baixar Excel {bancada}",
-                    data=excel_bytes,
-                    file_name=f"Heatmap_{bancada}.xlsx"
+                botao_exportacao(
+                    f"📥 Baixar Excel {bancada}", ("heatmap", versao_dados(df_completo), bancada, str(data_inicio), str(data_fim)),
+                    excel_em_abas, {"Relatorio": df_reprov}, nome_arquivo=f"Heatmap_{bancada}.xlsx",
+                    descricao=f"Heatmap {bancada} {data_inicio:%d/%m}–{data_fim:%d/%m/%Y}"
                 )
 
+# =======================================================================
+# [BLOCO 08B] - PÁGINA: COMPARAÇÃO ENTRE BANCADAS
+# =======================================================================
+
+INDICADORES_BANCADA = {
+    "Erro médio (%)": "media", "Desvio padrão (%)": "desvio",
+    "Reprovações": "reprovacoes", "Taxa de reprovação (%)": "taxa_reprovacao"
+}
+
+def rotulo_bancada(bancada):
+    """Nome da planilha seguido dos padrões MQN cadastrados para ela em MAPA_BANCADA_SERIE."""
+    padroes = [k[len(bancada) + 1:] for k in MAPA_BANCADA_SERIE if k.startswith(f"{bancada}_")]
+    return f"{bancada} ({', '.join(padroes)})" if padroes else bancada
+
+def pagina_comparacao_bancadas(df_completo):
+    st.markdown("## ⚖️ Comparação entre Bancadas")
+    st.info("Todas as bancadas lado a lado, por posição e ponto de carga. Período e classe só recortam uma matriz pré-calculada.")
+
+    matriz = carregar_matriz_bancadas(df_completo, versao_dados(df_completo))
+    if matriz.empty:
+        st.info("Nenhum ensaio para comparar.")
+        return
+
+    meses = [pd.Timestamp(m) for m in sorted(matriz.index.get_level_values('mes').unique())]
+    st.sidebar.header("⚖️ Filtros da Comparação")
+    inicio, fim = st.sidebar.select_slider(
+        "Período (meses)", options=meses, value=(meses[max(0, len(meses) - 3)], meses[-1]),
+        format_func=lambda m: m.strftime('%m/%Y'), key='comp_periodo'
+    )
+    opcoes_classes = ["1", "2", "A", "B", "C", "D"]
+    classes = st.sidebar.multiselect("Classes", opcoes_classes, default=opcoes_classes, key='comp_classes')
+    if not classes:
+        st.warning("Selecione pelo menos uma classe.")
+        return
+
+    rotulo_ind = st.radio("Indicador:", list(INDICADORES_BANCADA), horizontal=True, key='comp_indicador')
+    indicador = INDICADORES_BANCADA[rotulo_ind]
+
+    por_ponto = comparar_bancadas(matriz, inicio, fim, classes, por=("Bancada", "ponto"))
+    if por_ponto.empty:
+        st.info("Nenhum ensaio no período e classes selecionados.")
+        return
+    bancadas = list(por_ponto.index.get_level_values('Bancada').unique())
+    sem_planilha = [k for k in MAPA_BANCADA_SERIE if not any(k.startswith(f"{b}_") for b in bancadas)]
+    if sem_planilha:
+        st.caption(f"Padrões sem ensaios no período: {', '.join(sem_planilha)}")
+
+    # --- RESUMO POR PONTO DE CARGA, UMA COLUNA POR BANCADA ---
+    colunas = st.columns(len(bancadas))
+    for coluna, bancada in zip(colunas, bancadas):
+        with coluna:
+            st.markdown(f"**{rotulo_bancada(bancada)}**")
+            st.dataframe(por_ponto.loc[bancada].rename(columns={
+                'n': 'Leituras', 'media': 'Erro Médio (%)', 'desvio': 'Desvio (%)',
+                'reprovacoes': 'Reprovações', 'taxa_reprovacao': 'Taxa Reprov. (%)'
+            }).round(3), use_container_width=True)
+
+    # --- MAPA POSIÇÃO x PONTO LADO A LADO ---
+    por_posicao = comparar_bancadas(matriz, inicio, fim, classes)
+    fig = make_subplots(rows=1, cols=len(bancadas), subplot_titles=[rotulo_bancada(b) for b in bancadas], shared_yaxes=True)
+    for i, bancada in enumerate(bancadas, start=1):
+        mapa = por_posicao.loc[bancada, indicador].unstack('ponto').reindex(columns=["CN", "CP", "CI"])
+        fig.add_trace(go.Heatmap(z=mapa.to_numpy(), x=list(mapa.columns), y=[f"Pos {p}" for p in mapa.index],
+                                 coloraxis="coloraxis", text=np.round(mapa.to_numpy(), 2), texttemplate="%{text}"), row=1, col=i)
+    fig.update_yaxes(autorange="reversed")
+    fig.update_layout(height=600, coloraxis=dict(colorscale='RdBu_r' if indicador == 'media' else 'Reds'),
+                      margin=dict(t=40, b=0, l=0, r=0))
+    st.plotly_chart(fig, use_container_width=True)
+
+    # --- EVOLUÇÃO MENSAL ---
+    por_mes = comparar_bancadas(matriz, inicio, fim, classes, por=("Bancada", "mes")).reset_index()
+    fig_mes = px.line(por_mes, x='mes', y=indicador, color='Bancada', markers=True, labels={'mes': 'Mês', indicador: rotulo_ind})
+    fig_mes.update_layout(height=320, margin=dict(t=10, b=0, l=0, r=0), legend_title=None)
+    st.plotly_chart(fig_mes, use_container_width=True)
+
+# =======================================================================
+# [BLOCO 08C] - PÁGINA: QUALIDADE DOS DADOS (QUARENTENA)
+# =======================================================================
+
+def secao_metricas_recarga():
+    """Buscas às fontes externas desde a partida do processo (uma recarga por vez, ver recarga.py)."""
+    def horario(ts):
+        return datetime.fromtimestamp(ts).strftime('%d/%m %H:%M:%S') if ts else "-"
+
+    linhas = []
+    for m in (recarga_dados().metricas(), recarga_tabela_mestra().metricas()):
+        linhas.append({
+            "Fonte": m["fonte"], "Buscas": m["buscas"], "Falhas": m["falhas"],
+            "Sessões que aguardaram": m["aguardaram"], "Servidas com a carga anterior": m["servidas_anteriores"],
+            "Adiadas pelo limite": m["adiadas_pelo_limite"], "Última busca": horario(m["ultima_busca"]),
+            "Duração (s)": round(m["ultima_duracao_s"], 2) if m["ultima_duracao_s"] is not None else None,
+            "Próxima recarga": horario(m["proxima_recarga"]), "Último erro": m["ultimo_erro"] or "",
+        })
+    with st.expander("📡 Recargas das fontes"):
+        st.caption(f"Fonte: {fonte_dados().descricao}")
+        st.dataframe(pd.DataFrame(linhas), use_container_width=True, hide_index=True)
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def conferencia_registradores(_df_completo, versao):
+    """Resumo por bancada e posição e lista das posições inconsistentes ('versao' identifica a carga)."""
+    posicoes = posicoes_da_carga(_df_completo)
+    inconsistentes = posicoes[posicoes['reg_conferencia'].isin(REG_INCONSISTENCIAS)]
+    lista = pd.DataFrame({
+        'Data': inconsistentes['Data'], 'Bancada': inconsistentes['Bancada_Nome'], 'Ensaio #': inconsistentes['N_ENSAIO'],
+        'Posição': inconsistentes['pos'], 'Série': inconsistentes['serie'], 'Reg Inic': inconsistentes['reg_inicio'],
+        'Reg Fim': inconsistentes['reg_fim'], 'Delta (kWh)': inconsistentes['reg_delta'].round(4),
+        'Energia do ensaio (kWh)': inconsistentes['reg_energia_ensaio'].round(4),
+        'Erro calculado (%)': inconsistentes['reg_erro_calc'].round(3), 'REG_Erro (%)': inconsistentes['reg_erro_num'],
+        'Conferência': inconsistentes['reg_conferencia'],
+    })
+    return {"por_posicao": contar_registradores(posicoes), "lista": lista.iloc[::-1].reset_index(drop=True)}
+
+def secao_registradores(df_completo):
+    """REG_Fim - REG_Inicio de cada posição conferido contra REG_Erro e a energia do ensaio (calculado na carga)."""
+    st.markdown("##### 📑 Consistência do Registrador")
+    st.caption("Delta do registrador (REG_Fim - REG_Inicio) comparado com a energia do ensaio (mediana dos deltas das "
+               "posições do ensaio) e com o REG_Erro informado. Só sinaliza: o veredito RTM não é alterado.")
+    conferencia = conferencia_registradores(df_completo, versao_dados(df_completo))
+    por_posicao, lista = conferencia["por_posicao"], conferencia["lista"]
+    if por_posicao.empty:
+        st.info("Nenhuma leitura de registrador na carga.")
+        return
+    k1, k2, k3 = st.columns(3)
+    com_leitura = int(por_posicao['com_leitura'].sum())
+    k1.metric("Posições com leitura", f"{com_leitura:,}".replace(",", "."))
+    k2.metric("Reprovadas por registrador", f"{por_posicao['reprov_registrador'].sum() / com_leitura * 100:.2f}%")
+    k3.metric("Inconsistentes", f"{por_posicao['inconsistentes'].sum() / com_leitura * 100:.2f}%")
+    st.dataframe(por_posicao.rename(columns={
+        'Bancada_Nome': 'Bancada', 'pos': 'Posição', 'com_leitura': 'Com leitura', 'reprov_registrador': 'Reprov. registrador',
+        'inconsistentes': 'Inconsistentes', 'taxa_reprovacao': 'Reprovação (%)', 'taxa_inconsistencia': 'Inconsistência (%)'
+    }).round(2), use_container_width=True, hide_index=True)
+    if lista.empty:
+        return
+    tipos = st.multiselect("Inconsistência", REG_INCONSISTENCIAS, default=REG_INCONSISTENCIAS, key="reg_tipos")
+    df_l = lista[lista['Conferência'].isin(tipos)]
+    st.dataframe(df_l, use_container_width=True, hide_index=True)
+    botao_exportacao("📥 Exportar inconsistências do registrador (Excel)",
+                     ("registradores", versao_dados(df_completo), tuple(tipos)), excel_em_abas,
+                     {"Por posição": por_posicao, "Inconsistências": df_l}, nome_arquivo="registradores.xlsx",
+                     descricao="Registradores")
+
+def pagina_qualidade_dados(df_completo):
+    st.markdown("## 🧪 Qualidade dos Dados da Planilha")
+    st.info("Células P{n}_* conferidas na carga: texto que não é número, valores fora de escala e leituras muito "
+            "distantes da mediana da própria posição (mediana/MAD). As células suspeitas ficam aqui para revisão; "
+            "o veredito RTM dos ensaios não é alterado.")
+
+    qualidade = carregar_qualidade()
+    metricas, quarentena = qualidade["metricas"], qualidade["quarentena"]
+
+    k1, k2, k3, k4 = st.columns(4)
+    k1.metric("Células conferidas", f"{int(metricas['celulas'].sum()):,}".replace(",", "."))
+    k2.metric("Em quarentena", len(quarentena))
+    k3.metric("Ensaios afetados", quarentena['linha'].nunique())
+    k4.metric("Colunas afetadas", quarentena['Coluna'].nunique())
+
+    st.markdown("##### Perfil por Bancada e Campo")
+    st.dataframe(metricas.rename(columns={
+        'celulas': 'Células', 'preenchidas': 'Preenchidas', 'nao_numerico': MOTIVOS_QUALIDADE['nao_numerico'],
+        'fora_escala': MOTIVOS_QUALIDADE['fora_escala'], 'outlier': MOTIVOS_QUALIDADE['outlier']
+    }).reset_index(), use_container_width=True, hide_index=True)
+
+    secao_metricas_recarga()
+
+    secao_registradores(df_completo)
+
+    st.markdown("##### Quarentena")
+    if quarentena.empty:
+        st.success("Nenhuma célula suspeita.")
+        return
+    motivos = st.multiselect("Motivo", sorted(quarentena['Motivo'].unique()), default=sorted(quarentena['Motivo'].unique()))
+    df_q = quarentena[quarentena['Motivo'].isin(motivos)].drop(columns='linha')
+    st.dataframe(df_q, use_container_width=True, hide_index=True)
+    botao_exportacao("📥 Exportar quarentena (Excel)", ("quarentena", versao_dados(df_completo), tuple(sorted(motivos))),
+                     excel_em_abas, {"Quarentena": df_q}, nome_arquivo="quarentena_planilha.xlsx", descricao="Quarentena")
+
+# =======================================================================
+# [BLOCO 08D] - PÁGINA: CONSULTA (SQL)
+# =======================================================================
+
+@st.cache_resource(show_spinner="Preparando o banco de consultas...", max_entries=2)
+def banco_consulta(versao, _df_completo):
+    """Arquivo SQLite da carga (ver consulta.py), gravado uma vez por versão e reaproveitado entre sessões."""
+    return str(preparar_banco(DIRETORIO_CONSULTA, versao, _df_completo, posicoes_da_carga(_df_completo)))
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def rodar_consulta(caminho, sql):
+    return executar_consulta(caminho, sql)
+
+def pagina_consulta(df_completo):
+    st.markdown("## 🔎 Consulta (SQL)")
+    st.info("Consultas SQL (SQLite) direto sobre a carga atual, somente leitura. Tabelas: 'posicoes' (uma linha por "
+            "posição avaliada), 'leituras' (CN/CP/CI em formato longo) e 'ensaios' (uma linha por ensaio). "
+            f"O resultado mostra até {LIMITE_LINHAS:,} linhas.".replace(",", "."))
+
+    caminho = banco_consulta(versao_dados(df_completo), df_completo)
+    salvas = consultas_salvas(DIRETORIO_CONSULTA)
+    opcoes = {**{f"📌 {n}": q for n, q in CONSULTAS_PRONTAS.items()}, **{f"💾 {n}": q for n, q in salvas.items()}}
+    escolha = st.selectbox("Consultas prontas e salvas", list(opcoes))
+
+    with st.form("form_consulta"):
+        sql = st.text_area("SQL", value=opcoes[escolha].strip(), height=220, key=f"sql_{escolha}")
+        executar = st.form_submit_button("▶️ Executar", type="primary")
+
+    if executar or "consulta_atual" not in st.session_state or st.session_state["consulta_atual"][0] != escolha:
+        st.session_state["consulta_atual"] = (escolha, sql)
+    sql_atual = st.session_state["consulta_atual"][1]
+
+    try:
+        resultado, cortado, duracao = rodar_consulta(caminho, sql_atual)
+    except Exception as e:
+        st.error(f"Erro na consulta: {e}")
+        resultado = None
+    if resultado is not None:
+        st.caption(f"{len(resultado):,} linha(s) em {duracao * 1000:.0f} ms".replace(",", "."))
+        if cortado:
+            st.warning(f"Resultado cortado em {LIMITE_LINHAS:,} linhas; agregue ou filtre para ver tudo.".replace(",", "."))
+        st.dataframe(resultado, use_container_width=True, hide_index=True)
+        if not resultado.empty:
+            botao_exportacao("📥 Exportar resultado (Excel)", ("consulta", versao_dados(df_completo), sql_atual),
+                             excel_em_abas, {"Consulta": resultado}, nome_arquivo="consulta.xlsx", descricao="Consulta SQL")
+
+    c1, c2 = st.columns([3, 1])
+    nome = c1.text_input("Salvar esta consulta como", placeholder="Nome da consulta")
+    if c2.button("💾 Salvar", use_container_width=True, disabled=not nome.strip()):
+        salvar_consulta(DIRETORIO_CONSULTA, nome.strip(), sql_atual)
+        st.rerun()
+    if escolha.startswith("💾 ") and st.button(f"🗑️ Excluir '{escolha[2:]}'"):
+        excluir_consulta(DIRETORIO_CONSULTA, escolha[2:])
+        st.session_state.pop("consulta_atual", None)
+        st.rerun()
+
+    with st.expander("📚 Tabelas e colunas"):
+        for tabela, colunas in esquema_banco(caminho).items():
+            st.markdown(f"**{tabela}**: " + ", ".join(f"`{c}` {t}" for c, t in colunas))
+
 # =======================================================================
 # [BLOCO 09] - INICIALIZAÇÃO E MENU PRINCIPAL
 # =======================================================================
@@ -1292,16 +1775,33 @@ def main():
                 'Visão Diária': pagina_visao_diaria,
                 'Visão Mensal': pagina_visao_mensal,
                 'Análise de Posições': pagina_analise_posicoes,
-                'Metrologia Avançada': pagina_metrologia_avancada
+                'Comparação de Bancadas': pagina_comparacao_bancadas,
+                'Qualidade dos Dados': pagina_qualidade_dados,
+                'Metrologia Avançada': pagina_metrologia_avancada,
+                'Consulta': pagina_consulta
             }
             
             escolha = st.sidebar.radio("Selecione uma análise:", tuple(paginas.keys()))
+
+            with st.sidebar:
+                painel_exportacoes()
+
+            if recarga_dados().atualizando:
+                st.sidebar.caption("🔄 A planilha está sendo atualizada em segundo plano; exibindo a carga anterior.")
+
+            erro_retrato = _estado_snapshot()["erro"]
+            if erro_retrato:
+                st.sidebar.warning(f"💾 O retrato em disco não foi gravado (a próxima partida será lenta): {erro_retrato}")
+
+            em_quarentena = len(carregar_qualidade()["quarentena"])
+            if em_quarentena:
+                st.sidebar.warning(f"🧪 {em_quarentena} célula(s) da planilha em quarentena (ver 'Qualidade dos Dados').")
             
             # Chama a função da página selecionada
             paginas[escolha](df_completo)
             
         else:
-            st.error("Não foi possível encontrar dados. Verifique a planilha no Google Sheets.")
+            st.error(f"Não foi possível encontrar dados. Verifique a fonte: {descricao_fonte()}.")
             
     except Exception as e:
         st.error("Ocorreu um erro crítico na aplicação.")
@@ -0,0 +1,546 @@
+# =======================================================================
+# ARQUIVO: avaliacao.py (AVALIAÇÃO VETORIZADA + HISTÓRICO POR SÉRIE)
+# =======================================================================
+# Mesmas regras de processar_ensaio (app.py), aplicadas de uma vez sobre a
+# planilha inteira. O resultado é a "tabela de posições": uma linha por
+# posição de bancada de cada ensaio, já com status e motivo e com a
+# conferência do registrador (REG_Fim - REG_Inicio contra REG_Erro e a
+# energia do ensaio), que só sinaliza e não muda o veredito.
+# Este módulo não depende do Streamlit.
+
+import re
+
+import numpy as np
+import pandas as pd
+
+from esquema import colunas_do_campo, temperaturas_numericas
+
+STATUS_VAZIO = "Não Ligou / Não Ensaido"
+STATUS_REPROVADOS = ["REPROVADO", "CONTRA O CONSUMIDOR"]
+PONTOS = ["CN", "CP", "CI"]
+
+# Motivo de reprovação indexado por (exatidão, mostrador, registrador) -> exat*4 + mv*2 + reg
+# (mesma ordem de " / ".join(sorted(set(erros_list))) de processar_ensaio)
+_MOTIVOS = np.array([
+    "Nenhum", "Registrador", "Mostrador/MV", "Mostrador/MV / Registrador",
+    "Exatidão", "Contra Consumidor", "Contra Consumidor", "Contra Consumidor"
+], dtype=object)
+
+# Conferência do registrador
+REG_OK = "OK"
+REG_SEM_LEITURA = "Sem leitura"
+REG_INCOMPLETO = "Leitura incompleta"
+REG_REGREDIU = "Registrador regrediu"
+REG_ENERGIA = "Delta fora da energia do ensaio"
+REG_DIVERGE = "REG_Erro diverge do delta"
+REG_INCONSISTENCIAS = [REG_INCOMPLETO, REG_REGREDIU, REG_ENERGIA, REG_DIVERGE]
+LIMITE_REG_PCT = 1.5            # mesmo limite da reprovação por registrador
+TOLERANCIA_REG_ERRO_PP = 0.5    # diferença aceita entre o REG_Erro informado e o calculado (pontos percentuais)
+MIN_POSICOES_ENERGIA = 3        # posições com delta para estimar a energia do ensaio
+
+# --- CONVERSÕES VETORIZADAS (equivalentes a valor_num / texto de app.py) ---
+# As colunas da planilha repetem muito os mesmos valores: a conversão roda só
+# sobre os valores distintos (pd.factorize) e é espalhada de volta pelos códigos.
+
+def _por_valores_distintos(col, conversao, valor_nulo):
+    codigos, distintos = pd.factorize(col.astype(object), use_na_sentinel=True)
+    convertidos = np.asarray(conversao(pd.Series(distintos, dtype=object)))
+    saida = np.append(convertidos, valor_nulo)
+    return pd.Series(saida[codigos], index=col.index)
+
+def _valor_num_distintos(s):
+    txt = s.astype(str).str.strip().str.replace(",", ".", regex=False)
+    txt = txt.mask(txt.isin(["", "-", "None", "SEM LEITURA", "ERRO"]))
+    return pd.to_numeric(txt, errors="coerce").astype(float)
+
+def _texto_distintos(s):
+    txt = s.astype(str).str.strip()
+    return txt.str.replace(r"\.0$", "", regex=True).mask(txt.isin(["-", "None"]), "-").astype(object)
+
+def valores_numericos(col):
+    """Versão vetorizada de valor_num: vírgula decimal; '-', 'None', 'SEM LEITURA' e 'ERRO' viram NaN."""
+    if pd.api.types.is_numeric_dtype(col):
+        return col.astype(float)
+    return _por_valores_distintos(col, _valor_num_distintos, np.nan).astype(float)
+
+def textos(col):
+    """Versão vetorizada de texto: nulos viram '-' e o '.0' final é removido."""
+    return _por_valores_distintos(col, _texto_distintos, "-")
+
+CLASSE_PADRAO = "B"   # classe RTM das linhas sem classe (limite e filtro da Metrologia)
+
+def _classe_rtm(classe):
+    """'1'/'2' para eletromecânicos, senão a letra A-D; CLASSE_PADRAO quando não há nenhuma."""
+    c = str(classe).upper()
+    if "ELETROMEC" in c or "1" in c or "2" in c:
+        return "2" if "2" in c else "1"
+    letra = re.search(r"[A-D]", c)
+    return letra.group(0) if letra else CLASSE_PADRAO
+
+def classes_rtm(col):
+    return _por_valores_distintos(col, lambda s: s.map(_classe_rtm), CLASSE_PADRAO)
+
+def _formatar_2casas(valores):
+    return np.array([f"{v:.2f}" for v in valores], dtype=object)
+
+# --- TABELA DE POSIÇÕES ---
+
+CAMPOS_POSICAO = [("serie", "Série"), ("cn", "CN"), ("cp", "CP"), ("ci", "CI"), ("mv", "MV"),
+                  ("reg_inicio", "REG_Inicio"), ("reg_fim", "REG_Fim"), ("reg_erro", "REG_Erro")]
+
+def _coluna(df, nome):
+    return df[nome] if nome in df.columns else pd.Series(np.nan, index=df.index, dtype=object)
+
+def temperatura_c(df_completo):
+    """Temperatura numérica do ensaio (°C): a coluna convertida na carga ou, em recortes sem ela, convertida aqui."""
+    if "Temperatura_C" in df_completo.columns:
+        return df_completo["Temperatura_C"].astype(float)
+    return temperaturas_numericas(_coluna(df_completo, "Temperatura"))
+
+def grade_posicoes(df_completo):
+    """Pares (linha, posição) do formato longo, ensaio a ensaio e posição a posição.
+    'linha' é a posição (iloc) em df_completo; bancadas de 10 posições param na P10."""
+    tamanho = np.where(df_completo["Bancada_Nome"].to_numpy() == "BANC_20_POS", 20, 10)
+    linhas = np.repeat(np.arange(len(df_completo)), 20)
+    pos = np.tile(np.arange(1, 21), len(df_completo))
+    valido = pos <= tamanho[linhas]
+    return linhas[valido], pos[valido]
+
+def valores_longos(df_completo, coluna, linhas, pos):
+    """Valores de P{pos}_{coluna} para cada par (linha, pos) da grade (NaN onde a coluna não existe).
+
+    As colunas são lidas por posição (índices resolvidos pelo esquema), num único iloc por campo.
+    """
+    indices = colunas_do_campo(df_completo, coluna)
+    existe = indices >= 0
+    matriz = np.full((len(df_completo), 20), np.nan, dtype=object)
+    if existe.any():
+        matriz[:, existe] = df_completo.iloc[:, indices[existe]].to_numpy(dtype=object)
+    return matriz[linhas, pos - 1]
+
+def montar_tabela_posicoes(df_completo):
+    """Converte as linhas largas (P1_... a P20_...) em formato longo e avalia todas as posições de uma vez.
+
+    Cada linha do resultado corresponde a um medidor de processar_ensaio, com os mesmos textos de exibição
+    (cn, cp, ci, mv, reg_*, status, motivo) e as leituras numéricas (cn_num, cp_num, ci_num, reg_erro_num,
+    temperatura_c).
+    A coluna 'linha' guarda o índice do ensaio em df_completo.
+    """
+    colunas_saida = [
+        "linha", "Data_dt", "Data", "Bancada_Nome", "N_ENSAIO", "Classe", "classe_rtm", "Temperatura", "temperatura_c",
+        "pos", "serie", "cn", "cp", "ci", "mv", "reg_inicio", "reg_fim", "reg_erro", "cn_num", "cp_num", "ci_num",
+        "reg_erro_num", "reg_delta", "reg_energia_ensaio", "reg_erro_calc", "reg_conferencia", "erro_cn", "erro_cp", "erro_ci", "erro_exatidao", "erro_mv", "erro_registrador",
+        "limite", "status", "motivo", "contra_consumidor_confirmado", "bits_classe", "bits_status", "bits_causa"
+    ]
+    if df_completo.empty:
+        return pd.DataFrame(columns=colunas_saida)
+
+    linhas, pos = grade_posicoes(df_completo)
+    base = {
+        "linha": df_completo.index.to_numpy()[linhas],
+        "Data_dt": df_completo["Data_dt"].to_numpy()[linhas],
+        "Data": _coluna(df_completo, "Data").to_numpy()[linhas],
+        "Bancada_Nome": df_completo["Bancada_Nome"].to_numpy()[linhas],
+        "N_ENSAIO": _por_valores_distintos(_coluna(df_completo, "N_ENSAIO"), _texto_distintos, "N/A").to_numpy()[linhas],
+        "Classe": _coluna(df_completo, "Classe").to_numpy()[linhas],
+        "classe_rtm": classes_rtm(_coluna(df_completo, "Classe")).to_numpy()[linhas],
+        "Temperatura": _por_valores_distintos(_coluna(df_completo, "Temperatura"), _texto_distintos, "--").to_numpy()[linhas],
+        "temperatura_c": temperatura_c(df_completo).to_numpy()[linhas],
+        "pos": pos,
+    }
+    for campo, coluna in CAMPOS_POSICAO:
+        base[campo] = valores_longos(df_completo, coluna, linhas, pos)
+    return conferir_registradores(avaliar_posicoes(pd.DataFrame(base)))[colunas_saida]
+
+def avaliar_posicoes(tab):
+    """Aplica as regras de processar_ensaio sobre colunas brutas (serie, cn, cp, ci, mv, reg_*) em formato longo."""
+    eletromec = _por_valores_distintos(
+        tab["Classe"], lambda s: s.astype(str).str.upper().str.contains("ELETROMEC", regex=False), False
+    ).to_numpy(dtype=bool)
+    limite = np.where(eletromec, 4.0, 1.3)
+
+    nums = {p: valores_numericos(tab[p.lower()]).to_numpy(dtype=float) for p in PONTOS}
+    reg = valores_numericos(tab["reg_erro"]).to_numpy(dtype=float)
+    vazio = np.isnan(nums["CN"]) & np.isnan(nums["CP"]) & np.isnan(nums["CI"])
+
+    # --- 1. EXATIDÃO ---
+    erro_ponto = {p: np.abs(np.nan_to_num(nums[p], nan=0.0)) > limite for p in PONTOS}
+    erro_exat = erro_ponto["CN"] | erro_ponto["CP"] | erro_ponto["CI"]
+
+    # --- 2. MOSTRADOR ---
+    mv_str = _por_valores_distintos(tab["mv"], lambda s: _texto_distintos(s).str.strip().str.upper(), "-")
+    mv_esperado = np.where(tab["Bancada_Nome"] == "BANC_10_POS", "+", "OK")
+    erro_mv = mv_str.to_numpy() != mv_esperado
+
+    # --- 3. REGISTRADOR ---
+    reg_valido = ~np.isnan(reg)
+    erro_reg = reg_valido & (reg > 1.5)
+    reg_display = np.full(len(tab), "-", dtype=object)
+    faixa_2casas = reg_valido & (((reg > 1.05) & (reg <= 1.5)) | ((reg > 1.5) & (reg <= 100)))
+    reg_display[reg_valido & (reg < 0.05)] = "0.01"
+    reg_display[reg_valido & (reg >= 0.05) & (reg <= 1.05)] = "1.0"
+    reg_display[faixa_2casas] = _formatar_2casas(reg[faixa_2casas])
+    reg_display[reg_valido & (reg > 100)] = "ERRO"
+
+    # --- 4. STATUS FINAL ---
+    codigo = erro_exat.astype(int) * 4 + erro_mv.astype(int) * 2 + erro_reg.astype(int)
+    status = np.select(
+        [erro_exat & (erro_reg | erro_mv), codigo > 0], ["CONTRA O CONSUMIDOR", "REPROVADO"], "APROVADO"
+    ).astype(object)
+    motivo = _MOTIVOS[codigo]
+
+    # --- POSIÇÃO VAZIA ---
+    status[vazio] = STATUS_VAZIO
+    motivo[vazio] = "N/A"
+
+    tab = tab.copy()
+    tab["serie"] = textos(tab["serie"])
+    for p in PONTOS:
+        tab[f"{p.lower()}_num"] = nums[p]
+        tab[f"erro_{p.lower()}"] = erro_ponto[p] & ~vazio
+        tab[p.lower()] = textos(tab[p.lower()]).mask(vazio, "-")
+    tab["mv"] = mv_str.mask(vazio, "-")
+    tab["reg_inicio"] = textos(tab["reg_inicio"]).mask(vazio, "-")
+    tab["reg_fim"] = textos(tab["reg_fim"]).mask(vazio, "-")
+    tab["reg_erro"] = np.where(vazio, "-", reg_display)
+    tab["reg_erro_num"] = reg
+    tab["erro_exatidao"] = erro_exat & ~vazio
+    tab["erro_mv"] = erro_mv & ~vazio
+    tab["erro_registrador"] = erro_reg & ~vazio
+    tab["limite"] = limite
+    tab["status"] = status
+    tab["motivo"] = motivo
+    # "Contra o Consumidor" confirmado: além do status, algum erro de exatidão positivo (medidor registrando a mais)
+    positivo = (np.nan_to_num(nums["CN"]) > 0) | (np.nan_to_num(nums["CP"]) > 0) | (np.nan_to_num(nums["CI"]) > 0)
+    tab["contra_consumidor_confirmado"] = (status == "CONTRA O CONSUMIDOR") & positivo
+    tab["bits_classe"] = bits_classe(tab["Classe"]).to_numpy()
+    tab["bits_status"] = bits_status(tab["status"])
+    tab["bits_causa"] = bits_causa(tab["motivo"])
+    return tab
+
+# --- CONSISTÊNCIA DO REGISTRADOR ---
+
+def conferir_registradores(tab):
+    """Confere REG_Inicio/REG_Fim/REG_Erro de todas as posições de uma vez (tabela já avaliada, com 'linha').
+
+    reg_delta = REG_Fim - REG_Inicio (kWh). A energia do ensaio é a mediana dos deltas das posições do
+    mesmo ensaio (os medidores da bancada recebem a mesma energia), calculada com ao menos
+    MIN_POSICOES_ENERGIA deltas. reg_erro_calc é o erro do delta contra essa energia (%). reg_conferencia
+    traz a primeira inconsistência encontrada, nesta ordem: leitura incompleta, registrador que regrediu,
+    delta além de LIMITE_REG_PCT da energia do ensaio e REG_Erro (até 100%) a mais de TOLERANCIA_REG_ERRO_PP
+    do erro calculado. Posições vazias ou sem nenhuma leitura do registrador ficam 'Sem leitura'.
+    """
+    inicio = valores_numericos(tab["reg_inicio"]).to_numpy(dtype=float)
+    fim = valores_numericos(tab["reg_fim"]).to_numpy(dtype=float)
+    reg = tab["reg_erro_num"].to_numpy(dtype=float)
+    delta = fim - inicio
+
+    # Energia do ensaio: mediana dos deltas por linha de ensaio (um groupby para a tabela toda)
+    deltas = pd.Series(delta, index=tab.index)
+    por_ensaio = deltas.groupby(tab["linha"].to_numpy())
+    energia = por_ensaio.transform("median").to_numpy(dtype=float)
+    estimada = (por_ensaio.transform("count").to_numpy() >= MIN_POSICOES_ENERGIA) & (energia > 0)
+    energia = np.where(estimada, energia, np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        erro_calc = (delta - energia) / energia * 100
+
+    tem_inicio, tem_fim, tem_reg = ~np.isnan(inicio), ~np.isnan(fim), ~np.isnan(reg)
+    vazio = (tab["status"] == STATUS_VAZIO).to_numpy()
+    sem_leitura = vazio | ~(tem_inicio | tem_fim | tem_reg)
+    incompleto = ~(tem_inicio & tem_fim)
+    regrediu = delta < 0
+    fora_energia = np.abs(erro_calc) > LIMITE_REG_PCT
+    diverge = tem_reg & (reg <= 100) & (np.abs(reg - erro_calc) > TOLERANCIA_REG_ERRO_PP)
+    conferencia = np.select(
+        [sem_leitura, incompleto, regrediu, fora_energia, diverge],
+        [REG_SEM_LEITURA, REG_INCOMPLETO, REG_REGREDIU, REG_ENERGIA, REG_DIVERGE], REG_OK
+    ).astype(object)
+
+    tab = tab.copy()
+    tab["reg_delta"] = delta
+    tab["reg_energia_ensaio"] = energia
+    tab["reg_erro_calc"] = erro_calc
+    tab["reg_conferencia"] = conferencia
+    return tab
+
+# --- ÍNDICES DE FILTRO (BITS) ---
+# Cada posição guarda um inteiro por família de filtro (classe, status, causa da reprovação) com um bit por
+# opção. Uma seleção múltipla vira uma máscara e o OR das opções sai de (bits & máscara) != 0; filtros de
+# famílias diferentes se combinam com & entre as máscaras booleanas.
+
+CLASSES_FILTRO = ["1", "2", "A", "B", "C", "D"]
+STATUS_FILTRO = ["APROVADO", "REPROVADO", "CONTRA O CONSUMIDOR", STATUS_VAZIO]
+CAUSAS_FILTRO = ["Exatidão", "Registrador", "Mostrador/MV"]
+
+def _bits_por_trecho(s, opcoes):
+    bits = np.zeros(len(s), dtype=np.int64)
+    for i, opcao in enumerate(opcoes):
+        bits |= s.str.contains(opcao, regex=False).to_numpy(dtype=np.int64) << i
+    return bits
+
+def bits_classe(col):
+    """Bit de CLASSES_FILTRO da classe RTM de cada linha (classes_rtm): o filtro por classe usa a mesma classe
+    que dá o limite da posição e que a comparação de bancadas agrupa (classe vazia: CLASSE_PADRAO)."""
+    codigos = pd.Categorical(classes_rtm(col), categories=CLASSES_FILTRO).codes.astype(np.int64)
+    return pd.Series(np.left_shift(1, codigos), index=col.index)
+
+def bits_status(status):
+    """Um bit por status de STATUS_FILTRO (0 para status fora da lista)."""
+    codigos = pd.Categorical(status, categories=STATUS_FILTRO).codes.astype(np.int64)
+    return np.where(codigos >= 0, np.left_shift(1, np.maximum(codigos, 0)), 0)
+
+def bits_causa(motivo):
+    """Bit i ligado quando o motivo cita CAUSAS_FILTRO[i] ('Mostrador/MV / Registrador' liga dois bits)."""
+    return _bits_por_trecho(pd.Series(motivo, dtype=object).astype(str), CAUSAS_FILTRO)
+
+def filtro_bits(bits, opcoes, selecionadas):
+    """Máscara das linhas com alguma das opções selecionadas (nenhuma selecionada: nenhuma linha)."""
+    mascara = 0
+    for opcao in selecionadas:
+        if opcao in opcoes:
+            mascara |= 1 << opcoes.index(opcao)
+    return (np.asarray(bits) & mascara) != 0
+
+def para_medidores(df_pos):
+    """Converte linhas da tabela de posições nos dicionários de medidor usados pelos cards e relatórios."""
+    medidores = []
+    for r in df_pos.itertuples(index=False):
+        medidores.append({
+            "pos": r.pos, "serie": r.serie, "cn": r.cn, "cp": r.cp, "ci": r.ci, "mv": r.mv,
+            "reg_inicio": r.reg_inicio, "reg_fim": r.reg_fim, "reg_erro": r.reg_erro,
+            "status": r.status, "detalhe": "", "motivo": r.motivo, "limite": r.limite,
+            "erros_pontuais": [p for p, e in zip(PONTOS, (r.erro_cn, r.erro_cp, r.erro_ci)) if e]
+        })
+    return medidores
+
+# --- INDICADORES SOBRE A TABELA DE POSIÇÕES ---
+
+def contar_auditoria(posicoes):
+    """Mesmo dicionário de calcular_auditoria_real, contado sobre posições já avaliadas."""
+    status, motivo = posicoes["status"], posicoes["motivo"]
+    ensaiadas = status != STATUS_VAZIO
+    reprovadas = ensaiadas & (status != "APROVADO")
+    t_ens, t_apr = int(ensaiadas.sum()), int((status == "APROVADO").sum())
+    return {
+        "total_posicoes": len(posicoes), "total_ensaiadas": t_ens, "total_aprovadas": t_apr,
+        "total_reprovadas": int(reprovadas.sum()),
+        "taxa_aprovacao": (t_apr / t_ens * 100) if t_ens > 0 else 0,
+        "reprov_exatidao": int((reprovadas & motivo.str.contains("Exatidão", regex=False)).sum()),
+        "reprov_registrador": int((reprovadas & motivo.str.contains("Registrador", regex=False)).sum()),
+        "reprov_mv": int((reprovadas & motivo.str.contains("Mostrador/MV", regex=False)).sum()),
+        "reprov_consumidor": int((status == "CONTRA O CONSUMIDOR").sum()),
+    }
+
+def contar_registradores(posicoes, por=("Bancada_Nome", "pos")):
+    """Por grupo: posições com leitura do registrador, reprovações por registrador, inconsistências de cada tipo
+    (REG_INCONSISTENCIAS) e as taxas (%) sobre as posições com leitura."""
+    conferidas = posicoes[posicoes["reg_conferencia"] != REG_SEM_LEITURA]
+    contagens = pd.crosstab([conferidas[c] for c in por], conferidas["reg_conferencia"])
+    contagens = contagens.reindex(columns=REG_INCONSISTENCIAS, fill_value=0)
+    grupos = conferidas.groupby(list(por))
+    resumo = pd.DataFrame({"com_leitura": grupos.size(), "reprov_registrador": grupos["erro_registrador"].sum()})
+    resumo = resumo.join(contagens).fillna(0).astype(np.int64)
+    resumo["inconsistentes"] = resumo[REG_INCONSISTENCIAS].sum(axis=1)
+    resumo["taxa_reprovacao"] = resumo["reprov_registrador"] / resumo["com_leitura"] * 100
+    resumo["taxa_inconsistencia"] = resumo["inconsistentes"] / resumo["com_leitura"] * 100
+    return resumo.reset_index()
+
+def estatisticas_diarias(posicoes, por_bancada=False):
+    """Série diária no formato de get_stats_por_dia (um groupby por dia x bancada; o total do dia soma as bancadas).
+
+    Como na regra original, 'Contra Consumidor' conta só os confirmados e o Total é
+    aprovados + reprovados + contra consumidor confirmados.
+    """
+    status = posicoes["status"]
+    indicadores = pd.DataFrame({
+        "Data": posicoes["Data_dt"], "Bancada": posicoes["Bancada_Nome"],
+        "Aprovados": status == "APROVADO", "Reprovados": status == "REPROVADO",
+        "Contra Consumidor": posicoes["contra_consumidor_confirmado"], "Não Ensaidos": status == STATUS_VAZIO,
+    })
+    serie = indicadores.groupby(["Data", "Bancada"]).sum().astype(int)
+    if not por_bancada:
+        serie = serie.groupby(level="Data").sum()
+    serie["Total"] = serie["Aprovados"] + serie["Reprovados"] + serie["Contra Consumidor"]
+    taxa = np.where(serie["Total"] > 0, serie["Aprovados"] / serie["Total"].where(serie["Total"] > 0, 1) * 100, 0)
+    serie["Taxa de Aprovação (%)"] = np.round(taxa, 1)
+    return serie.reset_index()
+
+def auditoria_por_dia(posicoes):
+    """Tabelas da auditoria individual (Pos, Série, Status, leituras, Reg, Motivo) já separadas por dia."""
+    tabela = pd.DataFrame({
+        "Pos": posicoes["pos"], "Série": posicoes["serie"], "Status": posicoes["status"],
+        "CN": posicoes["cn"], "CP": posicoes["cp"], "CI": posicoes["ci"], "MV": posicoes["mv"],
+        "Reg": posicoes["reg_erro"], "Motivo": posicoes["motivo"]
+    })
+    return {dia: grupo.reset_index(drop=True) for dia, grupo in tabela.groupby(posicoes["Data_dt"], sort=True)}
+
+# =======================================================================
+# HISTÓRICO POR NÚMERO DE SÉRIE
+# =======================================================================
+# Montado uma vez por carga: todas as passagens de cada série pelas bancadas,
+# ordenadas por série e data (datetime nativo). A busca por série e as
+# consultas de reteste leem daqui, sem varrer a planilha.
+
+def montar_historico_series(posicoes, resumo=None):
+    """Retorna o histórico ordenado, os limites [início, fim) de cada série e o resumo por série.
+
+    O resumo pode vir pronto (ver atualizar_resumo_series); senão é calculado aqui.
+    """
+    hist = posicoes[posicoes["serie"] != "-"]
+    hist = hist.sort_values(["serie", "Data_dt", "linha", "pos"], kind="stable", ignore_index=True)
+
+    series = hist["serie"].to_numpy()
+    chaves, inicios = np.unique(series, return_index=True)
+    fins = np.append(inicios[1:], len(hist))
+
+    ensaiado = hist["status"] != STATUS_VAZIO
+    hist = hist.assign(
+        ensaiado=ensaiado.to_numpy(),
+        tentativa=np.where(ensaiado, ensaiado.groupby(hist["serie"]).cumsum(), 0),
+    )
+    if resumo is None:
+        resumo = resumir_series(posicoes)
+    return {"tabela": hist, "series": chaves, "inicios": inicios, "fins": fins, "resumo": resumo}
+
+def historico_da_serie(historico, serie):
+    """Passagens de uma série exata, em ordem cronológica (busca binária nas chaves ordenadas)."""
+    i = np.searchsorted(historico["series"], serie)
+    if i >= len(historico["series"]) or historico["series"][i] != serie:
+        return historico["tabela"].iloc[0:0]
+    return historico["tabela"].iloc[historico["inicios"][i]:historico["fins"][i]]
+
+def buscar_historico(historico, termo):
+    """Passagens de todas as séries que contêm o termo (sem diferenciar maiúsculas), da mais recente para a mais antiga."""
+    termo = str(termo).strip().lower()
+    if not termo:
+        return historico["tabela"].iloc[0:0]
+    chaves = pd.Series(historico["series"])
+    achadas = np.flatnonzero(chaves.str.lower().str.contains(termo, regex=False).to_numpy())
+    if len(achadas) == 0:
+        return historico["tabela"].iloc[0:0]
+    linhas = np.concatenate([np.arange(historico["inicios"][i], historico["fins"][i]) for i in achadas])
+    return historico["tabela"].iloc[linhas].sort_values("Data_dt", ascending=False, kind="stable")
+
+def series_reprovadas_depois_aprovadas(historico):
+    """Séries cuja primeira passagem reprovou e que depois foram aprovadas em reteste."""
+    r = historico["resumo"]
+    return r[r["primeiro_status"].isin(STATUS_REPROVADOS) & r["data_aprovacao"].notna()]
+
+def series_reincidentes(historico, min_reprovacoes=2):
+    """Séries reprovadas em pelo menos min_reprovacoes passagens."""
+    r = historico["resumo"]
+    return r[r["n_reprovacoes"] >= min_reprovacoes].sort_values("n_reprovacoes", ascending=False)
+
+def primeira_aprovacao(historico):
+    """Rendimento de primeira passagem: fração das séries aprovadas já no primeiro ensaio."""
+    r = historico["resumo"]
+    return float((r["primeiro_status"] == "APROVADO").mean() * 100) if len(r) else 0.0
+
+# =======================================================================
+# PRIMEIRA PASSAGEM (FPY) E RETESTES
+# =======================================================================
+# A taxa de aprovação de calcular_auditoria_real conta cada passagem como um
+# medidor novo, então um reteste entra duas vezes no denominador. Aqui a
+# unidade é a série: o resumo guarda a primeira passagem (bancada, classe,
+# data, status), as contagens e a data da primeira aprovação.
+# Resumos parciais se combinam (combinar_resumos), o que permite atualizar
+# o resumo só com os ensaios novos de cada carga.
+
+_COLUNAS_RESUMO = [
+    "primeira_data", "bancada", "classe", "primeiro_status", "ultima_data", "ultimo_status",
+    "n_ensaios", "n_reprovacoes", "data_aprovacao"
+]
+
+def resumir_series(posicoes):
+    """Resumo por série das passagens com leitura (posições vazias ou sem série ficam de fora)."""
+    validos = posicoes[(posicoes["serie"] != "-") & (posicoes["status"] != STATUS_VAZIO)]
+    if validos.empty:
+        return pd.DataFrame(columns=_COLUNAS_RESUMO).rename_axis("serie")
+    validos = validos.sort_values(["Data_dt", "linha", "pos"], kind="stable")
+    grupo = validos.groupby("serie", sort=True)
+    primeiro = grupo.head(1).set_index("serie")
+    ultimo = grupo.tail(1).set_index("serie")
+    resumo = pd.DataFrame({
+        "primeira_data": primeiro["Data_dt"],
+        "bancada": primeiro["Bancada_Nome"],
+        "classe": primeiro["classe_rtm"],
+        "primeiro_status": primeiro["status"],
+        "ultima_data": ultimo["Data_dt"],
+        "ultimo_status": ultimo["status"],
+        "n_ensaios": grupo.size(),
+        "n_reprovacoes": validos["status"].isin(STATUS_REPROVADOS).groupby(validos["serie"]).sum(),
+        "data_aprovacao": validos["Data_dt"].where(validos["status"] == "APROVADO").groupby(validos["serie"]).min(),
+    })
+    return resumo.sort_index()
+
+def combinar_resumos(antigo, novo):
+    """Junta dois resumos parciais: a primeira passagem vem do mais antigo, as contagens somam."""
+    if antigo is None or antigo.empty:
+        return novo
+    if novo.empty:
+        return antigo
+    juntos = pd.concat([antigo, novo])
+    por_inicio = juntos.sort_values("primeira_data", kind="stable").groupby(level=0, sort=True)
+    por_fim = juntos.sort_values("ultima_data", kind="stable").groupby(level=0, sort=True)
+    resumo = por_inicio.head(1)[["primeira_data", "bancada", "classe", "primeiro_status"]].sort_index()
+    ultimo = por_fim.tail(1).sort_index()
+    resumo["ultima_data"] = ultimo["ultima_data"]
+    resumo["ultimo_status"] = ultimo["ultimo_status"]
+    resumo["n_ensaios"] = por_inicio["n_ensaios"].sum()
+    resumo["n_reprovacoes"] = por_inicio["n_reprovacoes"].sum()
+    resumo["data_aprovacao"] = por_inicio["data_aprovacao"].min()
+    return resumo
+
+def chaves_ensaios(df_completo):
+    """Assinatura (hash) do conteúdo de cada linha de ensaio, indexada como df_completo."""
+    return pd.util.hash_pandas_object(df_completo, index=False)
+
+def linhas_a_incorporar(vistas, chaves):
+    """O que um acumulador incremental tem de processar nesta carga (chaves = chaves_ensaios da carga).
+
+    vistas: None ou as chaves já incorporadas. Devolve (atuais, linhas, refazer): atuais são as chaves
+    distintas da carga; refazer é True na primeira carga ou quando alguma linha já vista sumiu ou mudou de
+    conteúdo (correção na planilha), e então o acumulado recomeça do zero; linhas são os rótulos a processar,
+    todos ao refazer e só os novos caso contrário. Linhas de conteúdo idêntico contam uma única vez (vale a
+    primeira) nos dois casos, então acumular carga a carga dá o mesmo que refazer.
+    """
+    atuais, primeiras = np.unique(chaves.to_numpy(), return_index=True)
+    refazer = vistas is None or not np.isin(vistas, atuais, assume_unique=True).all()
+    if not refazer:
+        primeiras = primeiras[~np.isin(atuais, vistas, assume_unique=True)]
+    return atuais, chaves.index[np.sort(primeiras)], refazer
+
+def atualizar_resumo_series(estado, posicoes, chaves):
+    """Atualiza o resumo por série só com os ensaios que ainda não tinham sido vistos (linhas_a_incorporar).
+
+    estado: None ou {"chaves": hashes já incorporados, "resumo": DataFrame}.
+    """
+    atuais, linhas, refazer = linhas_a_incorporar(None if estado is None else estado["chaves"], chaves)
+    if not refazer and len(linhas) == 0:
+        return estado
+    parcial = resumir_series(posicoes[posicoes["linha"].isin(linhas)])
+    return {"chaves": atuais, "resumo": parcial if refazer else combinar_resumos(estado["resumo"], parcial)}
+
+def _faixa_retestes(n_ensaios):
+    return np.where(n_ensaios >= 4, "3+", (n_ensaios - 1).astype(int).astype(str))
+
+def indicadores_primeira_passagem(resumo, por=("bancada", "classe", "mes")):
+    """FPY, retestes médios e dias até a aprovação por grupo (mês = mês da primeira passagem)."""
+    r = resumo.assign(
+        mes=resumo["primeira_data"].dt.to_period("M").astype(str),
+        aprovado_1a=(resumo["primeiro_status"] == "APROVADO") * 100.0,
+        retestes=resumo["n_ensaios"] - 1,
+        dias_ate_aprovacao=(resumo["data_aprovacao"] - resumo["primeira_data"]).dt.days
+            .where(resumo["primeiro_status"] != "APROVADO"),
+    )
+    return r.groupby(list(por)).agg(
+        series=("aprovado_1a", "size"),
+        fpy=("aprovado_1a", "mean"),
+        retestes_medios=("retestes", "mean"),
+        dias_ate_aprovacao=("dias_ate_aprovacao", "median"),
+    ).reset_index()
+
+def distribuicao_retestes(resumo, por="bancada"):
+    """Quantas séries precisaram de 0, 1, 2 ou 3+ retestes, por grupo."""
+    faixa = pd.Series(_faixa_retestes(resumo["n_ensaios"].to_numpy()), index=resumo.index, name="retestes")
+    return pd.crosstab(resumo[por], faixa)
@@ -0,0 +1,197 @@
+# =======================================================================
+# ARQUIVO: cep.py (CONTROLE ESTATÍSTICO DE PROCESSO POR POSIÇÃO DE BANCADA)
+# =======================================================================
+# Cartas de controle para cada (Bancada, posição, ponto CN/CP/CI):
+# individuais com amplitude móvel (I-MR) e X̄/R com um subgrupo por dia.
+# Os limites saem de uma janela de referência (linha de base) e ficam fixos;
+# os pontos novos são conferidos contra eles pelas regras da Western Electric
+# sem revisitar o histórico: o monitor guarda só a cauda de cada carta.
+
+import numpy as np
+import pandas as pd
+
+from avaliacao import linhas_a_incorporar
+from agregacao import leituras_metrologia
+
+CHAVE = ["Bancada", "pos", "ponto"]
+REGRAS = {
+    "R1": "1 ponto além de 3σ",
+    "R2": "2 de 3 além de 2σ (mesmo lado)",
+    "R3": "4 de 5 além de 1σ (mesmo lado)",
+    "R4": "8 seguidos do mesmo lado",
+}
+MIN_PONTOS_BASE = 5
+TAMANHO_CAUDA = 8  # maior janela das regras
+
+# Constantes de cartas de controle por tamanho do subgrupo (n = 2..10; acima disso usa n = 10)
+D2 = {2: 1.128, 3: 1.693, 4: 2.059, 5: 2.326, 6: 2.534, 7: 2.704, 8: 2.847, 9: 2.970, 10: 3.078}
+D3 = {2: 0, 3: 0, 4: 0, 5: 0, 6: 0, 7: 0.076, 8: 0.136, 9: 0.184, 10: 0.223}
+D4 = {2: 3.267, 3: 2.574, 4: 2.282, 5: 2.114, 6: 2.004, 7: 1.924, 8: 1.864, 9: 1.816, 10: 1.777}
+
+def _constante(tabela, n):
+    n = np.clip(np.asarray(n, dtype=int), 2, 10)
+    return np.array([tabela[k] for k in range(2, 11)])[n - 2]
+
+# --- LEITURAS E LIMITES ---
+
+def leituras_cep(df_completo):
+    """Leituras CN/CP/CI em formato longo, ordenadas por carta (Bancada, pos, ponto) e, dentro dela, por data e linha."""
+    leituras = leituras_metrologia(df_completo)
+    leituras = leituras[leituras["Data_dt"].notna()]
+    return leituras.sort_values(CHAVE + ["Data_dt", "linha"], kind="stable").reset_index(drop=True)
+
+def _subgrupos(leituras):
+    """Um subgrupo por carta e dia: tamanho, média e amplitude."""
+    sub = leituras.groupby(CHAVE + ["Data_dt"], sort=True)["valor"].agg(
+        n="size", media="mean", maximo="max", minimo="min").reset_index()
+    sub["amplitude"] = sub.pop("maximo") - sub.pop("minimo")
+    return sub
+
+def calcular_limites(leituras, inicio=None, fim=None):
+    """Limites de controle por carta a partir das leituras da janela de referência [inicio, fim].
+
+    Individuais: centro = média, σ = MR̄ / 1,128. X̄/R: σ dentro do dia = média de R / d2(n) nos
+    subgrupos com 2+ leituras. Cartas com menos de MIN_PONTOS_BASE leituras ficam sem limites (NaN).
+    """
+    base = leituras
+    if inicio is not None:
+        base = base[base["Data_dt"] >= pd.Timestamp(inicio)]
+    if fim is not None:
+        base = base[base["Data_dt"] < pd.Timestamp(fim) + pd.Timedelta(days=1)]
+    mr = base.groupby(CHAVE, sort=False)["valor"].diff().abs()
+    limites = base.assign(mr=mr).groupby(CHAVE).agg(n_base=("valor", "size"), centro=("valor", "mean"),
+                                                   mr_medio=("mr", "mean"))
+    limites["sigma_i"] = limites["mr_medio"] / D2[2]
+
+    sub = _subgrupos(base)
+    sub = sub[sub["n"] >= 2]
+    sub = sub.assign(sigma=sub["amplitude"] / _constante(D2, sub["n"]))
+    limites["sigma_r"] = sub.groupby(CHAVE)["sigma"].mean().reindex(limites.index)
+
+    poucos = limites["n_base"] < MIN_PONTOS_BASE
+    limites.loc[poucos, ["centro", "mr_medio", "sigma_i", "sigma_r"]] = np.nan
+    limites["lic_i"] = limites["centro"] - 3 * limites["sigma_i"]
+    limites["lsc_i"] = limites["centro"] + 3 * limites["sigma_i"]
+    return limites
+
+# --- REGRAS DA WESTERN ELECTRIC ---
+
+def _contagem_janela(marcas, inicio_grupo, k):
+    """Quantas marcas há nos últimos k pontos (incluindo o atual) sem atravessar o início da carta."""
+    idx = np.arange(len(marcas))
+    acumulado = np.cumsum(marcas)
+    antes = acumulado - marcas
+    ini = np.maximum(idx - k + 1, inicio_grupo)
+    return acumulado - antes[ini], idx - ini + 1
+
+def regras_western_electric(z, grupos):
+    """Violações R1..R4 para uma sequência de valores padronizados z, com as cartas contíguas em 'grupos'.
+
+    Cada regra marca o ponto que completa o padrão. z NaN (carta sem limites) nunca viola.
+    """
+    z = np.asarray(z, dtype=float)
+    grupos = np.asarray(grupos)
+    if len(z) == 0:
+        return pd.DataFrame({regra: np.zeros(0, dtype=bool) for regra in REGRAS})
+    novo_grupo = np.r_[True, grupos[1:] != grupos[:-1]]
+    inicio_grupo = np.maximum.accumulate(np.where(novo_grupo, np.arange(len(z)), 0))
+    zz = np.nan_to_num(z, nan=0.0)
+    valido = ~np.isnan(z)
+
+    regras = {"R1": valido & (np.abs(zz) > 3)}
+    for regra, limite, m, k in (("R2", 2, 2, 3), ("R3", 1, 4, 5)):
+        acima, _ = _contagem_janela((zz > limite).astype(int), inicio_grupo, k)
+        abaixo, _ = _contagem_janela((zz < -limite).astype(int), inicio_grupo, k)
+        regras[regra] = valido & (((zz > limite) & (acima >= m)) | ((zz < -limite) & (abaixo >= m)))
+    acima, janela = _contagem_janela((valido & (zz > 0)).astype(int), inicio_grupo, 8)
+    abaixo, _ = _contagem_janela((valido & (zz < 0)).astype(int), inicio_grupo, 8)
+    regras["R4"] = (janela == 8) & ((acima == 8) | (abaixo == 8))
+    return pd.DataFrame(regras)
+
+def _marcar(carta, z):
+    regras = regras_western_electric(z, carta["_grupo"].to_numpy())
+    regras.index = carta.index
+    carta = pd.concat([carta, regras], axis=1)
+    carta["violacao"] = regras.any(axis=1)
+    return carta
+
+def _carta_individuais(sequencia, limites):
+    """Avalia uma sequência já ordenada por carta (amplitude móvel, z e regras)."""
+    carta = sequencia.join(limites[["centro", "sigma_i", "lic_i", "lsc_i"]], on=CHAVE)
+    carta["_grupo"] = carta.groupby(CHAVE, sort=False).ngroup()
+    carta["mr"] = carta.groupby("_grupo", sort=False)["valor"].diff().abs()
+    carta["z"] = (carta["valor"] - carta["centro"]) / carta["sigma_i"].where(carta["sigma_i"] > 0)
+    return _marcar(carta, carta["z"].to_numpy())
+
+def carta_individuais(leituras, limites):
+    """Carta I-MR de todas as leituras (saída de leituras_cep) contra os limites da linha de base."""
+    return _carta_individuais(leituras, limites).drop(columns="_grupo")
+
+def carta_xbarra_r(leituras, limites):
+    """Carta X̄/R com um subgrupo por dia; os limites de cada subgrupo dependem do seu tamanho n."""
+    sub = _subgrupos(leituras).join(limites[["centro", "sigma_r"]], on=CHAVE)
+    erro_padrao = sub["sigma_r"] / np.sqrt(sub["n"])
+    sub["lic_x"] = sub["centro"] - 3 * erro_padrao
+    sub["lsc_x"] = sub["centro"] + 3 * erro_padrao
+    d2 = _constante(D2, sub["n"])
+    sub["r_centro"] = (d2 * sub["sigma_r"]).where(sub["n"] >= 2)
+    sub["lic_r"] = (_constante(D3, sub["n"]) * d2 * sub["sigma_r"]).where(sub["n"] >= 2)
+    sub["lsc_r"] = (_constante(D4, sub["n"]) * d2 * sub["sigma_r"]).where(sub["n"] >= 2)
+    sub["_grupo"] = sub.groupby(CHAVE, sort=False).ngroup()
+    z = (sub["media"] - sub["centro"]) / erro_padrao.where(erro_padrao > 0)
+    sub = _marcar(sub, z.to_numpy())
+    sub["amplitude_fora"] = sub["amplitude"] > sub["lsc_r"]
+    sub["violacao"] |= sub["amplitude_fora"]
+    return sub.drop(columns="_grupo")
+
+# --- MONITOR INCREMENTAL ---
+
+class MonitorCEP:
+    """Confere pontos novos contra limites fixos guardando só a cauda de cada carta I-MR.
+
+    verificar() custa O(pontos novos + cartas tocadas): a amplitude móvel e as janelas das regras
+    usam as últimas TAMANHO_CAUDA leituras de cada carta, nunca o histórico inteiro.
+    """
+
+    def __init__(self, limites):
+        self.limites = limites
+        self.cauda = pd.DataFrame(columns=CHAVE + ["Data_dt", "linha", "valor"])
+        self.violacoes = pd.DataFrame()
+        self.chaves = None
+        self.pontos = 0
+
+    def verificar(self, novas):
+        """Avalia leituras novas (mesmas colunas de leituras_cep) e devolve só as que violam alguma regra."""
+        if novas.empty:
+            return novas.iloc[0:0]
+        novas = novas.sort_values(CHAVE + ["Data_dt", "linha"], kind="stable")
+        tocadas = pd.MultiIndex.from_frame(novas[CHAVE].drop_duplicates())
+        cauda = self.cauda.set_index(CHAVE)
+        anterior = cauda[cauda.index.isin(tocadas)].reset_index()
+        partes = [anterior.assign(_novo=False)] if not anterior.empty else []
+        sequencia = pd.concat(partes + [novas.assign(_novo=True)], ignore_index=True)
+        sequencia = sequencia.sort_values(CHAVE + ["_novo"], kind="stable").reset_index(drop=True)
+
+        carta = _carta_individuais(sequencia, self.limites)
+        avaliadas = carta[carta["_novo"]].drop(columns=["_grupo", "_novo"])
+        violadas = avaliadas[avaliadas["violacao"]]
+
+        colunas = CHAVE + ["Data_dt", "linha", "valor"]
+        ultimas = sequencia[colunas].groupby(CHAVE, sort=False).tail(TAMANHO_CAUDA)
+        intocadas = cauda[~cauda.index.isin(tocadas)].reset_index()
+        self.cauda = pd.concat([intocadas, ultimas], ignore_index=True) if not intocadas.empty else ultimas
+        if not violadas.empty:
+            self.violacoes = violadas if self.violacoes.empty else pd.concat([self.violacoes, violadas], ignore_index=True)
+        self.pontos += len(avaliadas)
+        return violadas
+
+    def atualizar(self, leituras, chaves):
+        """Confere só as leituras de linhas ainda não vistas (chaves = chaves_ensaios da carga atual).
+
+        As linhas saem de linhas_a_incorporar; quando ela manda refazer, o monitor recomeça do zero.
+        """
+        atuais, linhas, refazer = linhas_a_incorporar(self.chaves, chaves)
+        if refazer and self.chaves is not None:
+            self.__init__(self.limites)
+        self.chaves = atuais
+        return self.verificar(leituras[leituras["linha"].isin(linhas)])
@@ -0,0 +1,249 @@
+# =======================================================================
+# ARQUIVO: consulta.py (CONSULTAS SQL SOBRE AS POSIÇÕES AVALIADAS)
+# =======================================================================
+# Cada carga vira um banco SQLite em disco (sqlite3 da biblioteca padrão),
+# gravado uma vez por versão da carga e reaproveitado enquanto ela valer,
+# inclusive depois de reiniciar o processo. Três tabelas:
+#   ensaios   uma linha por ensaio (data, bancada, classe, temperatura em °C)
+#   posicoes  uma linha por posição avaliada (veredito, leituras numéricas,
+#             erros por ponto, motivo, conferência do registrador)
+#   leituras  CN/CP/CI em formato longo com a conversão da metrologia
+# Datas em texto ISO ('AAAA-MM-DD') e 'mes' como 'AAAA-MM'; os indicadores
+# de erro são 0/1. As consultas rodam direto no arquivo, abertas somente
+# para leitura, com limite de tempo e de linhas devolvidas; só o resultado
+# vai para o pandas.
+# Consultas prontas ficam em CONSULTAS_PRONTAS; as salvas pelos usuários, num
+# JSON na mesma pasta.
+# Este módulo não depende do Streamlit.
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from agregacao import leituras_metrologia
+from avaliacao import STATUS_VAZIO, classes_rtm
+
+DIRETORIO_PADRAO = os.environ.get("CONSULTA_DIR", ".consulta")
+LIMITE_LINHAS = 10000
+TEMPO_MAXIMO = 10.0          # segundos por consulta
+
+CONSULTAS_PRONTAS = {
+    "Taxa de reprovação por classe e faixa de temperatura (3º trimestre de cada ano)": """
+SELECT substr(mes, 1, 4) AS ano,
+       classe_rtm AS classe,
+       CASE WHEN temperatura < 20 THEN '< 20 °C'
+            WHEN temperatura < 25 THEN '20-25 °C'
+            WHEN temperatura < 30 THEN '25-30 °C'
+            ELSE '>= 30 °C' END AS faixa_temperatura,
+       COUNT(*) AS ensaiadas,
+       SUM(status <> 'APROVADO') AS reprovadas,
+       ROUND(100.0 * SUM(status <> 'APROVADO') / COUNT(*), 2) AS taxa_reprovacao
+FROM posicoes
+WHERE ensaiada = 1 AND temperatura IS NOT NULL
+  AND CAST(substr(mes, 6, 2) AS INTEGER) BETWEEN 7 AND 9
+GROUP BY 1, 2, 3
+ORDER BY 1 DESC, 2, 3""",
+    "Resultado por dia e bancada": """
+SELECT data, bancada,
+       SUM(status = 'APROVADO') AS aprovados,
+       SUM(status = 'REPROVADO') AS reprovados,
+       SUM(status = 'CONTRA O CONSUMIDOR') AS contra_consumidor,
+       SUM(ensaiada = 0) AS nao_ensaiados
+FROM posicoes
+GROUP BY data, bancada
+ORDER BY data DESC, bancada""",
+    "Reprovações por exatidão por posição e ponto": """
+SELECT bancada, pos,
+       SUM(erro_cn) AS cn, SUM(erro_cp) AS cp, SUM(erro_ci) AS ci,
+       COUNT(*) AS ensaiadas
+FROM posicoes
+WHERE ensaiada = 1
+GROUP BY bancada, pos
+ORDER BY (SUM(erro_cn) + SUM(erro_cp) + SUM(erro_ci)) DESC""",
+    "Erro médio mensal por bancada e ponto": """
+SELECT mes, bancada, ponto, COUNT(*) AS leituras,
+       ROUND(AVG(valor), 4) AS erro_medio,
+       ROUND(MIN(valor), 3) AS minimo, ROUND(MAX(valor), 3) AS maximo
+FROM leituras
+GROUP BY mes, bancada, ponto
+ORDER BY mes DESC, bancada, ponto""",
+    "Inconsistências do registrador por bancada e posição": """
+SELECT bancada, pos, reg_conferencia, COUNT(*) AS posicoes,
+       ROUND(AVG(reg_erro_calc), 3) AS erro_calculado_medio, ROUND(AVG(reg_erro), 3) AS reg_erro_medio
+FROM posicoes
+WHERE reg_conferencia NOT IN ('OK', 'Sem leitura')
+GROUP BY bancada, pos, reg_conferencia
+ORDER BY posicoes DESC""",
+    "Séries com 2 ou mais reprovações": """
+SELECT serie, COUNT(*) AS passagens,
+       SUM(status <> 'APROVADO') AS reprovacoes,
+       MIN(data) AS primeira, MAX(data) AS ultima
+FROM posicoes
+WHERE ensaiada = 1 AND serie <> '-'
+GROUP BY serie
+HAVING SUM(status <> 'APROVADO') >= 2
+ORDER BY reprovacoes DESC, ultima DESC""",
+}
+
+# --- TABELAS DO BANCO ---
+
+def _datas(col):
+    datas = pd.to_datetime(col)
+    return datas.dt.strftime("%Y-%m-%d"), datas.dt.strftime("%Y-%m")
+
+def tabela_ensaios(base):
+    data, mes = _datas(base["Data_dt"])
+    classe = base["Classe"] if "Classe" in base.columns else pd.Series(np.nan, index=base.index)
+    temperatura = base["Temperatura"] if "Temperatura" in base.columns else pd.Series(np.nan, index=base.index)
+    temperatura_c = base["Temperatura_C"] if "Temperatura_C" in base.columns else pd.Series(np.nan, index=base.index)
+    return pd.DataFrame({
+        "linha": base.index.to_numpy(), "data": data.to_numpy(), "mes": mes.to_numpy(),
+        "bancada": base["Bancada_Nome"].to_numpy(),
+        "n_ensaio": base["N_ENSAIO"].astype(str).to_numpy() if "N_ENSAIO" in base.columns else None,
+        "classe": classe.to_numpy(), "classe_rtm": classes_rtm(classe).to_numpy(),
+        "temperatura": temperatura_c.to_numpy(dtype=float), "temperatura_texto": temperatura.to_numpy(),
+    })
+
+def tabela_posicoes(posicoes):
+    data, mes = _datas(posicoes["Data_dt"])
+    tabela = pd.DataFrame({
+        "linha": posicoes["linha"].to_numpy(), "data": data.to_numpy(), "mes": mes.to_numpy(),
+        "bancada": posicoes["Bancada_Nome"].to_numpy(), "n_ensaio": posicoes["N_ENSAIO"].astype(str).to_numpy(),
+        "classe": posicoes["Classe"].to_numpy(), "classe_rtm": posicoes["classe_rtm"].to_numpy(),
+        "temperatura": posicoes["temperatura_c"].to_numpy(dtype=float), "pos": posicoes["pos"].to_numpy(),
+        "serie": posicoes["serie"].to_numpy(),
+        "cn": posicoes["cn_num"].to_numpy(), "cp": posicoes["cp_num"].to_numpy(), "ci": posicoes["ci_num"].to_numpy(),
+        "reg_erro": posicoes["reg_erro_num"].to_numpy(), "reg_delta": posicoes["reg_delta"].to_numpy(),
+        "reg_energia_ensaio": posicoes["reg_energia_ensaio"].to_numpy(), "reg_erro_calc": posicoes["reg_erro_calc"].to_numpy(),
+        "reg_conferencia": posicoes["reg_conferencia"].to_numpy(), "mv": posicoes["mv"].to_numpy(),
+        "limite": posicoes["limite"].to_numpy(), "status": posicoes["status"].to_numpy(),
+        "motivo": posicoes["motivo"].to_numpy(),
+    })
+    indicadores = ["erro_cn", "erro_cp", "erro_ci", "erro_exatidao", "erro_mv", "erro_registrador",
+                   "contra_consumidor_confirmado"]
+    for coluna in indicadores:
+        tabela[coluna] = posicoes[coluna].to_numpy().astype(np.int8)
+    tabela["ensaiada"] = (posicoes["status"] != STATUS_VAZIO).to_numpy().astype(np.int8)
+    return tabela
+
+def tabela_leituras(base):
+    leituras = leituras_metrologia(base)
+    data, mes = _datas(leituras["Data_dt"])
+    return pd.DataFrame({
+        "linha": leituras["linha"].to_numpy(), "data": data.to_numpy(), "mes": mes.to_numpy(),
+        "bancada": leituras["Bancada"].to_numpy(), "pos": leituras["pos"].to_numpy(),
+        "ponto": leituras["ponto"].to_numpy(), "valor": leituras["valor"].to_numpy(),
+    })
+
+INDICES = [
+    "CREATE INDEX ix_posicoes_data ON posicoes(data)",
+    "CREATE INDEX ix_posicoes_bancada_pos ON posicoes(bancada, pos)",
+    "CREATE INDEX ix_posicoes_serie ON posicoes(serie)",
+    "CREATE INDEX ix_posicoes_status ON posicoes(status)",
+    "CREATE INDEX ix_leituras_mes ON leituras(mes, bancada, ponto)",
+    "CREATE INDEX ix_ensaios_data ON ensaios(data)",
+]
+
+def construir_banco(caminho, base, posicoes, versao):
+    """Grava o banco da carga em 'caminho' (arquivo temporário + troca atômica)."""
+    caminho = Path(caminho)
+    temporario = caminho.with_name(f".{caminho.name}.{os.getpid()}.tmp")
+    temporario.unlink(missing_ok=True)
+    conexao = sqlite3.connect(temporario)
+    try:
+        conexao.execute("PRAGMA journal_mode=OFF")
+        conexao.execute("PRAGMA synchronous=OFF")
+        tabela_ensaios(base).to_sql("ensaios", conexao, index=False)
+        tabela_posicoes(posicoes).to_sql("posicoes", conexao, index=False)
+        tabela_leituras(base).to_sql("leituras", conexao, index=False)
+        for comando in INDICES:
+            conexao.execute(comando)
+        conexao.execute("CREATE TABLE carga (versao TEXT, gravado_em REAL)")
+        conexao.execute("INSERT INTO carga VALUES (?, ?)", (versao, time.time()))
+        conexao.commit()
+        conexao.execute("ANALYZE")
+    finally:
+        conexao.close()
+    os.replace(temporario, caminho)
+
+def preparar_banco(diretorio, versao, base, posicoes):
+    """Caminho do banco desta versão da carga, construído só se ainda não existe; bancos de outras versões saem."""
+    raiz = Path(diretorio)
+    raiz.mkdir(parents=True, exist_ok=True)
+    caminho = raiz / f"carga-{hashlib.sha1(str(versao).encode()).hexdigest()[:12]}.sqlite"
+    if not caminho.exists():
+        construir_banco(caminho, base, posicoes, versao)
+    for antigo in raiz.glob("carga-*.sqlite"):
+        if antigo != caminho:
+            antigo.unlink(missing_ok=True)
+    return caminho
+
+# --- EXECUÇÃO ---
+
+def executar_consulta(caminho, sql, limite_linhas=LIMITE_LINHAS, tempo_maximo=TEMPO_MAXIMO):
+    """Roda uma instrução SQL no banco aberto somente para leitura.
+
+    Devolve (DataFrame com até limite_linhas linhas, True se o resultado foi cortado, duração em s).
+    Erros de SQL, escrita ou tempo esgotado saem como sqlite3.Error.
+    """
+    inicio = time.time()
+    conexao = sqlite3.connect(f"file:{Path(caminho).resolve()}?mode=ro", uri=True, check_same_thread=False)
+    try:
+        conexao.execute("PRAGMA query_only=1")
+        conexao.set_progress_handler(lambda: int(time.time() - inicio > tempo_maximo), 10000)
+        cursor = conexao.execute(sql)
+        colunas = [d[0] for d in cursor.description or []]
+        linhas = cursor.fetchmany(limite_linhas + 1)
+    finally:
+        conexao.close()
+    cortado = len(linhas) > limite_linhas
+    return pd.DataFrame(linhas[:limite_linhas], columns=colunas), cortado, time.time() - inicio
+
+def esquema_banco(caminho):
+    """{tabela: [(coluna, tipo), ...]} para a ajuda da página."""
+    conexao = sqlite3.connect(f"file:{Path(caminho).resolve()}?mode=ro", uri=True)
+    try:
+        tabelas = [t for (t,) in conexao.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name")]
+        return {t: [(c[1], c[2]) for c in conexao.execute(f"PRAGMA table_info({t})")] for t in tabelas}
+    finally:
+        conexao.close()
+
+# --- CONSULTAS SALVAS ---
+
+_trava_salvas = threading.Lock()
+
+def _arquivo_salvas(diretorio):
+    return Path(diretorio) / "consultas.json"
+
+def consultas_salvas(diretorio):
+    """Consultas salvas pelos usuários ({nome: sql})."""
+    try:
+        return json.loads(_arquivo_salvas(diretorio).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+def _gravar_salvas(diretorio, consultas):
+    arquivo = _arquivo_salvas(diretorio)
+    arquivo.parent.mkdir(parents=True, exist_ok=True)
+    temporario = arquivo.with_name(f".{arquivo.name}.tmp")
+    temporario.write_text(json.dumps(consultas, ensure_ascii=False, indent=1), encoding="utf-8")
+    os.replace(temporario, arquivo)
+
+def salvar_consulta(diretorio, nome, sql):
+    with _trava_salvas:
+        consultas = consultas_salvas(diretorio)
+        consultas[nome] = sql
+        _gravar_salvas(diretorio, consultas)
+
+def excluir_consulta(diretorio, nome):
+    with _trava_salvas:
+        consultas = consultas_salvas(diretorio)
+        if consultas.pop(nome, None) is not None:
+            _gravar_salvas(diretorio, consultas)
@@ -0,0 +1,130 @@
+# =======================================================================
+# ARQUIVO: esquema.py (ESQUEMA DAS PLANILHAS DE BANCADA)
+# =======================================================================
+# Os cabeçalhos das abas variam (acento ou não, espaço ou sublinhado,
+# "REG_Inicio" ou "REG Inic"). O esquema é resolvido uma vez por carga:
+# cada cabeçalho é normalizado e mapeado para o nome canônico
+# (P{n}_Série, P{n}_CN, ..., P{n}_REG_Erro). Depois disso o código lê as
+# colunas por posição, com uma matriz (posição x campo) de índices.
+# Este módulo não depende do Streamlit.
+
+import re
+import unicodedata
+from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+MAX_POSICOES = 20
+CAMPOS = ["Série", "CN", "CP", "CI", "MV", "REG_Inicio", "REG_Fim", "REG_Erro"]
+
+# Variantes aceitas (já normalizadas: sem acento, maiúsculas, separadores viram "_")
+_SINONIMOS_CAMPO = {
+    "Série": ["SERIE", "N_SERIE", "NUM_SERIE", "SERIAL"],
+    "CN": ["CN"], "CP": ["CP"], "CI": ["CI"],
+    "MV": ["MV", "M_V", "MOSTRADOR"],
+    "REG_Inicio": ["REG_INICIO", "REG_INIC", "REG_INI", "REGISTRADOR_INICIO", "REG_INICIAL"],
+    "REG_Fim": ["REG_FIM", "REG_FINAL", "REGISTRADOR_FIM"],
+    "REG_Erro": ["REG_ERRO", "REG_ERR", "REG_PCT", "REGISTRADOR_ERRO"],
+}
+_SINONIMOS_ENSAIO = {
+    "Data": ["DATA", "DATA_ENSAIO"],
+    "N_ENSAIO": ["N_ENSAIO", "NO_ENSAIO", "NUM_ENSAIO", "ENSAIO"],
+    "Classe": ["CLASSE"],
+    "Temperatura": ["TEMPERATURA", "TEMP"],
+}
+_CAMPO_POR_VARIANTE = {v: campo for campo, variantes in _SINONIMOS_CAMPO.items() for v in variantes}
+_ENSAIO_POR_VARIANTE = {v: nome for nome, variantes in _SINONIMOS_ENSAIO.items() for v in variantes}
+_RE_POSICAO = re.compile(r"^P_?(\d{1,2})_(.+)$")
+
+def normalizar_cabecalho(nome):
+    """'P3_Série' -> 'P3_SERIE'; 'P3 REG Inic.' -> 'P3_REG_INIC'."""
+    sem_acento = unicodedata.normalize("NFKD", str(nome)).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^A-Z0-9]+", "_", sem_acento.upper()).strip("_")
+
+@lru_cache(maxsize=32)
+def resolver_esquema(colunas):
+    """Mapa cabeçalho original -> nome canônico para uma tupla de cabeçalhos (resolvido uma vez por layout).
+
+    Cabeçalhos que não são reconhecidos ficam como estão.
+    """
+    mapa = {}
+    for original in colunas:
+        normal = normalizar_cabecalho(original)
+        m = _RE_POSICAO.match(normal)
+        if m and 1 <= int(m.group(1)) <= MAX_POSICOES and m.group(2) in _CAMPO_POR_VARIANTE:
+            mapa[original] = f"P{int(m.group(1))}_{_CAMPO_POR_VARIANTE[m.group(2)]}"
+        elif normal in _ENSAIO_POR_VARIANTE:
+            mapa[original] = _ENSAIO_POR_VARIANTE[normal]
+        else:
+            mapa[original] = original
+    return mapa
+
+def normalizar_planilha(df):
+    """Renomeia os cabeçalhos para os nomes canônicos.
+
+    Se duas variantes caem no mesmo nome (ex.: 'REG_Inicio' e 'REG Inic' na mesma aba), as colunas são
+    unidas: vale o primeiro valor preenchido da esquerda para a direita.
+    """
+    df = df.rename(columns=resolver_esquema(tuple(df.columns)))
+    if not df.columns.duplicated().any():
+        return df
+    unidas = {}
+    for nome in dict.fromkeys(df.columns):
+        bloco = df.loc[:, df.columns == nome]
+        unidas[nome] = bloco.iloc[:, 0] if bloco.shape[1] == 1 else bloco.bfill(axis=1).iloc[:, 0]
+    return pd.DataFrame(unidas, index=df.index)
+
+@lru_cache(maxsize=32)
+def indices_posicionais(colunas):
+    """Matriz (posição 1..20 x campo) com o índice de cada coluna canônica em 'colunas' (-1 quando não existe)."""
+    posicao = {nome: i for i, nome in enumerate(colunas)}
+    indices = np.full((MAX_POSICOES, len(CAMPOS)), -1, dtype=np.int64)
+    for p in range(1, MAX_POSICOES + 1):
+        for j, campo in enumerate(CAMPOS):
+            indices[p - 1, j] = posicao.get(f"P{p}_{campo}", -1)
+    return indices
+
+def colunas_do_campo(df, campo):
+    """Índices (um por posição 1..20) das colunas de um campo em df; -1 onde a posição não tem a coluna."""
+    return indices_posicionais(tuple(df.columns))[:, CAMPOS.index(campo)]
+
+# --- TEMPERATURA ---
+
+_RE_NUMERO = r"(-?\d+(?:[.,]\d+)?)"
+
+def temperaturas_numericas(col):
+    """'25,6 °C' / '25.6' / 25.6 -> 25.6 em float; NaN quando não há número. Convertida por valor distinto."""
+    codigos, distintos = pd.factorize(col.astype(object), use_na_sentinel=True)
+    texto = pd.Series(distintos, dtype=object).astype(str).str.extract(_RE_NUMERO, expand=False)
+    valores = pd.to_numeric(texto.str.replace(",", ".", regex=False), errors="coerce").to_numpy(dtype=float)
+    return pd.Series(np.append(valores, np.nan)[codigos], index=col.index)
+
+# --- BASE DA CARGA ---
+
+def montar_base(brutos):
+    """df_completo a partir das abas brutas: cabeçalhos canônicos, datas convertidas, temperatura numérica
+    (Temperatura_C, °C) e linhas ordenadas por data."""
+    partes = []
+    for aba, df in brutos.items():
+        # Cabeçalhos das abas resolvidos para os nomes canônicos (acentos, espaços, "REG Inic" etc.)
+        df = normalizar_planilha(df)
+        df['Bancada_Nome'] = aba
+        partes.append(df)
+    df_completo = pd.concat(partes, ignore_index=True)
+
+    # Conversão e limpeza de datas
+    df_completo['Data_dt'] = pd.to_datetime(df_completo['Data'], errors='coerce', dayfirst=True)
+    df_completo = df_completo.dropna(subset=['Data_dt'])
+    df_completo['Data'] = df_completo['Data_dt'].dt.strftime('%d/%m/%y')
+    # Temperatura do ensaio convertida uma vez na carga (a coluna original segue como texto para exibição)
+    if 'Temperatura' in df_completo.columns:
+        df_completo['Temperatura_C'] = temperaturas_numericas(df_completo['Temperatura'])
+    else:
+        df_completo['Temperatura_C'] = np.nan
+    # Ordenada por data (estável: dentro do dia as linhas seguem a ordem das abas); ver periodo.py
+    df_completo = df_completo.sort_values('Data_dt', kind='stable', ignore_index=True)
+    # Identifica a carga: caches que recebem a base sem hasheá-la usam isto como chave
+    df_completo.attrs['versao'] = datetime.now().isoformat()
+    return df_completo
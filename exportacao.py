@@ -0,0 +1,121 @@
+# =======================================================================
+# ARQUIVO: exportacao.py (FILA DE EXPORTAÇÕES EM SEGUNDO PLANO)
+# =======================================================================
+# Excel e PDF são gerados num pool de threads fora do script do Streamlit:
+# a página dispara a tarefa, o usuário continua navegando e baixa o arquivo
+# quando ficar pronto. Cada tarefa tem um id derivado da sua chave (tipo de
+# relatório + versão dos dados + parâmetros), então pedidos idênticos de
+# sessões diferentes caem na mesma tarefa. Os arquivos prontos ficam num
+# cache limitado por tamanho total (os menos usados saem primeiro).
+# Este módulo não depende do Streamlit.
+
+import hashlib
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from io import BytesIO
+
+import pandas as pd
+
+NA_FILA, EXECUTANDO, PRONTO, ERRO = "na fila", "executando", "pronto", "erro"
+
+@dataclass
+class TarefaExportacao:
+    id: str
+    descricao: str
+    nome_arquivo: str
+    mime: str
+    status: str = NA_FILA
+    progresso: float = 0.0
+    resultado: bytes = None
+    erro: str = ""
+    criada: float = field(default_factory=time.time)
+    concluida: float = None
+
+    @property
+    def tamanho(self):
+        return len(self.resultado) if self.resultado else 0
+
+def id_tarefa(chave):
+    """Id estável para uma chave (tupla de valores com repr determinístico)."""
+    return hashlib.sha1(repr(chave).encode("utf-8")).hexdigest()[:16]
+
+class FilaExportacao:
+    """Pool de threads com tarefas identificadas, progresso e cache de resultados limitado por bytes."""
+
+    def __init__(self, max_workers=2, limite_bytes=200 * 1024 * 1024):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="exportacao")
+        self.limite_bytes = limite_bytes
+        self.tarefas = OrderedDict()   # ordem = uso mais recente por último
+        self.trava = threading.Lock()
+
+    def submeter(self, chave, descricao, funcao, *args, nome_arquivo="relatorio", mime=None):
+        """Enfileira funcao(progresso, *args) e devolve o id. Se a mesma chave já está na fila, executando ou
+        pronta, devolve a tarefa existente (deduplicação entre sessões); tarefas com erro são refeitas."""
+        tid = id_tarefa(chave)
+        with self.trava:
+            tarefa = self.tarefas.get(tid)
+            if tarefa is not None and tarefa.status != ERRO:
+                self.tarefas.move_to_end(tid)
+                return tid
+            tarefa = TarefaExportacao(tid, descricao, nome_arquivo, mime or "application/octet-stream")
+            self.tarefas[tid] = tarefa
+        self.executor.submit(self._executar, tarefa, funcao, args)
+        return tid
+
+    def _executar(self, tarefa, funcao, args):
+        tarefa.status = EXECUTANDO
+
+        def progresso(fracao):
+            tarefa.progresso = min(max(float(fracao), 0.0), 1.0)
+
+        try:
+            resultado = funcao(progresso, *args)
+            tarefa.resultado = bytes(resultado) if resultado is not None else b""
+            tarefa.progresso, tarefa.status = 1.0, PRONTO
+        except Exception:
+            tarefa.erro, tarefa.status = traceback.format_exc(limit=3), ERRO
+        tarefa.concluida = time.time()
+        with self.trava:
+            self._despejar()
+
+    def _despejar(self):
+        """Remove os resultados prontos menos usados até o total caber no limite (chamar com a trava)."""
+        total = sum(t.tamanho for t in self.tarefas.values())
+        for tid in list(self.tarefas):
+            if total <= self.limite_bytes:
+                break
+            tarefa = self.tarefas[tid]
+            if tarefa.status in (PRONTO, ERRO):
+                total -= tarefa.tamanho
+                del self.tarefas[tid]
+
+    def tarefa(self, tid):
+        """Tarefa pelo id (None se nunca existiu ou já foi despejada); marca como usada."""
+        with self.trava:
+            tarefa = self.tarefas.get(tid)
+            if tarefa is not None:
+                self.tarefas.move_to_end(tid)
+            return tarefa
+
+    def bytes_em_cache(self):
+        with self.trava:
+            return sum(t.tamanho for t in self.tarefas.values())
+
+# --- GERADORES DE ARQUIVO (rodam nas threads do pool) ---
+
+def excel_em_abas(progresso, abas):
+    """Um arquivo Excel com uma aba por DataFrame ({nome da aba: df}), informando o progresso por aba."""
+    saida = BytesIO()
+    with pd.ExcelWriter(saida, engine="openpyxl") as writer:
+        for i, (nome, df) in enumerate(abas.items(), start=1):
+            df.to_excel(writer, index=False, sheet_name=str(nome)[:31])
+            progresso(i / (len(abas) + 1))
+    return saida.getvalue()
+
+def assinatura_df(df):
+    """Assinatura do conteúdo de um DataFrame para compor chaves de tarefa."""
+    return int(pd.util.hash_pandas_object(df, index=False).sum()) if not df.empty else 0
@@ -0,0 +1,218 @@
+# =======================================================================
+# ARQUIVO: fontes.py (DE ONDE VÊM AS PLANILHAS)
+# =======================================================================
+# Uma fonte entrega as abas das bancadas como vieram ({nome da aba: DataFrame},
+# o nome vira Bancada_Nome) e a tabela mestra da metrologia. Há três:
+#   - Google Sheets (CSV exportado pela URL gviz), a fonte de produção;
+#   - uma pasta local com exportações CSV/XLSX (BANC_10_POS.csv, ...);
+#   - uma pasta com um retrato em Parquet (ver exportar_parquet), para rodar
+#     testes e medições sem rede.
+# As fontes em pasta só releem os arquivos que mudaram (data de modificação e
+# tamanho) e avisam mudanças por observação de arquivos (watchdog, que vem com
+# o Streamlit), então uma exportação nova aparece em segundos.
+# A fonte é escolhida pela variável de ambiente FONTE_DADOS:
+#   "sheets" (padrão), "pasta:/caminho" ou "parquet:/caminho".
+# Este módulo não depende do Streamlit.
+
+import os
+import threading
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from snapshot import vazios_como_nan
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # sem watchdog as pastas são conferidas por data de modificação
+    Observer = None
+
+ABA_MESTRA = "TABELA_MESTRA"
+
+# Planilhas de produção
+SHEET_ID = "1QxZ7bCSBClsmXLG1JOrFKNkMWZMK3P5Sp4LP81HV3Rs"
+SHEET_ID_MESTRA = "1kcN5lUZ14hwFyQMdrsFbMxjpALI4x6yd2AMCMq_who8"
+ABAS_BANCADAS = ["BANC_10_POS", "BANC_20_POS"]
+
+class FonteDados:
+    """Interface das fontes. 'descricao' identifica a fonte (entra na versão do retrato em disco)."""
+
+    descricao = ""
+    ttl = 600                  # validade de uma carga (s)
+    intervalo_minimo = 60      # menor intervalo entre duas leituras da fonte (s)
+    avisa_mudancas = False     # True: mudou() é confiável e dispensa reler a fonte para saber se há dados novos
+
+    def abas(self):
+        """Abas das bancadas: {nome da aba: DataFrame bruto}."""
+        raise NotImplementedError
+
+    def tabela_mestra(self):
+        """Tabela mestra (Serie_Bancada, Posicao, Erro_Sistematico_Pct[, Incerteza_U_Pct]) bruta, ou None."""
+        raise NotImplementedError
+
+    def mudou(self):
+        """True quando há dados novos desde a última consulta (fontes sem aviso respondem False)."""
+        return False
+
+class FonteGoogleSheets(FonteDados):
+    """Planilhas publicadas no Google Sheets, lidas como CSV."""
+
+    def __init__(self, sheet_id, abas, sheet_id_mestra=None):
+        self.sheet_id = sheet_id
+        self.nomes_abas = list(abas)
+        self.sheet_id_mestra = sheet_id_mestra
+        self.descricao = f"sheets:{sheet_id}"
+
+    def abas(self):
+        return {
+            aba: pd.read_csv(f"https://docs.google.com/spreadsheets/d/{self.sheet_id}/gviz/tq?tqx=out:csv&sheet={aba}")
+            for aba in self.nomes_abas
+        }
+
+    def tabela_mestra(self):
+        if self.sheet_id_mestra is None:
+            return None
+        return pd.read_csv(f"https://docs.google.com/spreadsheets/d/{self.sheet_id_mestra}/gviz/tq?tqx=out:csv")
+
+class FontePastaLocal(FonteDados):
+    """Pasta com uma exportação por aba (BANC_10_POS.csv, BANC_20_POS.xlsx, ...) e, opcionalmente, TABELA_MESTRA.*.
+
+    Um XLSX com várias planilhas vale como várias abas (nome de cada planilha); com uma só, vale o nome do
+    arquivo. Cada arquivo lido fica guardado com a sua data de modificação e tamanho; uma nova leitura só
+    reabre os arquivos que mudaram.
+    """
+
+    EXTENSOES = (".csv", ".xlsx", ".xls")
+    ttl = 600
+    intervalo_minimo = 1
+    avisa_mudancas = True
+
+    def __init__(self, diretorio):
+        self.diretorio = Path(diretorio)
+        self.descricao = f"pasta:{self.diretorio.resolve()}"
+        self.trava = threading.Lock()
+        self.lidos = {}            # caminho -> (assinatura do arquivo, {aba: DataFrame})
+        self.leituras = 0          # arquivos efetivamente reabertos
+        self._visto = None         # assinatura da pasta na última consulta de mudou()
+        self._aviso = threading.Event()
+        self._observador = None
+        self._ultima_conferencia = 0.0
+
+    def _arquivos(self):
+        if not self.diretorio.is_dir():
+            return {}
+        return {
+            c: (c.stat().st_mtime_ns, c.stat().st_size)
+            for c in sorted(self.diretorio.iterdir())
+            if c.is_file() and c.suffix.lower() in self.EXTENSOES and not c.name.startswith((".", "~$"))
+        }
+
+    def _ler_arquivo(self, caminho):
+        if caminho.suffix.lower() == ".csv":
+            return {caminho.stem: pd.read_csv(caminho)}
+        planilhas = pd.read_excel(caminho, sheet_name=None)
+        if len(planilhas) == 1:
+            return {caminho.stem: next(iter(planilhas.values()))}
+        return planilhas
+
+    def _todas(self):
+        """Todas as abas da pasta, relendo só os arquivos novos ou alterados."""
+        with self.trava:
+            arquivos = self._arquivos()
+            for caminho in list(self.lidos):
+                if caminho not in arquivos:
+                    del self.lidos[caminho]
+            for caminho, assinatura in arquivos.items():
+                anterior = self.lidos.get(caminho)
+                if anterior is None or anterior[0] != assinatura:
+                    self.lidos[caminho] = (assinatura, self._ler_arquivo(caminho))
+                    self.leituras += 1
+            abas = {}
+            for _, planilhas in self.lidos.values():
+                abas.update(planilhas)
+            return abas
+
+    def abas(self):
+        return {nome: df for nome, df in sorted(self._todas().items()) if nome.upper() != ABA_MESTRA}
+
+    def tabela_mestra(self):
+        return next((df for nome, df in self._todas().items() if nome.upper() == ABA_MESTRA), None)
+
+    def _observar(self):
+        """Liga o watchdog na pasta (uma vez); qualquer evento marca o aviso de mudança."""
+        if Observer is None or self._observador is not None or not self.diretorio.is_dir():
+            return
+        aviso = self._aviso
+
+        class _Aviso(FileSystemEventHandler):
+            def on_any_event(self, evento):
+                if not evento.is_directory:
+                    aviso.set()
+
+        self._observador = Observer()
+        self._observador.schedule(_Aviso(), str(self.diretorio), recursive=False)
+        self._observador.daemon = True
+        self._observador.start()
+
+    def mudou(self):
+        """Com watchdog: consome o aviso de evento. Sem ele: compara data/tamanho dos arquivos (no máximo 1x/s)."""
+        self._observar()
+        if self._visto is None:
+            self._visto = self._arquivos()
+            return False
+        if self._observador is not None:
+            if not self._aviso.is_set():
+                return False
+            self._aviso.clear()
+        elif time.time() - self._ultima_conferencia < 1:
+            return False
+        self._ultima_conferencia = time.time()
+        atual = self._arquivos()
+        mudou = atual != self._visto
+        self._visto = atual
+        return mudou
+
+class FonteParquet(FontePastaLocal):
+    """Retrato das abas em Parquet (um arquivo por aba, como gravado por exportar_parquet)."""
+
+    EXTENSOES = (".parquet",)
+
+    def __init__(self, diretorio):
+        super().__init__(diretorio)
+        self.descricao = f"parquet:{self.diretorio.resolve()}"
+
+    def _ler_arquivo(self, caminho):
+        return {caminho.stem: vazios_como_nan(pd.read_parquet(caminho))}
+
+def exportar_parquet(fonte, diretorio):
+    """Grava as abas (e a tabela mestra, se houver) de qualquer fonte numa pasta lida por FonteParquet."""
+    destino = Path(diretorio)
+    destino.mkdir(parents=True, exist_ok=True)
+    abas = dict(fonte.abas())
+    mestra = fonte.tabela_mestra()
+    if mestra is not None:
+        abas[ABA_MESTRA] = mestra
+    for nome, df in abas.items():
+        df.to_parquet(destino / f"{nome}.parquet", index=False)
+    return sorted(abas)
+
+def fonte_da_configuracao(texto, padrao):
+    """Fonte a partir de FONTE_DADOS ('sheets', 'pasta:/caminho' ou 'parquet:/caminho'); vazio usa 'padrao'."""
+    tipo, _, caminho = (texto or "").partition(":")
+    tipo = tipo.strip().lower()
+    if tipo in ("", "sheets"):
+        return padrao
+    if tipo == "pasta" and caminho:
+        return FontePastaLocal(caminho)
+    if tipo == "parquet" and caminho:
+        return FonteParquet(caminho)
+    raise ValueError(f"FONTE_DADOS inválida: {texto!r} (use 'sheets', 'pasta:/caminho' ou 'parquet:/caminho').")
+
+def fonte_producao():
+    """Google Sheets de produção (abas das bancadas e tabela mestra)."""
+    return FonteGoogleSheets(SHEET_ID, ABAS_BANCADAS, SHEET_ID_MESTRA)
+
+def fonte_do_ambiente(padrao):
+    return fonte_da_configuracao(os.environ.get("FONTE_DADOS", ""), padrao)
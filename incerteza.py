@@ -0,0 +1,164 @@
+# =======================================================================
+# ARQUIVO: incerteza.py (CORREÇÃO PELO ERRO SISTEMÁTICO E PROBABILIDADE DE CONFORMIDADE)
+# =======================================================================
+# A leitura de cada ponto (CN/CP/CI) é corrigida pelo erro sistemático da
+# posição da bancada (tabela mestra) e recebe uma incerteza padrão combinada.
+# Com a distribuição normal, a probabilidade de o erro verdadeiro estar dentro
+# de ±limite sai em operações de array sobre todas as posições do mês.
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from agregacao import posicoes_metrologia, valores_metrologia
+
+PONTOS = ["cn", "cp", "ci"]
+U_PADRAO = 0.05                 # incerteza expandida (%) quando a posição não está na tabela mestra
+FATOR_ABRANGENCIA = 2.0         # k da incerteza expandida informada na tabela mestra
+RESOLUCAO_LEITURA = 0.001       # resolução (%) das leituras de erro da bancada
+PROB_CONFORMIDADE_MIN = 0.95    # abaixo disso (e dentro do limite) a posição vai para a ZONA CRÍTICA
+STATUS_VAZIO = "Não Ligou / Não Ensaido"
+
+# Limites RTM IPEM por classe (A-D e eletromecânicos 1/2)
+LIMITES_CLASSE = {"A": 1.0, "B": 1.3, "C": 2.0, "D": 0.3, "1": 2.0, "2": 4.0}
+
+# Padrões MQN cadastrados por planilha (<planilha>_<MQN>) e o número de série de cada um na tabela mestra
+MAPA_BANCADA_SERIE = {
+    'BANC_10_POS_MQN-1': 'B1172110310148',
+    'BANC_20_POS_MQN-2': '85159',
+    'BANC_20_POS_MQN-3': '93959',
+    'BANC_3_MQN-4': '96850'
+}
+
+# Padrão em uso em cada planilha (Bancada_Nome). A BANC_20_POS tem dois padrões cadastrados; vale o MQN-2
+# até que SERIES_REFERENCIA diga outro (ex.: "BANC_20_POS=MQN-3" ou "BANC_20_POS=93959", separados por vírgula).
+PADRAO_PLANILHA = {
+    'BANC_10_POS': 'MQN-1',
+    'BANC_20_POS': 'MQN-2',
+    'BANC_3': 'MQN-4',
+}
+
+def series_referencia(configuracao=""):
+    """Planilha -> número de série da bancada de referência, com os ajustes de SERIES_REFERENCIA aplicados."""
+    padroes = dict(PADRAO_PLANILHA)
+    for item in filter(None, (parte.strip() for parte in configuracao.split(","))):
+        planilha, _, valor = item.partition("=")
+        if not valor.strip():
+            raise ValueError(f"SERIES_REFERENCIA: esperado <planilha>=<MQN ou série>, veio {item!r}")
+        padroes[planilha.strip()] = valor.strip()
+    return {planilha: MAPA_BANCADA_SERIE.get(f"{planilha}_{padrao}", padrao) for planilha, padrao in padroes.items()}
+
+SERIE_REFERENCIA_PLANILHA = series_referencia(os.environ.get("SERIES_REFERENCIA", ""))
+
+def serie_referencia_bancada(bancada):
+    """Série de referência da planilha pelo nome exato; None quando a planilha não tem padrão definido."""
+    return SERIE_REFERENCIA_PLANILHA.get(str(bancada))
+
+def _erf(x):
+    """Função erro (Abramowitz & Stegun 7.1.26, erro < 1,5e-7), sem depender do scipy."""
+    sinal = np.sign(x)
+    x = np.abs(x)
+    t = 1.0 / (1.0 + 0.3275911 * x)
+    poli = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    return sinal * (1.0 - poli * np.exp(-x * x))
+
+def normal_acumulada(x):
+    return 0.5 * (1.0 + _erf(np.asarray(x, dtype=float) / np.sqrt(2.0)))
+
+def referencias_por_posicao(df_mestra):
+    """Tabela mestra indexada por (Serie_Bancada, Posicao) com erro sistemático e incerteza expandida."""
+    if df_mestra is None or df_mestra.empty:
+        return pd.DataFrame(columns=["erro_ref", "inc_banc"],
+                            index=pd.MultiIndex.from_tuples([], names=["serie_bancada", "pos"]))
+    ref = pd.DataFrame({
+        "serie_bancada": df_mestra["Serie_Bancada"].astype(str).to_numpy(),
+        "pos": pd.to_numeric(df_mestra["Posicao"], errors="coerce").to_numpy(),
+        "erro_ref": pd.to_numeric(df_mestra["Erro_Sistematico_Pct"], errors="coerce").to_numpy(),
+        "inc_banc": pd.to_numeric(df_mestra.get("Incerteza_U_Pct", pd.Series(np.nan, index=df_mestra.index)),
+                                  errors="coerce").to_numpy(),
+    }).dropna(subset=["pos"])
+    ref["pos"] = ref["pos"].astype(int)
+    return ref.groupby(["serie_bancada", "pos"]).mean()
+
+def probabilidade_conformidade(corrigido, incerteza, limite):
+    """P(|erro verdadeiro| <= limite) para leituras corrigidas com incerteza padrão u (arrays que se alinham por broadcast)."""
+    u = np.where(incerteza > 0, incerteza, np.nan)
+    p = normal_acumulada((limite - corrigido) / u) - normal_acumulada((-limite - corrigido) / u)
+    # Sem incerteza a decisão é determinística
+    determinista = (np.abs(corrigido) <= limite).astype(float)
+    return np.where(np.isnan(u), determinista, p)
+
+def avaliar_conformidade(df_met, referencias, series_bancada):
+    """Corrige as leituras do mês, combina as incertezas e reclassifica o status a partir das probabilidades.
+
+    df_met: uma linha por posição ensaiada (Bancada, pos, cn, cp, ci, limite_rtm). series_bancada: Series
+    alinhada a df_met com o número de série da bancada de referência (NaN quando não há). Devolve uma cópia
+    com erro_ref, inc_banc, leituras corrigidas (*_corr), u_c, p_* por ponto, p_conformidade, status, detalhe
+    e sem_referencia. Sem (série, posição) na tabela mestra a linha fica com sem_referencia=True e erro_ref
+    vazio: a leitura segue sem correção e com a incerteza U_PADRAO.
+    """
+    df = df_met.copy()
+    if df.empty:
+        return df
+    chave = pd.MultiIndex.from_arrays([series_bancada.astype(str).to_numpy(), df["pos"].astype(int).to_numpy()])
+    ref = referencias.reindex(chave)
+    erro_ref = ref["erro_ref"].to_numpy(dtype=float)
+    sem_referencia = np.isnan(erro_ref)
+    inc_banc = ref["inc_banc"].to_numpy(dtype=float)
+    inc_banc = np.where(np.isnan(inc_banc), U_PADRAO, inc_banc)
+
+    leituras = df[PONTOS].to_numpy(dtype=float)                      # N x 3
+    corrigido = leituras - np.where(sem_referencia, 0.0, erro_ref)[:, None]
+    u_c = np.sqrt((inc_banc / FATOR_ABRANGENCIA) ** 2 + RESOLUCAO_LEITURA ** 2 / 12)
+    limite = df["limite_rtm"].to_numpy(dtype=float)[:, None]
+    p = probabilidade_conformidade(corrigido, u_c[:, None], limite)
+    medido = ~np.isnan(leituras)
+    p = np.where(medido, p, np.nan)
+
+    vazio = ~medido.any(axis=1)
+    fora = medido & (np.abs(corrigido) > limite)
+    p_conf = np.where(vazio, np.nan, np.prod(np.where(medido, p, 1.0), axis=1))
+    reprovado = fora.any(axis=1)
+    critico = ~vazio & ~reprovado & (p_conf < PROB_CONFORMIDADE_MIN)
+
+    df["erro_ref"], df["inc_banc"], df["u_c"] = erro_ref, inc_banc, u_c
+    df["sem_referencia"] = sem_referencia
+    for i, ponto in enumerate(PONTOS):
+        df[f"{ponto}_corr"] = corrigido[:, i]
+        df[f"p_{ponto}"] = p[:, i]
+    df["p_conformidade"] = p_conf
+    df["status"] = np.select([vazio, reprovado, critico], [STATUS_VAZIO, "REPROVADO", "ZONA CRÍTICA"], "APROVADO")
+
+    pontos_fora = pd.Series("", index=df.index)
+    for i, ponto in enumerate(PONTOS):
+        pontos_fora += np.where(fora[:, i], ponto.upper() + ", ", "")
+    pontos_fora = pontos_fora.str.rstrip(", ")
+    limites_txt = df["limite_rtm"].astype(str)
+    p_txt = pd.Series(np.round(p_conf * 100, 1), index=df.index).astype(str)
+    df["detalhe"] = np.select(
+        [reprovado, critico],
+        ["⚠️ Excedeu " + limites_txt + "% em: " + pontos_fora, "⚠️ P(conforme) = " + p_txt + "%"], "")
+    df["detalhe"] = df["detalhe"] + np.where((reprovado | critico) & sem_referencia, " (sem referência: leitura não corrigida)", "")
+    return df
+
+# --- A PARTIR DA FONTE (processos sem o painel: vigia.py, api.py) ---
+
+def referencias_da_fonte(fonte):
+    """Erro sistemático e incerteza por (série da bancada, posição) a partir da tabela mestra bruta da fonte."""
+    bruta = fonte.tabela_mestra()
+    if bruta is None:
+        return referencias_por_posicao(None)
+    mestra = bruta.copy()
+    for coluna in ("Erro_Sistematico_Pct", "Incerteza_U_Pct"):
+        if coluna in mestra.columns:
+            mestra[coluna] = valores_metrologia(mestra[coluna])
+    return referencias_por_posicao(mestra)
+
+def avaliar_metrologia(bloco, referencias):
+    """posicoes_metrologia + avaliar_conformidade das linhas do bloco (como processar_metrologia_mes), com 'linha'."""
+    metrologia = posicoes_metrologia(bloco, LIMITES_CLASSE, com_linha=True)
+    if metrologia.empty:
+        return metrologia
+    series = metrologia["Bancada"].map({b: serie_referencia_bancada(b) for b in metrologia["Bancada"].unique()})
+    return avaliar_conformidade(metrologia, referencias, series)
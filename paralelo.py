@@ -0,0 +1,162 @@
+# =======================================================================
+# ARQUIVO: paralelo.py (AVALIAÇÃO EM PROCESSOS POR MÊS x BANCADA)
+# =======================================================================
+# Dentro do Streamlit a avaliação roda numa thread só, mesmo vetorizada. Aqui
+# a tabela é dividida em partições (linhas de um mês de uma bancada), cada
+# partição é avaliada num processo de um pool e os resultados parciais são
+# juntados no processo da página pela ordem original das linhas.
+# A tabela vai para os processos uma única vez: serializada em Arrow IPC num
+# bloco de memória compartilhada (multiprocessing.shared_memory), de onde cada
+# tarefa recorta só as linhas da sua partição. Cada tarefa leva apenas o nome
+# do bloco e os números das linhas.
+# O modo é escolhido pela variável de ambiente MODO_AVALIACAO:
+#   "serial" (padrão) ou "processos"; PROCESSOS_AVALIACAO fixa o número de
+#   processos (padrão: um por núcleo).
+# As funções mandadas para os processos precisam ser de nível de módulo.
+# Este módulo não depende do Streamlit.
+
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from agregacao import posicoes_metrologia
+from snapshot import vazios_como_nan
+
+# --- PARTIÇÕES ---
+
+def particoes_mes_bancada(indice):
+    """Números das linhas de cada (mês, bancada) de uma tabela com IndicePeriodo, ordenados por mês e bancada."""
+    particoes = []
+    for bancada in indice.particoes:
+        for linhas in indice.linhas_blocos(bancada=bancada, unidade="M"):
+            particoes.append((indice.datas[linhas[0]].to_period("M"), bancada, linhas))
+    particoes.sort(key=lambda p: (p[0], p[1]))
+    return [linhas for _, _, linhas in particoes]
+
+def particoes_bancada(tabela, coluna_bancada="Bancada_Nome"):
+    """Números das linhas de cada bancada (para recortes que já são de um mês só)."""
+    return list(tabela.groupby(coluna_bancada, sort=True).indices.values())
+
+# --- MEMÓRIA COMPARTILHADA ---
+
+class TabelaCompartilhada:
+    """DataFrame em Arrow IPC (índice incluído) num bloco de memória compartilhada, até fechar()."""
+
+    def __init__(self, tabela):
+        tabela_arrow = pa.Table.from_pandas(tabela, preserve_index=True)
+        saida = pa.BufferOutputStream()
+        with pa.ipc.new_file(saida, tabela_arrow.schema) as escritor:
+            escritor.write_table(tabela_arrow)
+        conteudo = saida.getvalue()
+        self.tamanho = conteudo.size
+        self.memoria = SharedMemory(create=True, size=max(self.tamanho, 1))
+        self.memoria.buf[:self.tamanho] = memoryview(conteudo).cast("B")
+        self.nome = self.memoria.name
+
+    def fechar(self):
+        self.memoria.close()
+        self.memoria.unlink()
+
+def _recortar(memoria, tamanho, linhas):
+    # Em função separada: as referências do Arrow à memória somem no retorno, antes do close().
+    tabela = pa.ipc.open_file(pa.py_buffer(memoria.buf[:tamanho])).read_all()
+    return vazios_como_nan(tabela.take(pa.array(linhas)).to_pandas())
+
+def _executar_particao(nome, tamanho, linhas, funcao, args):
+    """Roda no processo do pool: abre o bloco, recorta as linhas da partição e aplica funcao(bloco, *args)."""
+    memoria = SharedMemory(name=nome)
+    try:
+        bloco = _recortar(memoria, tamanho, linhas)
+    finally:
+        memoria.close()
+    return funcao(bloco, *args)
+
+# --- TAREFAS E JUNÇÃO DOS PARCIAIS ---
+
+def metrologia_particao(bloco, limites_classe):
+    """posicoes_metrologia da partição com a linha de origem de cada posição (para juntar_por_linha)."""
+    return posicoes_metrologia(bloco, limites_classe, com_linha=True)
+
+def juntar_por_linha(partes, tabela, coluna="linha"):
+    """Concatena tabelas parciais na ordem das linhas de origem em 'tabela' (mesma saída do cálculo serial)."""
+    partes = [p for p in partes if not p.empty] or partes[:1]
+    junta = pd.concat(partes, ignore_index=True)
+    ordem = np.argsort(tabela.index.get_indexer(junta[coluna]), kind="stable")
+    return junta.iloc[ordem].reset_index(drop=True)
+
+# --- EXECUTORES ---
+
+class AvaliadorSerial:
+    """Executa as partições em sequência, no próprio processo."""
+
+    modo = "serial"
+    processos = 1
+
+    def mapear(self, tabela, funcao, particoes, *args, chave=None):
+        """[funcao(recorte da partição, *args) para cada partição], na ordem das partições."""
+        return [funcao(tabela.iloc[linhas], *args) for linhas in particoes]
+
+class AvaliadorProcessos(AvaliadorSerial):
+    """Executa as partições num pool de processos, lendo a tabela da memória compartilhada.
+
+    'chave' (ex.: a versão da carga) identifica uma tabela reaproveitável entre chamadas: o bloco fica aberto
+    e só as duas chaves mais recentes são mantidas. Sem chave, o bloco dura só a chamada.
+    """
+
+    modo = "processos"
+
+    def __init__(self, processos=None, contexto="spawn"):
+        self.processos = processos or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(max_workers=self.processos,
+                                            mp_context=multiprocessing.get_context(contexto))
+        self.trava = threading.Lock()
+        self.compartilhadas = OrderedDict()   # chave -> TabelaCompartilhada
+
+    def _compartilhar(self, tabela, chave):
+        with self.trava:
+            compartilhada = self.compartilhadas.get(chave)
+            if compartilhada is None:
+                compartilhada = self.compartilhadas[chave] = TabelaCompartilhada(tabela)
+                while len(self.compartilhadas) > 2:
+                    self.compartilhadas.popitem(last=False)[1].fechar()
+            self.compartilhadas.move_to_end(chave)
+            return compartilhada
+
+    def mapear(self, tabela, funcao, particoes, *args, chave=None):
+        if len(particoes) <= 1:
+            return super().mapear(tabela, funcao, particoes, *args)
+        compartilhada = TabelaCompartilhada(tabela) if chave is None else self._compartilhar(tabela, chave)
+        try:
+            futuros = [self.executor.submit(_executar_particao, compartilhada.nome, compartilhada.tamanho,
+                                            linhas, funcao, args)
+                       for linhas in particoes]
+            return [futuro.result() for futuro in futuros]
+        finally:
+            if chave is None:
+                compartilhada.fechar()
+
+    def encerrar(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        with self.trava:
+            while self.compartilhadas:
+                self.compartilhadas.popitem()[1].fechar()
+
+def avaliador_da_configuracao(modo, processos=None):
+    """Executor para MODO_AVALIACAO ('serial' ou 'processos'); vazio é serial."""
+    modo = (modo or "serial").strip().lower()
+    if modo == "serial":
+        return AvaliadorSerial()
+    if modo == "processos":
+        return AvaliadorProcessos(processos)
+    raise ValueError(f"MODO_AVALIACAO inválido: {modo!r} (use 'serial' ou 'processos').")
+
+def avaliador_do_ambiente():
+    processos = os.environ.get("PROCESSOS_AVALIACAO", "").strip()
+    return avaliador_da_configuracao(os.environ.get("MODO_AVALIACAO", ""), int(processos) if processos else None)
@@ -0,0 +1,80 @@
+# =======================================================================
+# ARQUIVO: periodo.py (CONSULTA POR PERÍODO EM TABELAS ORDENADAS POR DATA)
+# =======================================================================
+# A base da carga (e a tabela de posições, que segue a ordem das linhas) fica
+# ordenada por data. O índice guarda as datas num DatetimeIndex e, para cada
+# bancada, as linhas dela com as suas datas: dia, mês ou intervalo viram dois
+# searchsorted e um recorte, O(log n + k), sem comparar a coluna inteira nem
+# materializar .dt.date a cada filtro.
+# Este módulo não depende do Streamlit.
+
+import numpy as np
+import pandas as pd
+
+class IndicePeriodo:
+    """Índice de datas de uma tabela ordenada por data, com uma partição por bancada."""
+
+    def __init__(self, tabela, coluna_data="Data_dt", coluna_bancada="Bancada_Nome"):
+        datas = tabela[coluna_data].to_numpy(dtype="datetime64[ns]")
+        if len(datas) and (np.isnat(datas).any() or (datas[1:] < datas[:-1]).any()):
+            raise ValueError(f"A tabela precisa estar ordenada por '{coluna_data}' e sem datas vazias.")
+        self.tabela = tabela
+        self.datas = pd.DatetimeIndex(datas)
+        self.particoes = {
+            bancada: (linhas, datas[linhas])
+            for bancada, linhas in tabela.groupby(coluna_bancada, sort=True).indices.items()
+        }
+        self.meses_disponiveis = np.unique(datas.astype("datetime64[M]"))
+
+    def _intervalo(self, inicio, fim_exclusivo, bancada):
+        """Números das linhas em [inicio, fim_exclusivo): um range (todas as bancadas) ou a fatia da partição."""
+        if bancada is None:
+            datas, linhas = self.datas, None
+        elif bancada in self.particoes:
+            linhas, datas = self.particoes[bancada]
+        else:
+            return np.zeros(0, dtype=np.int64)
+        a = 0 if inicio is None else datas.searchsorted(np.datetime64(pd.Timestamp(inicio), "ns"), side="left")
+        b = len(datas) if fim_exclusivo is None else datas.searchsorted(np.datetime64(pd.Timestamp(fim_exclusivo), "ns"), side="left")
+        return slice(a, b) if linhas is None else linhas[a:b]
+
+    def _recorte(self, inicio, fim_exclusivo, bancada):
+        return self.tabela.iloc[self._intervalo(inicio, fim_exclusivo, bancada)]
+
+    def periodo(self, inicio=None, fim=None, bancada=None):
+        """Linhas de inicio até fim (dias inteiros, fim incluído), de todas as bancadas ou de uma."""
+        fim_exclusivo = None if fim is None else pd.Timestamp(fim).normalize() + pd.Timedelta(days=1)
+        return self._recorte(inicio, fim_exclusivo, bancada)
+
+    def dia(self, data, bancada=None):
+        return self.periodo(data, data, bancada)
+
+    def mes(self, ano, mes, bancada=None):
+        inicio = pd.Timestamp(year=int(ano), month=int(mes), day=1)
+        return self._recorte(inicio, inicio + pd.DateOffset(months=1), bancada)
+
+    def anos(self):
+        """Anos com dados, em ordem crescente."""
+        return sorted({int(str(m)[:4]) for m in self.meses_disponiveis})
+
+    def meses(self, ano):
+        """Meses (1..12) com dados no ano."""
+        return [int(str(m)[5:7]) for m in self.meses_disponiveis if int(str(m)[:4]) == int(ano)]
+
+    def linhas_blocos(self, inicio=None, fim=None, bancada=None, unidade="M"):
+        """Números das linhas de cada bloco (mês 'M', semana 'W' ou dia 'D') do intervalo, em ordem de data."""
+        fim_exclusivo = None if fim is None else pd.Timestamp(fim).normalize() + pd.Timedelta(days=1)
+        linhas = self._intervalo(inicio, fim_exclusivo, bancada)
+        if isinstance(linhas, slice):
+            linhas = np.arange(linhas.start, linhas.stop)
+        if len(linhas) == 0:
+            return []
+        periodos = self.datas.to_numpy()[linhas].astype(f"datetime64[{unidade}]")
+        cortes = np.flatnonzero(periodos[1:] != periodos[:-1]) + 1
+        return np.split(linhas, cortes)
+
+    def blocos(self, inicio=None, fim=None, bancada=None, unidade="M"):
+        """Como agregacao.blocos_por_periodo, mas sem máscara sobre a tabela inteira: o intervalo sai da busca
+        binária e cada bloco é um trecho contíguo dele (ver linhas_blocos)."""
+        for grupo in self.linhas_blocos(inicio, fim, bancada, unidade):
+            yield self.tabela.iloc[grupo]
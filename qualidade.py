@@ -0,0 +1,117 @@
+# =======================================================================
+# ARQUIVO: qualidade.py (QUALIDADE DOS DADOS NA CARGA DA PLANILHA)
+# =======================================================================
+# Perfil de cada coluna P{n}_* e detecção de células suspeitas logo na carga:
+# texto que não é número (separador errado, coluna deslocada), valores fora
+# de escala (que valor_num_metrologia dividiria por 1000 e processar_ensaio
+# mostraria como "ERRO") e outliers pela mediana/MAD de cada posição de
+# bancada. As células suspeitas vão para uma tabela de quarentena para
+# revisão; as contagens são acumuladas só com as linhas novas de cada carga.
+# Este módulo não depende do Streamlit.
+
+import numpy as np
+import pandas as pd
+
+from avaliacao import grade_posicoes, valores_longos, linhas_a_incorporar, _por_valores_distintos
+
+CAMPOS_ROBUSTOS = ["CN", "CP", "CI"]                 # erros de exatidão em %: mediana/MAD e escala
+CAMPOS_ESCALA = ["REG_Erro"]                          # erro do registrador: só escala (a regra RTM já julga o resto)
+CAMPOS_NUMERICOS = ["REG_Inicio", "REG_Fim"]          # leituras de energia: só conferem se são números
+TOKENS_VAZIOS = ["", "-", "None", "nan", "NaN", "SEM LEITURA", "ERRO"]
+LIMITE_ESCALA = 100.0
+LIMITE_Z_ROBUSTO = 5.0
+MAD_MINIMO = 0.01
+MOTIVOS = {"nao_numerico": "Não numérico", "fora_escala": "Fora de escala (>100)", "outlier": "Outlier (mediana/MAD)"}
+
+def _bruto_distintos(s):
+    txt = s.astype(str).str.strip()
+    vazio = txt.isin(TOKENS_VAZIOS)
+    limpo = txt.str.replace("%", "", regex=False).str.replace("+", "", regex=False)
+    limpo = limpo.str.replace(" ", "", regex=False).str.replace(",", ".", regex=False)
+    valor = pd.to_numeric(limpo.mask(vazio), errors="coerce").astype(float)
+    # NaN: vazio; inf: preenchido mas não numérico
+    return valor.where(vazio | valor.notna(), np.inf)
+
+def celulas_longas(df_completo):
+    """Uma linha por célula P{pos}_{campo}: linha (índice do ensaio), Bancada, pos, campo, bruto e valor."""
+    linhas, pos = grade_posicoes(df_completo)
+    indice = df_completo.index.to_numpy()[linhas]
+    bancadas = df_completo["Bancada_Nome"].to_numpy()[linhas]
+    partes = []
+    for campo in CAMPOS_ROBUSTOS + CAMPOS_ESCALA + CAMPOS_NUMERICOS:
+        brutos = pd.Series(valores_longos(df_completo, campo, linhas, pos))
+        valor = _por_valores_distintos(brutos, _bruto_distintos, np.nan).astype(float).to_numpy()
+        partes.append(pd.DataFrame({
+            "linha": indice, "Bancada": bancadas, "pos": pos, "campo": campo,
+            "bruto": brutos.to_numpy(), "valor": np.where(np.isinf(valor), np.nan, valor),
+            "preenchida": ~np.isnan(valor), "nao_numerico": np.isinf(valor),
+        }))
+    return pd.concat(partes, ignore_index=True)
+
+def estatisticas_robustas(celulas):
+    """Mediana e MAD por (Bancada, pos, campo) dos valores numéricos dentro da escala."""
+    ok = celulas["campo"].isin(CAMPOS_ROBUSTOS) & celulas["valor"].notna() & (celulas["valor"].abs() <= LIMITE_ESCALA)
+    base = celulas.loc[ok, ["Bancada", "pos", "campo", "valor"]]
+    grupos = base.groupby(["Bancada", "pos", "campo"])["valor"]
+    desvio = (base["valor"] - grupos.transform("median")).abs()
+    return pd.DataFrame({
+        "mediana": grupos.median(),
+        "mad": desvio.groupby([base["Bancada"], base["pos"], base["campo"]]).median(),
+    })
+
+def marcar_suspeitas(celulas, estatisticas):
+    """Acrescenta z robusto e o motivo (vazio quando a célula está ok) a cada célula."""
+    ref = estatisticas.reindex(pd.MultiIndex.from_frame(celulas[["Bancada", "pos", "campo"]]))
+    escala = np.maximum(ref["mad"].to_numpy(), MAD_MINIMO)
+    z = 0.6745 * (celulas["valor"].to_numpy() - ref["mediana"].to_numpy()) / escala
+    robusto = celulas["campo"].isin(CAMPOS_ROBUSTOS).to_numpy()
+    com_escala = robusto | celulas["campo"].isin(CAMPOS_ESCALA).to_numpy()
+    fora_escala = com_escala & (celulas["valor"].abs().to_numpy() > LIMITE_ESCALA)
+    outlier = robusto & ~fora_escala & (np.abs(np.nan_to_num(z)) > LIMITE_Z_ROBUSTO)
+    celulas = celulas.assign(fora_escala=fora_escala, outlier=outlier, z=np.where(robusto, z, np.nan))
+    celulas["motivo"] = np.select([celulas["nao_numerico"].to_numpy(), fora_escala, outlier],
+                                  [MOTIVOS["nao_numerico"], MOTIVOS["fora_escala"], MOTIVOS["outlier"]], "")
+    return celulas
+
+def metricas_qualidade(celulas):
+    """Contagens aditivas por (Bancada, campo): somadas entre cargas sem recontar o histórico."""
+    return celulas.assign(celulas=1).groupby(["Bancada", "campo"])[
+        ["celulas", "preenchida", "nao_numerico", "fora_escala", "outlier"]
+    ].sum().rename(columns={"preenchida": "preenchidas"}).astype(np.int64)
+
+def tabela_quarentena(celulas, df_completo):
+    """Células suspeitas com a identificação do ensaio, prontas para revisão."""
+    suspeitas = celulas[celulas["motivo"] != ""]
+    ensaio = df_completo.loc[suspeitas["linha"], ["Data", "N_ENSAIO"]].to_numpy()
+    return pd.DataFrame({
+        "linha": suspeitas["linha"].to_numpy(), "Data": ensaio[:, 0], "Bancada": suspeitas["Bancada"].to_numpy(),
+        "N_ENSAIO": ensaio[:, 1], "Posição": suspeitas["pos"].to_numpy(),
+        "Coluna": "P" + suspeitas["pos"].astype(str).to_numpy() + "_" + suspeitas["campo"].to_numpy(),
+        "Valor na planilha": suspeitas["bruto"].astype(str).to_numpy(), "z robusto": suspeitas["z"].round(1).to_numpy(),
+        "Motivo": suspeitas["motivo"].to_numpy(),
+    })
+
+def atualizar_qualidade(estado, df_completo, chaves):
+    """Confere só as linhas ainda não vistas e acumula quarentena e métricas.
+
+    estado: None ou {"chaves", "estatisticas", "quarentena", "metricas"}. As linhas a conferir saem de
+    linhas_a_incorporar. A mediana/MAD de referência é calculada quando tudo é refeito e fica fixa; as linhas
+    novas são comparadas contra ela.
+    """
+    atuais, linhas, refazer = linhas_a_incorporar(None if estado is None else estado["chaves"], chaves)
+    if refazer:
+        df_linhas = df_completo.loc[linhas]
+        celulas = celulas_longas(df_linhas)
+        estatisticas = estatisticas_robustas(celulas)
+        celulas = marcar_suspeitas(celulas, estatisticas)
+        return {"chaves": atuais, "estatisticas": estatisticas,
+                "quarentena": tabela_quarentena(celulas, df_linhas), "metricas": metricas_qualidade(celulas)}
+    if len(linhas) == 0:
+        return estado
+    df_novas = df_completo.loc[linhas]
+    celulas = marcar_suspeitas(celulas_longas(df_novas), estado["estatisticas"])
+    return {
+        "chaves": atuais, "estatisticas": estado["estatisticas"],
+        "quarentena": pd.concat([estado["quarentena"], tabela_quarentena(celulas, df_novas)], ignore_index=True),
+        "metricas": estado["metricas"].add(metricas_qualidade(celulas), fill_value=0).astype(np.int64),
+    }
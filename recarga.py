@@ -0,0 +1,127 @@
+# =======================================================================
+# ARQUIVO: recarga.py (RECARGA ÚNICA DAS FONTES EXTERNAS)
+# =======================================================================
+# Um valor buscado numa fonte externa (planilha do Google Sheets) e mantido
+# pelo processo. Só uma busca roda por vez: na primeira carga as sessões
+# esperam por ela; depois que o valor expira, a sessão que percebe dispara a
+# busca numa thread e todas continuam recebendo a versão anterior até a nova
+# chegar. A validade tem um sorteio (jitter) para as fontes não vencerem
+# juntas, e há um intervalo mínimo entre buscas (inclusive depois de falha).
+# As contagens ficam em metricas().
+# Este módulo não depende do Streamlit.
+
+import random
+import threading
+import time
+
+class RecargaCoalescida:
+    """Valor recarregado por uma única busca de cada vez, servindo a versão anterior durante a recarga.
+
+    buscar(): função sem argumentos que devolve o valor novo (exceções contam como falha).
+    inicial(): opcional; valor provisório para a primeira chamada (ex.: retrato em disco). Se devolver
+    algo diferente de None, esse valor é servido na hora e a busca começa em segundo plano.
+    """
+
+    def __init__(self, nome, buscar, ttl=600, jitter=0.1, intervalo_minimo=60, inicial=None):
+        self.nome = nome
+        self.buscar = buscar
+        self.ttl = ttl
+        self.jitter = jitter
+        self.intervalo_minimo = intervalo_minimo
+        self.inicial = inicial
+        self.trava = threading.Lock()
+        self.pronto = threading.Condition(self.trava)
+        self.valor = None
+        self.tem_valor = False
+        self.geracao = 0
+        self.expira_em = 0.0
+        self.ultima_tentativa = None
+        self.ultimo_erro = None
+        self.atualizando = False
+        self.contagem = {"buscas": 0, "falhas": 0, "aguardaram": 0, "servidas_anteriores": 0,
+                         "adiadas_pelo_limite": 0, "iniciais": 0}
+        self.ultima_duracao = None
+        self.ultima_busca = None
+
+    def _validade(self):
+        return self.ttl * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def _executar(self):
+        """Roda buscar() fora da trava e publica o resultado (chamar com self.atualizando já marcado)."""
+        inicio = time.time()
+        try:
+            valor, erro = self.buscar(), None
+        except Exception as e:
+            valor, erro = None, e
+        with self.trava:
+            self.atualizando = False
+            self.contagem["buscas"] += 1
+            self.ultima_duracao, self.ultima_busca = time.time() - inicio, time.time()
+            if erro is None:
+                self.valor, self.tem_valor, self.ultimo_erro = valor, True, None
+                self.geracao += 1
+                self.expira_em = time.time() + self._validade()
+            else:
+                self.contagem["falhas"] += 1
+                self.ultimo_erro = erro
+            self.pronto.notify_all()
+
+    def _pode_buscar(self, agora):
+        return self.ultima_tentativa is None or agora - self.ultima_tentativa >= self.intervalo_minimo
+
+    def obter(self):
+        """Valor atual. Sem valor ainda: espera a busca em andamento (ou faz a primeira). Valor vencido: dispara
+        a recarga em segundo plano e devolve o anterior. Sem valor e com a última busca falhando dentro do
+        intervalo mínimo, repete o erro sem ir à fonte."""
+        return self.obter_com_geracao()[0]
+
+    def obter_com_geracao(self):
+        """(valor, geração) como obter(); a geração sobe a cada valor publicado e serve de chave de cache
+        para o que for derivado desse valor (lida junto com ele, sob a mesma trava)."""
+        with self.trava:
+            if not self.tem_valor and self.ultima_tentativa is None and self.inicial is not None:
+                provisorio = self.inicial()
+                if provisorio is not None:
+                    self.valor, self.tem_valor, self.expira_em = provisorio, True, 0.0
+                    self.geracao += 1
+                    self.contagem["iniciais"] += 1
+            agora = time.time()
+            if self.tem_valor:
+                if agora >= self.expira_em and not self.atualizando:
+                    if self._pode_buscar(agora):
+                        self.atualizando, self.ultima_tentativa = True, agora
+                        threading.Thread(target=self._executar, name=f"recarga-{self.nome}", daemon=True).start()
+                    else:
+                        self.contagem["adiadas_pelo_limite"] += 1
+                if self.atualizando:
+                    self.contagem["servidas_anteriores"] += 1
+                return self.valor, self.geracao
+            if self.atualizando:
+                self.contagem["aguardaram"] += 1
+                while self.atualizando:
+                    self.pronto.wait()
+            elif self._pode_buscar(agora):
+                self.atualizando, self.ultima_tentativa = True, agora
+                self.trava.release()
+                try:
+                    self._executar()
+                finally:
+                    self.trava.acquire()
+            if not self.tem_valor:
+                raise RuntimeError(f"Falha ao carregar '{self.nome}': {self.ultimo_erro}")
+            return self.valor, self.geracao
+
+    def expirar(self):
+        """Marca o valor como vencido: a próxima chamada dispara a recarga (respeitando o intervalo mínimo)."""
+        with self.trava:
+            self.expira_em = 0.0
+
+    def metricas(self):
+        """Contagens e tempos da fonte, para exibição."""
+        with self.trava:
+            return {
+                "fonte": self.nome, **self.contagem, "atualizando": self.atualizando,
+                "ultima_busca": self.ultima_busca, "ultima_duracao_s": self.ultima_duracao,
+                "proxima_recarga": self.expira_em if self.tem_valor else None,
+                "ultimo_erro": None if self.ultimo_erro is None else str(self.ultimo_erro),
+            }
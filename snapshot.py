@@ -0,0 +1,153 @@
+# =======================================================================
+# ARQUIVO: snapshot.py (RETRATO EM DISCO DA ÚLTIMA CARGA)
+# =======================================================================
+# Cada carga da planilha é gravada em disco: as abas como vieram do Google
+# Sheets, a base já tipada (df_completo) e a tabela de posições avaliada.
+# Os arquivos são Arrow IPC comprimidos, lidos por mapeamento de memória, e
+# ficam numa pasta cujo nome é o hash do esquema e das regras de avaliação:
+# mudou esquema.py ou avaliacao.py, o retrato antigo deixa de valer sozinho.
+# No início do processo a página abre o retrato enquanto a planilha é baixada
+# em segundo plano. O pyarrow já vem com o Streamlit.
+# Este módulo não depende do Streamlit.
+
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+import avaliacao
+import esquema
+import periodo
+
+FORMATO = 1
+DIRETORIO_PADRAO = os.environ.get("SNAPSHOT_DIR", ".snapshot")
+COMPRESSAO_BRUTOS = "zstd"      # abas originais: só relidas quando o retrato é reconstruído
+COMPRESSAO_TABELAS = "lz4"      # base e posições: lidas em toda partida, descompressão mais rápida
+
+def versao_regras(*modulos, contexto=""):
+    """Hash do formato do retrato, do código-fonte dos módulos que definem esquema e regras e de um
+    contexto livre (ex.: a fonte dos dados, para retratos de fontes diferentes não se misturarem)."""
+    h = hashlib.sha1(f"formato={FORMATO};{contexto}".encode())
+    for modulo in modulos:
+        h.update(inspect.getsource(modulo).encode("utf-8"))
+    return h.hexdigest()[:12]
+
+def versao_regras_da_fonte(descricao):
+    """Versão do retrato da base de uma fonte: esquema das planilhas, regras de avaliação e ordem por data.
+    Usada pelo painel e pelos processos que leem o mesmo retrato (api.py)."""
+    return versao_regras(esquema, avaliacao, periodo, contexto=descricao)
+
+def assinatura_brutos(brutos):
+    """Assinatura do conteúdo das abas ({nome: DataFrame}); igual entre duas cargas = nada mudou na planilha."""
+    h = hashlib.sha1()
+    for nome, df in sorted(brutos.items()):
+        h.update(repr((nome, list(df.columns), len(df))).encode("utf-8"))
+        h.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+# --- GRAVAÇÃO E LEITURA DE TABELAS ---
+
+def _textos_mistos(df):
+    """Cópia de df com as colunas object que misturam texto e números convertidas para texto (vazios seguem NaN)."""
+    df = df.copy()
+    for coluna in df.columns[df.dtypes == object]:
+        valores = df[coluna]
+        preenchidos = valores.dropna()
+        if not preenchidos.map(lambda v: isinstance(v, str)).all():
+            df[coluna] = valores.map(lambda v: v if isinstance(v, str) or pd.isna(v) else str(v))
+    return df
+
+def gravar_tabela(df, caminho, compressao):
+    """Grava df em Arrow IPC. Colunas que misturam texto e números (comum em XLSX) são gravadas como texto."""
+    try:
+        tabela = pa.Table.from_pandas(df, preserve_index=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        tabela = pa.Table.from_pandas(_textos_mistos(df), preserve_index=True)
+    opcoes = pa.ipc.IpcWriteOptions(compression=compressao)
+    with pa.OSFile(str(caminho), "wb") as destino, pa.ipc.new_file(destino, tabela.schema, options=opcoes) as escritor:
+        escritor.write_table(tabela)
+
+def vazios_como_nan(df):
+    """O Arrow devolve os vazios de colunas de texto como None; a planilha lida pelo pandas usa NaN."""
+    colunas = df.columns[df.dtypes == object]
+    if len(colunas) == 0:
+        return df
+    valores = df[colunas].to_numpy(copy=True)
+    vazios = pd.isna(valores)
+    if vazios.any():
+        valores[vazios] = np.nan
+        df[colunas] = valores
+    return df
+
+def ler_tabela(caminho):
+    with pa.memory_map(str(caminho), "r") as origem:
+        return vazios_como_nan(pa.ipc.open_file(origem).read_all().to_pandas())
+
+# --- RETRATO COMPLETO ---
+
+def gravar_snapshot(diretorio, versao, brutos, base, posicoes):
+    """Grava o retrato da carga em <diretorio>/<versao> (troca atômica da pasta) e apaga retratos de outras versões.
+
+    brutos: {nome da aba: DataFrame como lido}. base: df_completo (attrs['versao'] identifica a carga).
+    """
+    raiz = Path(diretorio)
+    raiz.mkdir(parents=True, exist_ok=True)
+    temporaria = Path(tempfile.mkdtemp(prefix=f".{versao}-", dir=raiz))
+    try:
+        for nome, df in brutos.items():
+            gravar_tabela(df, temporaria / f"bruto_{nome}.arrow", COMPRESSAO_BRUTOS)
+        gravar_tabela(base, temporaria / "base.arrow", COMPRESSAO_TABELAS)
+        gravar_tabela(posicoes, temporaria / "posicoes.arrow", COMPRESSAO_TABELAS)
+        meta = {
+            "formato": FORMATO, "versao_regras": versao, "versao_carga": base.attrs.get("versao", ""),
+            "assinatura": assinatura_brutos(brutos), "abas": list(brutos), "gravado_em": time.time(),
+        }
+        (temporaria / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+        destino = raiz / versao
+        antiga = raiz / f".{versao}-antiga"
+        if destino.exists():
+            os.replace(destino, antiga)
+        os.replace(temporaria, destino)
+        shutil.rmtree(antiga, ignore_errors=True)
+    except Exception:
+        shutil.rmtree(temporaria, ignore_errors=True)
+        raise
+    for pasta in raiz.iterdir():
+        if pasta.is_dir() and pasta.name != versao and not pasta.name.startswith("."):
+            shutil.rmtree(pasta, ignore_errors=True)
+    return meta
+
+def ler_meta(diretorio, versao):
+    """Metadados do retrato desta versão de regras (None se não há retrato válido)."""
+    try:
+        meta = json.loads((Path(diretorio) / versao / "meta.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    return meta if meta.get("formato") == FORMATO and meta.get("versao_regras") == versao else None
+
+def ler_snapshot(diretorio, versao, com_brutos=False):
+    """Retrato desta versão de regras: {"meta", "base", "posicoes"[, "brutos"]}, ou None se não existe ou não abre.
+
+    A base volta com attrs['versao'] da carga gravada, então os caches por versão continuam coerentes.
+    """
+    meta = ler_meta(diretorio, versao)
+    if meta is None:
+        return None
+    pasta = Path(diretorio) / versao
+    try:
+        base = ler_tabela(pasta / "base.arrow")
+        base.attrs["versao"] = meta["versao_carga"]
+        retrato = {"meta": meta, "base": base, "posicoes": ler_tabela(pasta / "posicoes.arrow")}
+        if com_brutos:
+            retrato["brutos"] = {nome: ler_tabela(pasta / f"bruto_{nome}.arrow") for nome in meta["abas"]}
+    except (OSError, pa.ArrowException, KeyError):
+        return None
+    return retrato
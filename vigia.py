@@ -0,0 +1,262 @@
+# =======================================================================
+# ARQUIVO: vigia.py (VIGIA SEM INTERFACE: ENSAIOS NOVOS E ALERTAS)
+# =======================================================================
+# Processo de longa duração que consulta a fonte dos dados a cada ciclo
+# (padrão: 60 s) e avalia só as linhas de ensaio que ainda não tinha visto
+# (hash do conteúdo, chaves_ensaios), com as mesmas regras do painel:
+# montar_tabela_posicoes (processar_ensaio) e posicoes_metrologia +
+# avaliar_conformidade (processar_metrologia_isolada). As posições avaliadas
+# são acrescentadas ao depósito local e viram alertas quando há:
+#   - resultado CONTRA O CONSUMIDOR;
+#   - ZONA CRÍTICA da metrologia (dentro do limite, P(conforme) < 95%);
+#   - posição de bancada com N reprovações seguidas (padrão 3).
+# Os alertas vão para um arquivo JSON lines e, se configurado, para um
+# webhook (POST com a lista do ciclo em JSON).
+# Fontes em pasta só são relidas quando avisam mudança; o Google Sheets é
+# baixado a cada ciclo, mas sem conteúdo novo nada é reavaliado.
+# No primeiro ciclo (depósito vazio) o histórico vira a linha de base: as
+# sequências de reprovação são contadas, sem alertas.
+#
+# Depósito (VIGIA_DIR, padrão ".vigia"):
+#   estado.json        assinatura da última leitura e sequências de reprovação
+#   chaves.npy         hashes das linhas já avaliadas
+#   posicoes/*.arrow   posições avaliadas em cada ciclo (ensaio e metrologia)
+#   alertas.jsonl      um alerta por linha
+#
+# Uso: python vigia.py [--intervalo 60] [--diretorio .vigia] [--webhook URL]
+#                      [--repeticoes 3] [--fonte pasta:/caminho] [--uma-vez]
+# Este módulo não depende do Streamlit.
+
+import argparse
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import requests
+
+from avaliacao import montar_tabela_posicoes, chaves_ensaios, STATUS_VAZIO, STATUS_REPROVADOS
+from esquema import montar_base
+from fontes import fonte_producao, fonte_da_configuracao
+from incerteza import referencias_da_fonte, avaliar_metrologia
+from snapshot import assinatura_brutos, gravar_tabela, COMPRESSAO_TABELAS
+
+DIRETORIO_PADRAO = os.environ.get("VIGIA_DIR", ".vigia")
+INTERVALO_PADRAO = 60
+REPETICOES_PADRAO = 3
+
+CONTRA_CONSUMIDOR, ZONA_CRITICA, FALHAS_REPETIDAS = "contra_consumidor", "zona_critica", "falhas_repetidas"
+
+log = logging.getLogger("vigia")
+
+def _gravar_atomico(caminho, escrever):
+    temporario = caminho.with_name(f".{caminho.name}.tmp")
+    escrever(temporario)
+    os.replace(temporario, caminho)
+
+def _texto(valor):
+    return "" if valor is None or (isinstance(valor, float) and np.isnan(valor)) else str(valor)
+
+# --- REGRAS DE ALERTA ---
+
+def alertas_contra_consumidor(posicoes):
+    """Um alerta por posição com status CONTRA O CONSUMIDOR."""
+    return [
+        {"tipo": CONTRA_CONSUMIDOR, "data": _texto(r.Data), "bancada": r.Bancada_Nome, "pos": int(r.pos),
+         "serie": _texto(r.serie), "n_ensaio": _texto(r.N_ENSAIO), "motivo": _texto(r.motivo),
+         "confirmado": bool(r.contra_consumidor_confirmado)}
+        for r in posicoes[posicoes["status"] == "CONTRA O CONSUMIDOR"].itertuples(index=False)
+    ]
+
+def alertas_zona_critica(metrologia):
+    """Um alerta por posição da metrologia na ZONA CRÍTICA (banda de guarda pela incerteza)."""
+    if metrologia.empty:
+        return []
+    return [
+        {"tipo": ZONA_CRITICA, "data": pd.Timestamp(r.Data).strftime("%d/%m/%y"), "bancada": r.Bancada,
+         "pos": int(r.pos), "serie": _texto(r.serie), "n_ensaio": _texto(r.n_ensaio),
+         "p_conformidade": round(float(r.p_conformidade), 4), "detalhe": _texto(r.detalhe)}
+        for r in metrologia[metrologia["status"] == "ZONA CRÍTICA"].itertuples(index=False)
+    ]
+
+def atualizar_sequencias(sequencias, posicoes, repeticoes):
+    """Conta reprovações seguidas por 'Bancada|pos' (posições vazias não contam nem zeram) e devolve os
+    alertas das posições que chegaram a 'repeticoes' com estas linhas. Altera 'sequencias' no lugar."""
+    ensaiadas = posicoes[posicoes["status"] != STATUS_VAZIO].sort_values(["Data_dt", "linha", "pos"], kind="stable")
+    alertas = []
+    for r in ensaiadas.itertuples(index=False):
+        chave = f"{r.Bancada_Nome}|{int(r.pos)}"
+        n = sequencias.get(chave, 0) + 1 if r.status in STATUS_REPROVADOS else 0
+        sequencias[chave] = n
+        if n == repeticoes:
+            alertas.append({
+                "tipo": FALHAS_REPETIDAS, "data": _texto(r.Data), "bancada": r.Bancada_Nome, "pos": int(r.pos),
+                "serie": _texto(r.serie), "n_ensaio": _texto(r.N_ENSAIO), "reprovacoes_seguidas": n,
+                "motivo": _texto(r.motivo),
+            })
+    return alertas
+
+# --- VIGIA ---
+
+class Vigia:
+    """Ciclos de consulta incremental à fonte, com depósito e alertas em disco."""
+
+    def __init__(self, fonte, diretorio=DIRETORIO_PADRAO, repeticoes=REPETICOES_PADRAO, webhook=None):
+        self.fonte = fonte
+        self.diretorio = Path(diretorio)
+        self.repeticoes = repeticoes
+        self.webhook = webhook
+        self.referencias = None
+        self.referencias_em = 0.0
+        self.primeira_consulta = True
+        self.alertas_emitidos_para = None   # assinatura cujos alertas já saíram, mas cujo depósito falhou
+        self.refazer = False                # último ciclo falhou depois de ler a fonte: reler sem esperar aviso
+        self.metricas = {"ciclos": 0, "leituras": 0, "linhas_novas": 0, "alertas": 0, "falhas_webhook": 0}
+        self.diretorio.mkdir(parents=True, exist_ok=True)
+        (self.diretorio / "posicoes").mkdir(exist_ok=True)
+        self._carregar_estado()
+
+    def _carregar_estado(self):
+        try:
+            estado = json.loads((self.diretorio / "estado.json").read_text(encoding="utf-8"))
+            self.chaves = np.load(self.diretorio / "chaves.npy")
+        except (OSError, ValueError):
+            estado, self.chaves = {}, None
+        self.assinatura = estado.get("assinatura")
+        self.sequencias = estado.get("sequencias", {})
+
+    def _gravar_estado(self):
+        def gravar_chaves(caminho):
+            with open(caminho, "wb") as saida:
+                np.save(saida, self.chaves)
+
+        _gravar_atomico(self.diretorio / "chaves.npy", gravar_chaves)
+        estado = {"assinatura": self.assinatura, "sequencias": self.sequencias, "gravado_em": time.time()}
+        _gravar_atomico(self.diretorio / "estado.json",
+                        lambda c: c.write_text(json.dumps(estado, ensure_ascii=False), encoding="utf-8"))
+
+    def _referencias(self):
+        """Tabela mestra relida no máximo uma vez por validade da fonte (só quando há linhas novas)."""
+        if self.referencias is None or time.time() - self.referencias_em >= self.fonte.ttl:
+            self.referencias, self.referencias_em = referencias_da_fonte(self.fonte), time.time()
+        return self.referencias
+
+    def _tem_novidade(self):
+        if self.primeira_consulta or self.refazer or not self.fonte.avisa_mudancas:
+            self.primeira_consulta = False
+            if self.fonte.avisa_mudancas:
+                self.fonte.mudou()   # arma o aviso
+            return True
+        return self.fonte.mudou()
+
+    def ciclo(self):
+        """Uma consulta à fonte. Devolve os alertas emitidos (lista vazia quando nada mudou).
+
+        As sequências são contadas numa cópia e o estado só avança depois do depósito. Se o depósito falhar,
+        os alertas saem assim mesmo e o erro sobe; o próximo ciclo refaz as mesmas linhas a partir do estado
+        anterior, sem contar as reprovações duas vezes nem repetir os alertas do mesmo conteúdo.
+        """
+        self.metricas["ciclos"] += 1
+        if not self._tem_novidade():
+            return []
+        self.refazer = True
+        brutos = self.fonte.abas()
+        self.metricas["leituras"] += 1
+        assinatura = assinatura_brutos(brutos)
+        if assinatura == self.assinatura and self.chaves is not None:
+            self.refazer = False
+            return []
+        base = montar_base(brutos)
+        chaves = chaves_ensaios(base).to_numpy()
+        atuais = np.unique(chaves)
+        if self.chaves is None:
+            sequencias = dict(self.sequencias)
+            atualizar_sequencias(sequencias, montar_tabela_posicoes(base), self.repeticoes)
+            log.info("Linha de base: %d ensaios, %d posições acompanhadas.", len(base), len(sequencias))
+            self.chaves, self.assinatura, self.sequencias = atuais, assinatura, sequencias
+            self._gravar_estado()
+            self.refazer = False
+            return []
+
+        novas = base[~np.isin(chaves, self.chaves)]
+        alertas, sequencias = [], self.sequencias
+        if not novas.empty:
+            posicoes = montar_tabela_posicoes(novas)
+            metrologia = avaliar_metrologia(novas, self._referencias())
+            sequencias = dict(self.sequencias)
+            alertas = (alertas_contra_consumidor(posicoes) + alertas_zona_critica(metrologia)
+                       + atualizar_sequencias(sequencias, posicoes, self.repeticoes))
+            if self.alertas_emitidos_para != assinatura:
+                self._emitir(alertas)
+                self.alertas_emitidos_para = assinatura
+            self._depositar(posicoes, metrologia)
+        self.alertas_emitidos_para = None
+        self.chaves, self.assinatura, self.sequencias = atuais, assinatura, sequencias
+        self._gravar_estado()
+        self.refazer = False
+        self.metricas["linhas_novas"] += len(novas)
+        log.info("%d ensaio(s) novo(s), %d alerta(s).", len(novas), len(alertas))
+        return alertas
+
+    def _depositar(self, posicoes, metrologia):
+        carimbo = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        pasta = self.diretorio / "posicoes"
+        _gravar_atomico(pasta / f"{carimbo}-ensaio.arrow",
+                        lambda c: gravar_tabela(posicoes.reset_index(drop=True), c, COMPRESSAO_TABELAS))
+        if not metrologia.empty:
+            _gravar_atomico(pasta / f"{carimbo}-metrologia.arrow",
+                            lambda c: gravar_tabela(metrologia.reset_index(drop=True), c, COMPRESSAO_TABELAS))
+
+    def _emitir(self, alertas):
+        if not alertas:
+            return
+        emitido_em = datetime.now().isoformat(timespec="seconds")
+        alertas[:] = [{"emitido_em": emitido_em, **a} for a in alertas]
+        with open(self.diretorio / "alertas.jsonl", "a", encoding="utf-8") as saida:
+            for alerta in alertas:
+                saida.write(json.dumps(alerta, ensure_ascii=False) + "\n")
+        self.metricas["alertas"] += len(alertas)
+        if self.webhook:
+            try:
+                requests.post(self.webhook, json=alertas, timeout=10).raise_for_status()
+            except requests.RequestException as e:
+                self.metricas["falhas_webhook"] += 1
+                log.warning("Webhook falhou (%s); os alertas ficaram só no arquivo.", e)
+
+    def rodar(self, intervalo=INTERVALO_PADRAO, ciclos=None):
+        """Repete ciclo() a cada 'intervalo' segundos (para sempre, ou 'ciclos' vezes). Erros de um ciclo
+        (fonte fora do ar, planilha inválida) ficam no log e o próximo ciclo tenta de novo."""
+        feitos = 0
+        while ciclos is None or feitos < ciclos:
+            inicio = time.time()
+            try:
+                self.ciclo()
+            except Exception:
+                log.exception("Falha no ciclo; nova tentativa em %d s.", intervalo)
+            feitos += 1
+            if ciclos is None or feitos < ciclos:
+                time.sleep(max(0.0, intervalo - (time.time() - inicio)))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Vigia de ensaios novos: alertas de contra o consumidor, "
+                                                 "zona crítica e reprovações repetidas.")
+    parser.add_argument("--intervalo", type=float, default=INTERVALO_PADRAO, help="segundos entre consultas")
+    parser.add_argument("--diretorio", default=DIRETORIO_PADRAO, help="depósito local (estado, posições e alertas)")
+    parser.add_argument("--webhook", default=os.environ.get("VIGIA_WEBHOOK"), help="URL que recebe os alertas (POST JSON)")
+    parser.add_argument("--repeticoes", type=int, default=REPETICOES_PADRAO, help="reprovações seguidas para alertar")
+    parser.add_argument("--fonte", default=os.environ.get("FONTE_DADOS", ""), help="como FONTE_DADOS (padrão: sheets)")
+    parser.add_argument("--uma-vez", action="store_true", help="faz um ciclo e sai")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    vigia = Vigia(fonte_da_configuracao(args.fonte, fonte_producao()), args.diretorio, args.repeticoes, args.webhook)
+    try:
+        vigia.rodar(args.intervalo, ciclos=1 if args.uma_vez else None)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()